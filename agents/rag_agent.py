@@ -4,8 +4,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from rag import RAGPipeline
-from qdrant_client_wrapper import QdrantWrapper
-from embeddings import EmbeddingClient
+from model_registry import get_chunk_store, get_embedder, get_embedding_scheduler, get_reranker, get_vector_store, leased
 
 def rag_agent(state):
     """
@@ -21,13 +20,14 @@ def rag_agent(state):
         return {**state, "error": "unauthorized", "rag_result": None}
     
     try:
-        # Initialize RAG components
-        qdrant = QdrantWrapper()
-        embedder = EmbeddingClient()
-        rag_pipeline = RAGPipeline(qdrant, embedder)
-        
-        # Process the query
-        result = rag_pipeline.answer(query)
+        # Lease the process-wide warm RAG components; concurrent queries
+        # share micro-batched embedding through the scheduler
+        with leased(get_vector_store, get_embedder, get_embedding_scheduler, get_chunk_store,
+                    get_reranker) as (qdrant, embedder, scheduler, text_store, reranker):
+            rag_pipeline = RAGPipeline(qdrant, embedder, scheduler, text_store, reranker=reranker)
+            
+            # Process the query
+            result = rag_pipeline.answer(query)
         
         return {**state, "rag_result": result}
         
@@ -1,18 +1,39 @@
-import requests
-from config.settings import LLM_COMPLETION_PATH
+import logging
+import re
+
+from config.settings import SUPERVISOR_DEFAULT_ROUTE, SUPERVISOR_MAX_TOKENS
+from llm_client import call_llm
+
+# reasoning models (qwen3) may open with <think>...</think>, possibly cut off by max_tokens
+_THINK_RE = re.compile(r"<think>.*?(</think>|$)", re.DOTALL | re.IGNORECASE)
+_TASK_RE = re.compile(r"\b(rag|db)\b", re.IGNORECASE)
+
+
+def parse_task(response):
+    """'rag' or 'db' from the router's reply, or None if it names neither (or both)."""
+    tasks = {t.lower() for t in _TASK_RE.findall(_THINK_RE.sub(" ", response))}
+    return tasks.pop() if len(tasks) == 1 else None
+
 
 def supervisor_agent(state):
     user_query = state["query"]
+    # /no_think: Qwen3's switch to skip the reasoning block, which would use up the reply budget
     prompt = f"""
     Decide if the following query is a RAG search or a Postgres DB query.
     Respond only with 'rag' or 'db'.
     Query: {user_query}
+    /no_think
     """
-    response = requests.post(LLM_COMPLETION_PATH, json={
-        "prompt": prompt,
-        "max_tokens": 10,
-        "temperature": 0
-    }).json()
+    # shared pooled LLM client (llm_client.py), same connections as the RAG path
+    response = call_llm(prompt, max_tokens=SUPERVISOR_MAX_TOKENS, temperature=0)
 
-    task = response["choices"][0]["text"].strip().lower()
+    if response.startswith("[LLM call error]"):
+        return {**state, "task": "error", "error": f"supervisor_error: {response}"}
+    task = parse_task(response)
+    if task is None:
+        if SUPERVISOR_DEFAULT_ROUTE not in ("rag", "db"):
+            return {**state, "task": "error", "error": f"supervisor_error: unrecognized route {response.strip()!r}"}
+        logging.warning(f"Supervisor reply names no route ({response.strip()!r}); "
+                        f"using {SUPERVISOR_DEFAULT_ROUTE!r}")
+        task = SUPERVISOR_DEFAULT_ROUTE
     return {**state, "task": task}
@@ -5,6 +5,24 @@ import os
 QDRANT_URL = os.environ.get("QDRANT_URL", "http://localhost:6333")
 QDRANT_API_KEY = os.environ.get("QDRANT_API_KEY", "docker")
 QDRANT_COLLECTION = os.environ.get("QDRANT_COLLECTION", "multimodal_documents")
+QDRANT_PREFER_GRPC = os.environ.get("QDRANT_PREFER_GRPC", "false").lower() in ("1", "true", "yes")
+QDRANT_GRPC_PORT = int(os.environ.get("QDRANT_GRPC_PORT", "6334"))
+QDRANT_TIMEOUT = int(os.environ.get("QDRANT_TIMEOUT", "30"))       # seconds, connect + read
+QDRANT_POOL_SIZE = int(os.environ.get("QDRANT_POOL_SIZE", "20"))   # HTTP keep-alive connections
+# Collection profile, applied when a collection is created (QdrantWrapper.tune_collection() applies it to an existing one)
+QDRANT_HNSW_M = int(os.environ.get("QDRANT_HNSW_M", "16"))                      # HNSW graph links per node
+QDRANT_HNSW_EF_CONSTRUCT = int(os.environ.get("QDRANT_HNSW_EF_CONSTRUCT", "100"))  # HNSW build-time candidate list
+QDRANT_SEARCH_EF = int(os.environ.get("QDRANT_SEARCH_EF", "0"))                  # search-time candidate list (0 = server default)
+QDRANT_ON_DISK = os.environ.get("QDRANT_ON_DISK", "false").lower() in ("1", "true", "yes")  # keep original vectors on disk (mmap)
+QDRANT_ON_DISK_PAYLOAD = os.environ.get("QDRANT_ON_DISK_PAYLOAD", "false").lower() in ("1", "true", "yes")
+QDRANT_QUANTIZATION = os.environ.get("QDRANT_QUANTIZATION", "none")             # none | int8 | binary (quantized vectors stay in RAM)
+QDRANT_RESCORE = os.environ.get("QDRANT_RESCORE", "true").lower() in ("1", "true", "yes")  # re-rank quantized hits with original vectors
+QDRANT_OVERSAMPLING = float(os.environ.get("QDRANT_OVERSAMPLING", "2.0"))        # quantized candidates fetched per requested hit when rescoring
+QDRANT_PAYLOAD_INDEXES = [f.strip() for f in os.environ.get("QDRANT_PAYLOAD_INDEXES", "source,abs_path").split(",") if f.strip()]  # keyword-indexed payload fields
+VECTOR_STORE = os.environ.get("VECTOR_STORE", "qdrant")  # qdrant | local (in-process NumPy index)
+LOCAL_STORE_DIR = os.environ.get("LOCAL_STORE_DIR", os.path.expanduser("~/.cache/agentic_rag/vectors"))
+UPSERT_BATCH_SIZE = int(os.environ.get("UPSERT_BATCH_SIZE", "256"))  # points per bulk upsert request
+UPSERT_PARALLEL = int(os.environ.get("UPSERT_PARALLEL", "4"))        # concurrent bulk upsert requests
 
 # LLM Configuration
 LLM_BASE = os.environ.get("LLM_BASE", "http://localhost:12434/engines")
@@ -12,14 +30,84 @@ LLM_ENGINE = os.environ.get("LLM_ENGINE", "v1")
 LLM_COMPLETION_PATH = f"{LLM_BASE}/{LLM_ENGINE}"
 LLM_API_KEY = os.environ.get("LLM_API_KEY", "docker")
 LLM_MODEL = os.environ.get("LLM_MODEL", "ai/qwen3:8B-Q4_K_M")
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "4"))  # parallel LLM calls in batch answering
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "16"))            # keep-alive connections to the model server
+LLM_CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))   # seconds
+LLM_READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "120"))       # seconds between response bytes (generation can be slow)
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))
+SUPERVISOR_MAX_TOKENS = int(os.environ.get("SUPERVISOR_MAX_TOKENS", "64"))  # routing reply budget; room for an empty <think></think> block
+SUPERVISOR_DEFAULT_ROUTE = os.environ.get("SUPERVISOR_DEFAULT_ROUTE", "rag")  # route when the reply names neither rag nor db (rag | db | error)
+LLM_TOKENIZER = os.environ.get("LLM_TOKENIZER", "")  # Hugging Face tokenizer of the LLM, e.g. Qwen/Qwen3-8B ("" = estimate ~4 chars/token)
 
 # Embedding Configuration
 EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")  # torch | onnx | onnx-int8
+EMBEDDING_ONNX_DIR = os.environ.get("EMBEDDING_ONNX_DIR", os.path.expanduser("~/.cache/agentic_rag/onnx"))  # exported/quantized models
+EMBEDDING_ONNX_QUANT_CONFIG = os.environ.get("EMBEDDING_ONNX_QUANT_CONFIG", "avx2")  # arm64 | avx2 | avx512 | avx512_vnni
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR", os.path.expanduser("~/.cache/agentic_rag/embeddings"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "1000000"))  # on-disk rows per model
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000"))  # in-memory LRU size
+EMBED_BATCH_MAX_SIZE = int(os.environ.get("EMBED_BATCH_MAX_SIZE", "32"))        # query micro-batch size
+EMBED_BATCH_MAX_WAIT_MS = float(os.environ.get("EMBED_BATCH_MAX_WAIT_MS", "5"))  # max wait to fill a micro-batch
+INGEST_EMBED_WORKERS = os.environ.get("INGEST_EMBED_WORKERS", "0")                # worker processes for ingestion embedding: 0 = in-process, "auto" = size to cores/memory
+INGEST_EMBED_BATCH_SIZE = int(os.environ.get("INGEST_EMBED_BATCH_SIZE", "64"))   # texts per worker batch
+INGEST_PARSE_WORKERS = int(os.environ.get("INGEST_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))  # parser processes (0 = in-process thread)
+INGEST_QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "64"))              # bounded queue length between pipeline stages
+INGEST_CHECKPOINT_FILES = int(os.environ.get("INGEST_CHECKPOINT_FILES", "50"))  # files per upsert checkpoint / manifest save
+INGEST_DISCOVERY_WORKERS = int(os.environ.get("INGEST_DISCOVERY_WORKERS", "8"))  # threads listing directories during folder discovery
+INGEST_MAX_FILE_MB = float(os.environ.get("INGEST_MAX_FILE_MB", "0"))          # skip files larger than this during folder ingestion (0 = no limit)
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", "32"))         # PDF pages per parse task; larger PDFs are split across parse workers
+TABULAR_ROWS_PER_CHUNK = int(os.environ.get("TABULAR_ROWS_PER_CHUNK", "20"))  # CSV/Excel rows per chunk (header repeated in each)
+TABULAR_READ_ROWS = int(os.environ.get("TABULAR_READ_ROWS", "50000"))        # CSV/Excel rows read per block while streaming
+TABULAR_COLUMNS = os.environ.get("TABULAR_COLUMNS", "")                      # comma-separated CSV/Excel columns to ingest (empty = all)
+OCR_WORKERS = int(os.environ.get("OCR_WORKERS", str(min(4, os.cpu_count() or 1))))  # Tesseract processes for in-process OCR
+OCR_LANG = os.environ.get("OCR_LANG", "")                                     # Tesseract language(s), e.g. "eng+deu" (empty = tesseract default)
+OCR_GRAYSCALE = os.environ.get("OCR_GRAYSCALE", "true").lower() in ("1", "true", "yes")
+OCR_BINARIZE = os.environ.get("OCR_BINARIZE", "false").lower() in ("1", "true", "yes")  # Otsu threshold before OCR
+OCR_TARGET_DPI = int(os.environ.get("OCR_TARGET_DPI", "300"))                # resample images that record their DPI (0 = keep)
+OCR_MAX_SIDE = int(os.environ.get("OCR_MAX_SIDE", "4000"))                   # downscale so the longest side fits (0 = no cap)
+OCR_PAGES_PER_TASK = int(os.environ.get("OCR_PAGES_PER_TASK", "4"))          # multi-page TIFF pages per parse task
+OCR_CACHE_ENABLED = os.environ.get("OCR_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+OCR_CACHE_DIR = os.environ.get("OCR_CACHE_DIR", os.path.expanduser("~/.cache/agentic_rag/ocr"))
+INGEST_EMBED_WORKER_MEMORY_MB = int(os.environ.get("INGEST_EMBED_WORKER_MEMORY_MB", "600"))  # RAM budget per worker model copy
 
 # Text Processing Configuration
 CHUNK_SIZE = int(os.environ.get("CHUNK_SIZE", "512"))    # characters per chunk
 CHUNK_OVERLAP = int(os.environ.get("CHUNK_OVERLAP", "50"))  # characters overlap
+CHUNKER = os.environ.get("CHUNKER", "tokens")              # tokens = size chunks with the embedding tokenizer; chars = CHUNK_SIZE characters
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "0"))        # token chunk size incl. special tokens (0 = model max_seq_length)
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "32"))  # tokens of trailing sentences repeated in the next chunk
+TOKEN_COUNT_CACHE_SIZE = int(os.environ.get("TOKEN_COUNT_CACHE_SIZE", "100000"))  # cached per-sentence token counts
+INGEST_MANIFEST_PATH = os.environ.get("INGEST_MANIFEST_PATH", os.path.expanduser("~/.cache/agentic_rag/ingest_manifest.json"))
+DEDUP_MODE = os.environ.get("DEDUP_MODE", "alias")              # duplicate chunks at ingestion: off | skip | alias (skip + list them on the canonical point)
+DEDUP_THRESHOLD = float(os.environ.get("DEDUP_THRESHOLD", "0.9"))  # MinHash Jaccard estimate at which chunks count as near duplicates
+DEDUP_NUM_PERM = int(os.environ.get("DEDUP_NUM_PERM", "64"))       # MinHash permutations
+DEDUP_BANDS = int(os.environ.get("DEDUP_BANDS", "16"))             # LSH bands (must divide DEDUP_NUM_PERM)
+DEDUP_SHINGLE = int(os.environ.get("DEDUP_SHINGLE", "5"))          # words per shingle
+DEDUP_MAX_ALIASES = int(os.environ.get("DEDUP_MAX_ALIASES", "50")) # aliases kept on a canonical point's payload
+DEDUP_DIR = os.environ.get("DEDUP_DIR", os.path.expanduser("~/.cache/agentic_rag/dedup"))
+CHUNK_STORE_DIR = os.environ.get("CHUNK_STORE_DIR", os.path.expanduser("~/.cache/agentic_rag/chunks"))  # chunk text when store_text_in_payload=False
+CHUNK_STORE_COMPRESSION = os.environ.get("CHUNK_STORE_COMPRESSION", "none")  # none | zstd (needs the zstandard package)
+CHUNK_STORE_SEGMENT_MB = float(os.environ.get("CHUNK_STORE_SEGMENT_MB", "256"))  # size at which a new segment file starts
 TOP_K = int(os.environ.get("TOP_K", "5"))                   # retrieval top k
+RAG_SEARCH_BATCH_SIZE = int(os.environ.get("RAG_SEARCH_BATCH_SIZE", "64"))  # queries per search_batch request in answer_many
+SPARSE_INDEX = os.environ.get("SPARSE_INDEX", "true").lower() in ("1", "true", "yes")  # BM25 sparse vectors alongside dense ones (new collections)
+SPARSE_BM25_K1 = float(os.environ.get("SPARSE_BM25_K1", "1.2"))       # BM25 term-frequency saturation
+SPARSE_BM25_B = float(os.environ.get("SPARSE_BM25_B", "0.75"))        # BM25 length normalization
+SPARSE_AVG_DOC_LEN = float(os.environ.get("SPARSE_AVG_DOC_LEN", "200"))  # typical chunk length in terms, for length normalization
+RAG_HYBRID = os.environ.get("RAG_HYBRID", "true").lower() in ("1", "true", "yes")  # fuse dense + BM25 results at query time
+HYBRID_PREFETCH_FACTOR = int(os.environ.get("HYBRID_PREFETCH_FACTOR", "4"))  # candidates per retriever = top_k * factor
+HYBRID_RRF_K = int(os.environ.get("HYBRID_RRF_K", "60"))               # reciprocal rank fusion constant (local store)
+RERANK_ENABLED = os.environ.get("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")  # cross-encoder rerank of retrieved chunks
+RERANK_MODEL = os.environ.get("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_MAX_LENGTH = int(os.environ.get("RERANK_MAX_LENGTH", "256"))      # tokens per (query, chunk) pair; longer chunks are truncated for scoring
+RERANK_OVERFETCH = int(os.environ.get("RERANK_OVERFETCH", "4"))          # candidates retrieved = TOP_K * factor
+RERANK_DEADLINE_MS = float(os.environ.get("RERANK_DEADLINE_MS", "250"))  # after this, fall back to vector order
+RERANK_MAX_DEADLINE_MS = float(os.environ.get("RERANK_MAX_DEADLINE_MS", "2000"))  # cap on the deadline of a batched rerank (answer_many)
+RERANK_BATCH_SIZE = int(os.environ.get("RERANK_BATCH_SIZE", "32"))      # (query, chunk) pairs per cross-encoder forward pass
+RERANK_TOKEN_BUDGET = int(os.environ.get("RERANK_TOKEN_BUDGET", "1500")) # context tokens kept after reranking (0 = only TOP_K limits)
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "2000"))  # prompt context tokens after merging overlapping chunks (0 = no limit)
 
 # JWT Authentication Configuration
 JWT_SECRET = os.environ.get("RAG_JWT_SECRET", "replace-this-with-secure-secret")
@@ -0,0 +1,164 @@
+# context_packer.py
+"""
+Assembles retrieved chunks into prompt context under a token budget.
+
+Chunkers repeat the tail of each chunk at the head of the next (character
+overlap, or trailing sentences for the token chunker), so adjacent hits from
+one file would repeat text in the prompt. ContextPacker.pack():
+
+  1. drops hits whose text is identical (after whitespace normalization) to
+     a better-ranked hit
+  2. groups hits by file and merges runs of consecutive chunk_index into one
+     passage, cutting the overlap each chunk shares with the one before it
+  3. picks passages by relevance per token (hit ranks, so a passage made of
+     several hits counts for each) until CONTEXT_TOKEN_BUDGET is spent, and
+     returns them most relevant first
+
+Tokens are counted with the LLM's tokenizer when LLM_TOKENIZER names one
+(Hugging Face transformers), else estimated at ~4 characters per token.
+"""
+import functools
+import logging
+import re
+
+from config.settings import CONTEXT_TOKEN_BUDGET, LLM_TOKENIZER
+
+logger = logging.getLogger(__name__)
+
+_MIN_OVERLAP = 16            # shorter shared prefixes are coincidence, not chunk overlap
+_PASSAGE_OVERHEAD = 12       # "Source: ... (chunk:n)" header and separator
+_WS_RE = re.compile(r"\s+")
+
+MISSING_TEXT = "[text not stored in payload]"   # stands in for a hit whose text could not be resolved
+
+
+def estimate_tokens(text):
+    """Cheap LLM token estimate (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+@functools.lru_cache(maxsize=None)
+def token_counter(tokenizer=LLM_TOKENIZER):
+    """text -> token count, from the named Hugging Face tokenizer, or estimate_tokens if none/unavailable."""
+    if not tokenizer:
+        return estimate_tokens
+    try:
+        from transformers import AutoTokenizer
+        tok = AutoTokenizer.from_pretrained(tokenizer)
+    except Exception as e:
+        logger.warning(f"[context] cannot load tokenizer {tokenizer!r} ({e}); estimating tokens")
+        return estimate_tokens
+    return lambda text: len(tok(text, add_special_tokens=False)["input_ids"])
+
+
+def strip_overlap(prev, text):
+    """text without the prefix it shares with the end of prev (the chunker's overlap)."""
+    probe = text[:_MIN_OVERLAP]
+    if len(probe) < _MIN_OVERLAP:
+        return text
+    start = max(0, len(prev) - len(text))
+    while True:
+        # the leftmost match is the longest suffix of prev that text starts with
+        p = prev.find(probe, start)
+        if p < 0:
+            return text
+        if text.startswith(prev[p:]):
+            return text[len(prev) - p:].lstrip()
+        start = p + 1
+
+
+class ContextPacker:
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, tokenizer=LLM_TOKENIZER):
+        """token_budget: context tokens for all passages together (0 = no limit)."""
+        self.token_budget = int(token_budget)
+        self.count_tokens = token_counter(tokenizer)
+
+    def pack(self, hits, token_budget=None):
+        """
+        Hits in relevance order -> passages: hit-like dicts whose payload
+        "text" is the merged text of a run of chunks ("chunk_end" is set when a
+        run spans several chunks; "ids" lists the merged points).
+        """
+        budget = self.token_budget if token_budget is None else int(token_budget)
+
+        seen, ranked, groups = set(), [], {}
+        for rank, h in enumerate(hits):
+            payload = h.get("payload") or {}
+            text = payload.get("text")
+            if text is None:
+                # still retrieved: keep it visible as its own passage rather than drop it
+                groups[("missing", rank)] = [(rank, {**h, "payload": {**payload, "text": MISSING_TEXT}})]
+                continue
+            key = _WS_RE.sub(" ", text).strip()
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            ranked.append((rank, h))
+
+        for rank, h in ranked:
+            payload = h["payload"]
+            groups.setdefault(payload.get("abs_path") or payload.get("source"), []).append((rank, h))
+
+        passages = []
+        for members in groups.values():
+            members.sort(key=lambda m: m[1]["payload"].get("chunk_index", -1))
+            run = [members[0]]
+            for m in members[1:]:
+                prev_index = run[-1][1]["payload"].get("chunk_index")
+                index = m[1]["payload"].get("chunk_index")
+                if prev_index is not None and index == prev_index + 1:
+                    run.append(m)
+                else:
+                    passages.append(self._merge(run))
+                    run = [m]
+            passages.append(self._merge(run))
+
+        if budget <= 0:
+            passages.sort(key=lambda p: p["rank"])
+            return [p["hit"] for p in passages]
+
+        # greedy knapsack by relevance per token, then most relevant first
+        passages.sort(key=lambda p: p["relevance"] / p["tokens"], reverse=True)
+        chosen, used = [], 0
+        for p in passages:
+            if used + p["tokens"] <= budget:
+                chosen.append(p)
+                used += p["tokens"]
+        if not chosen and passages:
+            best = min(passages, key=lambda p: p["rank"])
+            chosen = [self._truncate(best, budget)]
+        chosen.sort(key=lambda p: p["rank"])
+        return [p["hit"] for p in chosen]
+
+    def _merge(self, run):
+        first = run[0][1]
+        payload = dict(first["payload"])
+        text = payload["text"]
+        for _, h in run[1:]:
+            text = text.rstrip() + " " + strip_overlap(text, h["payload"]["text"])
+        payload["text"] = text
+        if len(run) > 1:
+            last = run[-1][1]["payload"]
+            payload["chunk_end"] = last.get("chunk_index")
+            if "page" in last:
+                payload["page_end"] = last.get("page_end", last["page"])
+            if "rows" in payload and "rows" in last:
+                payload["rows"] = [payload["rows"][0], last["rows"][1]]
+            aliases = [a for _, h in run for a in h["payload"].get("aliases") or []]
+            if aliases:
+                payload["aliases"] = aliases
+        hit = {**first, "payload": payload, "ids": [h["id"] for _, h in run]}
+        return {
+            "hit": hit,
+            "rank": min(rank for rank, _ in run),
+            "relevance": sum(1.0 / (rank + 1) for rank, _ in run),
+            "tokens": self.count_tokens(text) + _PASSAGE_OVERHEAD,
+        }
+
+    def _truncate(self, passage, budget):
+        """The passage cut to roughly fit the budget on its own."""
+        text = passage["hit"]["payload"]["text"]
+        keep = max(0, budget - _PASSAGE_OVERHEAD)
+        cut = text[:int(len(text) * keep / passage["tokens"])]
+        hit = {**passage["hit"], "payload": {**passage["hit"]["payload"], "text": cut}}
+        return {**passage, "hit": hit, "tokens": budget}
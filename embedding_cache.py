@@ -0,0 +1,265 @@
+# embedding_cache.py
+"""
+Content-addressed embedding cache.
+
+Vectors are keyed by a 16-byte blake2b digest of (model name, normalized
+text). Two tiers:
+  - an in-memory LRU of recently used vectors
+  - an on-disk store per model: a memory-mapped float32 matrix
+    (vectors.f32), the matching digest of every row (keys.u8) and a
+    last-use tick per row (ticks.u64) used for size-bounded eviction.
+
+The on-disk files grow by doubling up to `max_entries` rows; once full, the
+least recently used rows are overwritten. meta.json (capacity, row count,
+tick) is rewritten atomically after every put_many() that adds rows; if it
+is missing (a crash before the first checkpoint), it is rebuilt from the
+data files instead of starting over.
+
+One process owns a cache directory at a time, through an exclusive lock on
+its `lock` file; other processes (a second app, the CLI) fall back to the
+in-memory tier only rather than hand out the same rows.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: the directory lock is skipped there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_WS_RE = re.compile(r"\s+")
+_KEY_BYTES = 16
+_INITIAL_CAPACITY = 4096
+
+
+def normalize_text(text):
+    return _WS_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def text_key(model_name, text):
+    h = hashlib.blake2b(digest_size=_KEY_BYTES)
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(normalize_text(text).encode("utf-8"))
+    return h.digest()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir, model_name, dim, max_entries=1_000_000, memory_entries=10_000):
+        self.model_name = model_name
+        self.dim = int(dim)
+        self.max_entries = int(max_entries)
+        self.memory_entries = int(memory_entries)
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.dir = os.path.join(cache_dir, f"{safe_name}-{self.dim}")
+        os.makedirs(self.dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()   # key -> np.ndarray
+        self._index = {}               # key -> row
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        self.capacity = self.count = self.tick = 0
+        self._lock_file = self._lock_dir()
+        if self._lock_file is not None:
+            self._open()
+        else:
+            logger.warning(f"[embedding cache] {self.dir} is in use by another process; "
+                           f"using the in-memory cache only")
+
+    # ---- on-disk storage ----
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _lock_dir(self):
+        """The open lock file once this process holds the directory, else None."""
+        f = open(self._path("lock"), "a")
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return None
+        return f
+
+    def _open(self):
+        meta_path = self._path("meta.json")
+        meta = {}
+        if os.path.exists(meta_path):
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            except ValueError:
+                meta = {}
+        if not meta and os.path.exists(self._path("keys.u8")):
+            meta = self._recover_meta()
+        if meta.get("dim", self.dim) != self.dim:
+            meta = {}
+        self.capacity = int(meta.get("capacity", min(_INITIAL_CAPACITY, self.max_entries)))
+        self.count = int(meta.get("count", 0))
+        self.tick = int(meta.get("tick", 0))
+        self._map(create=not meta)
+        for row in range(self.count):
+            self._index[self._keys[row].tobytes()] = row
+
+    def _recover_meta(self):
+        """Rebuild meta from the data files: rows are filled in order, unused keys are zero."""
+        sizes = {}
+        for name, row_bytes in (("vectors.f32", self.dim * 4), ("keys.u8", _KEY_BYTES), ("ticks.u64", 8)):
+            if not os.path.exists(self._path(name)):
+                return {}
+            sizes[name] = os.path.getsize(self._path(name)) // row_bytes
+        capacity = min(sizes.values())   # a crash inside _grow can leave the files different sizes
+        if capacity == 0:
+            return {}
+        keys = np.memmap(self._path("keys.u8"), dtype=np.uint8, mode="r", shape=(capacity, _KEY_BYTES))
+        used = np.flatnonzero(keys.any(axis=1))
+        count = int(used[-1]) + 1 if used.size else 0
+        ticks = np.memmap(self._path("ticks.u64"), dtype=np.uint64, mode="r", shape=(capacity,))
+        tick = int(ticks[:count].max()) if count else 0
+        del keys, ticks
+        logger.warning(f"[embedding cache] {self.dir}: meta.json missing, recovered {count} rows")
+        return {"dim": self.dim, "capacity": capacity, "count": count, "tick": tick}
+
+    def _map(self, create=False):
+        mode = "w+" if create else "r+"
+        self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode=mode,
+                                  shape=(self.capacity, self.dim))
+        self._keys = np.memmap(self._path("keys.u8"), dtype=np.uint8, mode=mode,
+                               shape=(self.capacity, _KEY_BYTES))
+        self._ticks = np.memmap(self._path("ticks.u64"), dtype=np.uint64, mode=mode,
+                                shape=(self.capacity,))
+
+    def _grow(self, needed):
+        new_capacity = self.capacity
+        while new_capacity < needed and new_capacity < self.max_entries:
+            new_capacity = min(new_capacity * 2, self.max_entries)
+        if new_capacity == self.capacity:
+            return
+        self.flush_locked()
+        del self._vectors, self._keys, self._ticks
+        for name, row_bytes in (("vectors.f32", self.dim * 4), ("keys.u8", _KEY_BYTES), ("ticks.u64", 8)):
+            with open(self._path(name), "r+b") as f:
+                f.truncate(new_capacity * row_bytes)
+        self.capacity = new_capacity
+        self._map()
+
+    def _allocate_rows(self, n):
+        """Return n rows to write into, growing the files or evicting LRU rows."""
+        self._grow(self.count + n)
+        used = self.count
+        free = min(n, self.capacity - used)
+        rows = list(range(used, used + free))
+        self.count += free
+        remaining = min(n - free, used)
+        if remaining:
+            victims = np.argpartition(self._ticks[:used], remaining - 1)[:remaining]
+            for row in victims.tolist():
+                self._index.pop(self._keys[row].tobytes(), None)
+                rows.append(row)
+            self.evictions += remaining
+        return rows
+
+    # ---- public API ----
+    def key(self, text):
+        return text_key(self.model_name, text)
+
+    def get_many(self, keys):
+        """Return a list aligned with `keys`: a float32 vector or None for a miss."""
+        out = [None] * len(keys)
+        with self._lock:
+            self.tick += 1
+            for pos, k in enumerate(keys):
+                vec = self._memory.get(k)
+                if vec is not None:
+                    self._memory.move_to_end(k)
+                    row = self._index.get(k)
+                    if row is not None:
+                        self._ticks[row] = self.tick
+                    self.hits_memory += 1
+                    out[pos] = vec
+                    continue
+                row = self._index.get(k)
+                if row is None:
+                    self.misses += 1
+                    continue
+                vec = np.array(self._vectors[row])
+                self._ticks[row] = self.tick
+                self._remember(k, vec)
+                self.hits_disk += 1
+                out[pos] = vec
+        return out
+
+    def put_many(self, keys, vectors):
+        """Store vectors (sequence or 2-D array, one row per key)."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            self.tick += 1
+            new = {}
+            for k, vec in zip(keys, vectors):
+                if k not in self._index:
+                    new[k] = vec
+                self._remember(k, vec.copy())
+            if not new or self.max_entries <= 0 or self._lock_file is None:
+                return
+            items = list(new.items())[-self.max_entries:]
+            rows = self._allocate_rows(len(items))
+            for row, (k, vec) in zip(rows, items):
+                self._vectors[row] = vec
+                self._keys[row] = np.frombuffer(k, dtype=np.uint8)
+                self._ticks[row] = self.tick
+                self._index[k] = row
+            self._save_meta()   # checkpoint: rows written so far survive a crash
+
+    def _remember(self, k, vec):
+        if self.memory_entries <= 0:
+            return
+        self._memory[k] = vec
+        self._memory.move_to_end(k)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _save_meta(self):
+        tmp = self._path("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"model_name": self.model_name, "dim": self.dim, "capacity": self.capacity,
+                       "count": self.count, "tick": self.tick}, f)
+        os.replace(tmp, self._path("meta.json"))
+
+    def flush_locked(self):
+        if self._lock_file is None:
+            return
+        self._vectors.flush()
+        self._keys.flush()
+        self._ticks.flush()
+        self._save_meta()
+
+    def flush(self):
+        with self._lock:
+            self.flush_locked()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits_memory + self.hits_disk + self.misses
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "memory_entries": len(self._memory),
+                "capacity": self.capacity,
+            }
@@ -0,0 +1,142 @@
+# embedding_scheduler.py
+"""
+Dynamic micro-batching for query embeddings.
+
+Concurrent callers submit single texts; a dedicated worker thread collects
+them into batches of up to `max_batch_size`, waiting at most `max_wait_ms`
+after the first request of a batch, runs one embed_array() call per batch
+and resolves each caller's future.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from config.settings import EMBED_BATCH_MAX_SIZE, EMBED_BATCH_MAX_WAIT_MS
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class EmbeddingScheduler:
+    def __init__(self, embedder, max_batch_size=EMBED_BATCH_MAX_SIZE,
+                 max_wait_ms=EMBED_BATCH_MAX_WAIT_MS, delay_samples=10_000):
+        self.embedder = embedder
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._submit_lock = threading.Lock()
+
+        self._metrics_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._delays = deque(maxlen=delay_samples)  # seconds spent queued per request
+        self._encode_time = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="embedding-scheduler", daemon=True)
+        self._thread.start()
+
+    # ---- caller API ----
+    def submit(self, text):
+        """Queue one text; returns a concurrent.futures.Future of its float32 vector."""
+        fut = Future()
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("EmbeddingScheduler is closed")
+            self._queue.put((text, fut, time.perf_counter()))
+        return fut
+
+    def embed(self, text, timeout=None):
+        return self.submit(text).result(timeout=timeout)
+
+    async def aembed(self, text):
+        return await asyncio.wrap_future(self.submit(text))
+
+    def embed_many(self, texts, timeout=None):
+        futures = [self.submit(t) for t in texts]
+        return np.stack([f.result(timeout=timeout) for f in futures]) if futures else \
+            np.empty((0, self.embedder.dimension), dtype=np.float32)
+
+    # ---- worker ----
+    def _collect(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return None
+        batch = [item]
+        deadline = item[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            batch = [b for b in batch if b[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                vectors = self.embedder.embed_array([text for text, _, _ in batch])
+            except Exception as e:
+                logger.error(f"[embed-scheduler] batch of {len(batch)} failed: {e}")
+                for _, fut, _ in batch:
+                    fut.set_exception(e)
+                continue
+            finished = time.perf_counter()
+            for (_, fut, _), vec in zip(batch, vectors):
+                fut.set_result(vec)
+            with self._metrics_lock:
+                self._batch_sizes[len(batch)] += 1
+                self._delays.extend(started - enqueued for _, _, enqueued in batch)
+                self._encode_time += finished - started
+
+    # ---- metrics / lifecycle ----
+    def metrics(self):
+        with self._metrics_lock:
+            sizes = dict(sorted(self._batch_sizes.items()))
+            delays = np.array(self._delays, dtype=np.float64) * 1000.0
+            encode_time = self._encode_time
+        batches = sum(sizes.values())
+        requests = sum(size * n for size, n in sizes.items())
+        out = {
+            "batches": batches,
+            "requests": requests,
+            "mean_batch_size": requests / batches if batches else 0.0,
+            "batch_size_histogram": sizes,
+            "encode_seconds": encode_time,
+            "queue_depth": self._queue.qsize(),
+        }
+        if delays.size:
+            out["queue_delay_ms"] = {
+                "mean": float(delays.mean()),
+                "p50": float(np.percentile(delays, 50)),
+                "p95": float(np.percentile(delays, 95)),
+                "p99": float(np.percentile(delays, 99)),
+                "max": float(delays.max()),
+            }
+        return out
+
+    def close(self, timeout=None):
+        """Stop accepting work, drain queued requests and join the worker."""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
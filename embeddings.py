@@ -1,19 +1,174 @@
 # embeddings.py
+import atexit
+import os
+import re
+import time
 from sentence_transformers import SentenceTransformer
 import numpy as np
+from config.settings import (
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    EMBEDDING_ONNX_DIR,
+    EMBEDDING_ONNX_QUANT_CONFIG,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_MEMORY_ENTRIES,
+)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+def load_model(model_name, backend=EMBEDDING_BACKEND):
+    """
+    Load a SentenceTransformer on the requested backend:
+      torch     - full-precision PyTorch (default)
+      onnx      - ONNX Runtime (exported on first use by sentence-transformers)
+      onnx-int8 - ONNX Runtime with dynamic int8 quantization; the quantized
+                  model is exported once under EMBEDDING_ONNX_DIR and reused
+    """
+    if backend == "torch":
+        return SentenceTransformer(model_name)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx")
+    if backend == "onnx-int8":
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        export_dir = os.path.join(EMBEDDING_ONNX_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        file_name = f"onnx/model_qint8_{EMBEDDING_ONNX_QUANT_CONFIG}.onnx"
+        if not os.path.exists(os.path.join(export_dir, file_name)):
+            model = SentenceTransformer(model_name, backend="onnx")
+            model.save(export_dir)
+            export_dynamic_quantized_onnx_model(model, EMBEDDING_ONNX_QUANT_CONFIG, export_dir)
+        return SentenceTransformer(export_dir, backend="onnx", model_kwargs={"file_name": file_name})
+    raise ValueError(f"Unknown embedding backend: {backend} (expected one of {', '.join(BACKENDS)})")
 
 class EmbeddingClient:
-    def __init__(self, model_name="all-MiniLM-L6-v2"):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name=EMBEDDING_MODEL, cache=None, use_cache=EMBEDDING_CACHE_ENABLED,
+                 backend=EMBEDDING_BACKEND):
+        """
+        cache: optional EmbeddingCache; by default one is opened under
+        EMBEDDING_CACHE_DIR when use_cache is true.
+        backend: torch | onnx | onnx-int8 (see load_model)
+        """
+        self.model_name = model_name
+        self.backend = backend
+        self.model = load_model(model_name, backend)
+        if cache is None and use_cache:
+            from embedding_cache import EmbeddingCache
+            # quantized vectors differ slightly, so each backend gets its own cache
+            cache_name = model_name if backend == "torch" else f"{model_name}@{backend}"
+            cache = EmbeddingCache(EMBEDDING_CACHE_DIR, cache_name, self.dimension,
+                                   max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+                                   memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES)
+            atexit.register(cache.flush)
+        self.cache = cache
+
+    @property
+    def dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    @property
+    def tokenizer(self):
+        """The model's Hugging Face tokenizer (used for token-aware chunking)."""
+        return getattr(self.model, "tokenizer", None)
+
+    @property
+    def max_seq_length(self):
+        """Tokens the model reads per text; anything longer is truncated."""
+        return getattr(self.model, "max_seq_length", None)
+
+    def encode(self, texts):
+        """Run the model on texts (no cache) and return normalized float32 rows."""
+        embs = self.model.encode(texts, show_progress_bar=False, convert_to_numpy=True)
+        embs = np.ascontiguousarray(embs, dtype=np.float32)
+        # normalize in place (optional, often helps)
+        norms = np.linalg.norm(embs, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        embs /= norms
+        return embs
+
+    def embed_array(self, texts):
+        """
+        texts: list[str]
+        returns: contiguous float32 ndarray of shape (len(texts), dim), L2-normalized.
+        Only cache misses go through the model; rows keep input order.
+        """
+        return self.cached_embed(texts, self.encode)
+
+    def cached_embed(self, texts, encode):
+        """
+        Like embed_array(), but cache misses are computed by `encode(texts)`,
+        which must return normalized float32 rows (used by ParallelEmbedder).
+        """
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        if self.cache is None:
+            return encode(texts)
+
+        keys = [self.cache.key(t) for t in texts]
+        cached = self.cache.get_many(keys)
+        out = np.empty((len(texts), self.dimension), dtype=np.float32)
+
+        # encode each distinct missing text once
+        missing = {}
+        for pos, (k, v) in enumerate(zip(keys, cached)):
+            if v is None:
+                missing.setdefault(k, []).append(pos)
+            else:
+                out[pos] = v
+        if missing:
+            miss_keys = list(missing)
+            embs = encode([texts[missing[k][0]] for k in miss_keys])
+            self.cache.put_many(miss_keys, embs)
+            for k, emb in zip(miss_keys, embs):
+                out[missing[k]] = emb
+        return out
 
     def embed_texts(self, texts):
         """
         texts: list[str]
         returns: list[list[float]] floats as lists
+        Prefer embed_array() on hot paths; this boxes every float.
         """
-        embs = self.model.encode(texts, show_progress_bar=False, convert_to_numpy=True)
-        # normalize (optional, often helps)
-        norms = (embs**2).sum(axis=1, keepdims=True) ** 0.5
-        norms[norms == 0] = 1.0
-        embs = embs / norms
-        return embs.tolist()
+        return self.embed_array(texts).tolist()
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else {}
+
+def parity_check(texts, model_name=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND):
+    """
+    Compare `backend` against the torch backend on `texts`: per-text cosine
+    similarity of the normalized embeddings (1.0 = identical) and throughput.
+    """
+    reference = EmbeddingClient(model_name, use_cache=False, backend="torch")
+    candidate = EmbeddingClient(model_name, use_cache=False, backend=backend)
+    # one warm-up call each so lazy initialization is not timed
+    reference.encode(texts[:1])
+    candidate.encode(texts[:1])
+
+    start = time.perf_counter()
+    ref = reference.encode(texts)
+    ref_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    cand = candidate.encode(texts)
+    cand_seconds = time.perf_counter() - start
+
+    cosine = (ref * cand).sum(axis=1)
+    return {
+        "backend": backend,
+        "texts": len(texts),
+        "mean_cosine": float(cosine.mean()),
+        "min_cosine": float(cosine.min()),
+        "max_drift": float(1.0 - cosine.min()),
+        "torch_texts_per_sec": len(texts) / ref_seconds if ref_seconds else 0.0,
+        "backend_texts_per_sec": len(texts) / cand_seconds if cand_seconds else 0.0,
+        "speedup": ref_seconds / cand_seconds if cand_seconds else 0.0,
+    }
+
+if __name__ == "__main__":
+    import json
+    import sys
+    sample = [line.strip() for line in open(sys.argv[1], encoding="utf-8") if line.strip()] \
+        if len(sys.argv) > 1 else ["Spindle load exceeded the configured limit.",
+                                   "Alarm 1010: servo axis overtravel on X.",
+                                   "Replace the coolant filter every 500 operating hours."]
+    print(json.dumps(parity_check(sample), indent=2))
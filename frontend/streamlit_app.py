@@ -382,8 +382,7 @@ if project_root not in sys.path:
 
 from config.settings import LLM_COMPLETION_PATH, QDRANT_URL, QDRANT_COLLECTION
 from auth.jwt_auth import authenticate_user, decode_token, get_current_user
-from vectorstore.qdrant_client import QdrantWrapper
-from embeddings import EmbeddingClient
+from model_registry import get_chunk_store, get_embedder, get_embedding_scheduler, get_reranker, get_vector_store, release
 from ingestion.ingest_manager import ingest_path
 from rag import RAGPipeline
 
@@ -683,15 +682,17 @@ def chat_ui(rag_pipeline):
     st.markdown('</div>', unsafe_allow_html=True)
 
 def handle_query(prompt, rag_pipeline):
-    """Handle user query"""
+    """Handle user query, rendering the answer as the LLM streams it"""
     st.session_state.messages.append({"role": "user", "content": prompt})
     
     try:
-        with st.spinner("Processing..."):
-            resp = rag_pipeline.answer(prompt)
+        events = rag_pipeline.answer_stream(prompt)
+        with st.spinner("Searching documents..."):
+            next(events)  # ("retrieved", hits) arrives before the first token
         
-        answer = resp.get("answer", "I couldn't find an answer.")
-        st.session_state.messages.append({"role": "assistant", "content": answer})
+        st.markdown("**🤖 Assistant:**")
+        answer = st.write_stream(text for kind, text in events if kind == "token")
+        st.session_state.messages.append({"role": "assistant", "content": answer or "I couldn't find an answer."})
         
     except Exception as e:
         error_msg = f"Sorry, I encountered an error: {str(e)}"
@@ -715,23 +716,34 @@ def main():
         show_app_header()
         show_user_header(user)
         
-        # Initialize backend
+        # Lease the shared backend; models stay warm across reruns
         with st.spinner("🔧 Initializing services..."):
-            qdrant = QdrantWrapper()
-            embedder = EmbeddingClient()
-            rag_pipeline = RAGPipeline(qdrant, embedder)
+            qdrant = get_vector_store()
+            embedder = get_embedder()
+            scheduler = get_embedding_scheduler()
+            text_store = get_chunk_store()
+            reranker = get_reranker()
         
-        # Show metrics
-        show_metrics_dashboard(rag_pipeline)
-        
-        # Main layout
-        col_sidebar, col_chat = st.columns([1, 2])
-        
-        with col_sidebar:
-            show_sidebar_controls(rag_pipeline)
-        
-        with col_chat:
-            chat_ui(rag_pipeline)
+        try:
+            rag_pipeline = RAGPipeline(qdrant, embedder, scheduler, text_store, reranker=reranker)
+            
+            # Show metrics
+            show_metrics_dashboard(rag_pipeline)
+            
+            # Main layout
+            col_sidebar, col_chat = st.columns([1, 2])
+            
+            with col_sidebar:
+                show_sidebar_controls(rag_pipeline)
+            
+            with col_chat:
+                chat_ui(rag_pipeline)
+        finally:
+            release(reranker)
+            release(text_store)
+            release(scheduler)
+            release(embedder)
+            release(qdrant)
             
     except Exception as e:
         st.error(f"🚫 Error: {str(e)}")
@@ -11,6 +11,7 @@ class AgentState(TypedDict):
     messages: Annotated[list, add_messages]
     task: str = None
     authorized: bool = False
+    error: str = None
 
 def build_graph():
     # Initialize the graph with the state schema
@@ -22,8 +23,19 @@ def build_graph():
     workflow.add_node("rag", rag_agent)
     workflow.add_node("db", db_agent)
     
-    # Define the flow
-    workflow.add_edge("supervisor", "auth")
+    # Define the flow: a failed or unparseable routing decision ends the run
+    # with state["error"] set instead of falling through auth
+    def route_after_supervisor(state: AgentState) -> str:
+        return "auth" if state.get("task") in ("rag", "db") else "error"
+
+    workflow.add_conditional_edges(
+        "supervisor",
+        route_after_supervisor,
+        {
+            "auth": "auth",
+            "error": END
+        }
+    )
     
     # Conditional routing after auth
     def route_after_auth(state: AgentState) -> str:
@@ -1,5 +1,17 @@
 # ingestion/chunker.py
+import copy
 import re
+import time
+from collections import OrderedDict, deque
+
+from config.settings import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    CHUNKER,
+    CHUNK_MAX_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    TOKEN_COUNT_CACHE_SIZE,
+)
 
 def sentence_split(text):
     # naive sentence splitter — can replace with nltk/spacy if desired
@@ -21,39 +33,420 @@ def chunk_text(text, chunk_size=800, overlap=100, prefer_sentence_boundary=True)
             start = max(0, end - overlap)
         return chunks
 
-    sentences = sentence_split(text)
-    chunks = []
+    return [chunk for chunk, _ in chunk_segments([(text, {})], chunk_size, overlap)]
+
+def _chunk_meta(first, last):
+    meta = dict(first)
+    if "page" in first:
+        meta["page_end"] = last.get("page", first["page"])
+    return meta
+
+def chunk_segments(segments, chunk_size=800, overlap=100):
+    """
+    Streaming, sentence-based chunk_text over an iterable of (text, meta)
+    segments, e.g. PDF pages with meta {"page": n}. Yields (chunk, meta)
+    lazily, so only the current chunk is held in memory. A chunk's meta is
+    that of the segment its first sentence came from; when segments carry a
+    page number, "page_end" is the page of its last sentence.
+
+    Segments whose meta has "atomic": True (e.g. CSV row groups) are emitted
+    as one chunk each, unsplit and without overlap.
+    """
     current = []
     current_len = 0
-    for s in sentences:
-        s_len = len(s) + 1
-        if current_len + s_len <= chunk_size:
-            current.append(s)
-            current_len += s_len
-        else:
+    first = last = None
+    prev = None
+
+    def emit():
+        nonlocal prev
+        chunk = " ".join(current).strip()
+        # Add overlap by joining tail of previous chunk to head of next if needed.
+        if prev is not None and overlap > 0:
+            if len(prev) > overlap:
+                chunk = prev[-overlap:] + " " + chunk
+            else:
+                chunk = prev + " " + chunk
+        prev = chunk
+        return chunk, _chunk_meta(first, last)
+
+    for text, meta in segments:
+        if not text:
+            continue
+        if meta.get("atomic"):
             if current:
-                chunks.append(" ".join(current).strip())
-            # start new chunk with current sentence (if it is huge, we still include it)
-            current = [s]
-            current_len = s_len
+                yield emit()
+            current, current_len, first = [], 0, None
+            prev = None
+            yield text, {k: v for k, v in meta.items() if k != "atomic"}
+            continue
+        for s in sentence_split(text):
+            s_len = len(s) + 1
+            if current_len + s_len <= chunk_size:
+                current.append(s)
+                current_len += s_len
+                if first is None:
+                    first = meta
+            else:
+                if current:
+                    yield emit()
+                # start new chunk with current sentence (if it is huge, we still include it)
+                current = [s]
+                current_len = s_len
+                first = meta
+            last = meta
     if current:
-        chunks.append(" ".join(current).strip())
+        yield emit()
+
+
+# ---- token-aware chunking ----
+
+# sentence ends, or paragraph breaks (PDF pages often have no punctuation)
+_BOUNDARY_RE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+# row lines of a tabular row group (ingestion/tabular.py)
+_ROW_RE = re.compile(r"^Row \d+: ", re.MULTILINE)
+
+
+def _sentence_spans(text):
+    """(start, end) of each stripped sentence in text, found in one left-to-right scan."""
+    pos = 0
+    for m in _BOUNDARY_RE.finditer(text):
+        yield from _stripped(text, pos, m.start())
+        pos = m.end()
+    yield from _stripped(text, pos, len(text))
+
+
+def _stripped(text, start, end):
+    piece = text[start:end]
+    lead = len(piece) - len(piece.lstrip())
+    trail = len(piece.rstrip())
+    if trail > lead:
+        yield start + lead, start + trail
+
 
-    # Add overlap by joining tail of previous chunk to head of next if needed.
-    if overlap > 0 and len(chunks) > 1:
+def own_tokenizer(tokenizer):
+    """
+    A private copy of a Hugging Face tokenizer. Fast tokenizers change their
+    padding/truncation state on every call and must not be shared between
+    threads (the chunk stage and the embedding model run concurrently).
+    """
+    if tokenizer is None:
+        return None
+    try:
+        return copy.deepcopy(tokenizer)
+    except Exception:
+        pass
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(tokenizer.name_or_path)
+    except Exception:
+        return tokenizer   # cannot copy it: share, as before
+
+
+class TokenCounter:
+    """
+    Token lengths from a Hugging Face tokenizer. Sentence counts are computed
+    in one batched tokenizer call per segment and kept in an LRU (boilerplate
+    repeats a lot), and a chunk's size is estimated as the sum of its
+    sentences' counts; exact() re-tokenizes a finished chunk once to check it.
+    The counter works on its own copy of the tokenizer (own_tokenizer).
+    """
+
+    def __init__(self, tokenizer, cache_size=TOKEN_COUNT_CACHE_SIZE):
+        tokenizer = own_tokenizer(tokenizer)
+        self.tokenizer = tokenizer
+        self.cache_size = int(cache_size)
+        self._cache = OrderedDict()
+        try:
+            self.special = tokenizer.num_special_tokens_to_add(pair=False)
+        except AttributeError:
+            self.special = 2   # [CLS] ... [SEP]
+
+    def counts(self, texts):
+        missing = [t for t in dict.fromkeys(texts) if t not in self._cache]
+        if missing:
+            for text, ids in zip(missing, self.tokenizer(missing, add_special_tokens=False)["input_ids"]):
+                self._cache[text] = len(ids)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
         out = []
-        for i, c in enumerate(chunks):
-            if i == 0:
-                out.append(c)
-                continue
-            prev = out[-1]
-            # ensure overlap characters exist:
-            if len(prev) > overlap:
-                # overlap_tail = last N chars of prev
-                overlap_tail = prev[-overlap:]
-                new_chunk = overlap_tail + " " + c
-            else:
-                new_chunk = prev + " " + c
-            out.append(new_chunk)
+        for t in texts:
+            n = self._cache.get(t)
+            if n is None:   # evicted by this very batch
+                n = len(self.tokenizer(t, add_special_tokens=False)["input_ids"])
+            out.append(n)
         return out
-    return chunks
+
+    def exact(self, text):
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def windows(self, text, max_tokens):
+        """Split text into (start, end, n_tokens) character spans of at most max_tokens tokens."""
+        offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        for i in range(0, len(offsets), max_tokens):
+            window = offsets[i:i + max_tokens]
+            yield window[0][0], window[-1][1], len(window)
+
+
+_END = object()
+
+
+class _Unit:
+    __slots__ = ("start", "end", "tokens", "seg", "atomic", "span")
+
+    def __init__(self, start, end, tokens, seg, atomic=False, span=None):
+        self.start, self.end, self.tokens, self.seg, self.atomic = start, end, tokens, seg, atomic
+        self.span = span   # (char_start, char_end) when the unit's text is not a slice of the input
+
+
+def _row_pieces(text, base, meta, counter, budget):
+    """
+    Units for a row group that does not fit the budget: split between rows,
+    each piece repeating the "Columns:" header, with "rows" narrowed to the
+    piece. A single row too long on its own is cut into token windows.
+    """
+    starts = [m.start() for m in _ROW_RE.finditer(text)]
+    if not starts:
+        for a, b, n in counter.windows(text, budget):
+            yield _Unit(a, b, n, (text, base, meta), atomic=True)
+        return
+    header = text[:starts[0]].rstrip("\n")
+    spans = [(a, b) for a, b in zip(starts, starts[1:] + [len(text)])]
+    rows = [text[a:b].rstrip("\n") for a, b in spans]
+    header_tokens = counter.counts([header])[0] if header else 0
+    first_row = meta.get("rows", [0])[0]
+
+    def piece(i, j, tokens):
+        piece_meta = dict(meta)
+        piece_meta["rows"] = [first_row + i, first_row + j - 1]
+        piece_text = "\n".join(([header] if header else []) + rows[i:j])
+        seg = (piece_text, base, piece_meta)
+        span = (base + spans[i][0], base + spans[i][0] + len("\n".join(rows[i:j])))
+        if tokens <= budget:
+            yield _Unit(0, len(piece_text), tokens, seg, atomic=True, span=span)
+        else:
+            for a, b, n in counter.windows(piece_text, budget):
+                yield _Unit(a, b, n, seg, atomic=True, span=span)
+
+    i, total = 0, header_tokens
+    for j, n in enumerate(counter.counts(rows)):
+        if j > i and total + n > budget:
+            yield from piece(i, j, total)
+            i, total = j, header_tokens
+        total += n
+    yield from piece(i, len(rows), total)
+
+
+def _units(segments, counter, budget):
+    """Sentences (or token windows of oversized ones) of each segment, each within budget."""
+    base = 0
+    for text, meta in segments:
+        if not text:
+            continue
+        seg = (text, base, meta)
+        base += len(text)
+        if meta.get("atomic"):
+            n = counter.counts([text])[0]
+            if n <= budget:
+                yield _Unit(0, len(text), n, seg, atomic=True)
+            else:
+                yield from _row_pieces(text, seg[1], meta, counter, budget)
+            continue
+        spans = list(_sentence_spans(text))
+        counts = counter.counts([text[a:b] for a, b in spans])
+        for (a, b), n in zip(spans, counts):
+            if n <= budget:
+                yield _Unit(a, b, n, seg)
+            else:
+                for wa, wb, wn in counter.windows(text[a:b], budget):
+                    yield _Unit(a + wa, a + wb, wn, seg)
+
+
+def _render(units):
+    """Chunk text and meta; consecutive units of one segment are a single slice of its text."""
+    parts = []
+    run_seg, run_start, run_end = None, None, None
+    for u in units:
+        if u.seg is run_seg:
+            run_end = u.end
+            continue
+        if run_seg is not None:
+            parts.append(run_seg[0][run_start:run_end])
+        run_seg, run_start, run_end = u.seg, u.start, u.end
+    parts.append(run_seg[0][run_start:run_end])
+
+    first, last = units[0], units[-1]
+    meta = _chunk_meta(first.seg[2], last.seg[2])
+    meta.pop("atomic", None)
+    meta["char_start"] = first.span[0] if first.span else first.seg[1] + first.start
+    meta["char_end"] = last.span[1] if last.span else last.seg[1] + last.end
+    return "\n".join(parts), meta
+
+
+def chunk_tokens(segments, counter, max_tokens=256, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Token-aware streaming chunker over (text, meta) segments.
+
+    counter: TokenCounter for the embedding model's tokenizer
+    max_tokens: the model's max sequence length; every chunk plus the
+        tokenizer's special tokens fits in it, so nothing is truncated at
+        embedding time (sentences longer than that are cut at token boundaries)
+    overlap_tokens: trailing whole sentences, up to this many tokens, are
+        repeated at the start of the next chunk
+
+    Yields (chunk, meta) lazily in one pass; each sentence is tokenized once
+    (plus one check of each finished chunk). meta is as in chunk_segments
+    plus "char_start" / "char_end", the chunk's position in the concatenated
+    segment texts. Atomic segments (CSV row groups) become their own chunks;
+    one that does not fit is split between rows, each piece repeating the
+    column header and carrying its own "rows" range.
+    """
+    budget = max(1, int(max_tokens) - counter.special)
+    overlap_tokens = max(0, min(int(overlap_tokens), budget // 2))
+    window = []        # units of the chunk being built
+    total = 0          # estimated tokens in window
+    fresh = False      # window holds units not yet emitted (not just overlap)
+    pushback = deque()
+    source = _units(segments, counter, budget)
+
+    while True:
+        unit = pushback.popleft() if pushback else next(source, _END)
+        if unit is _END or unit.atomic or (fresh and total + unit.tokens > budget):
+            if fresh:
+                # the estimate can be off by a token or two for BPE tokenizers;
+                # trailing sentences move on to the next chunk until the exact count fits
+                text, meta = _render(window)
+                trimmed = []
+                while len(window) > 1 and counter.exact(text) > budget:
+                    trimmed.insert(0, window.pop())
+                    text, meta = _render(window)
+                yield text, meta
+                if trimmed:
+                    pushback.extendleft(reversed(trimmed + [unit]))
+                    unit = pushback.popleft()
+                window, total = _overlap(window, overlap_tokens)
+                fresh = False
+            if unit is _END:
+                break
+            if unit.atomic:
+                window, total = [], 0
+                yield _render([unit])
+                continue
+        if total + unit.tokens > budget:
+            window, total = [], 0   # not even the overlap fits next to this sentence
+        window.append(unit)
+        total += unit.tokens
+        fresh = True
+
+
+def _overlap(window, overlap_tokens):
+    """Trailing units of window within overlap_tokens, and their token total."""
+    kept, tokens = [], 0
+    for u in reversed(window):
+        if tokens + u.tokens > overlap_tokens:
+            break
+        kept.append(u)
+        tokens += u.tokens
+    return kept[::-1], tokens
+
+
+def chunker_for(embedder, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, mode=CHUNKER):
+    """
+    segments -> (chunk, meta) function used by ingestion. With mode "tokens"
+    and an embedder that exposes its tokenizer, chunks are sized in tokens to
+    fit the model (CHUNK_MAX_TOKENS, default the model's max_seq_length);
+    otherwise chunk_segments with chunk_size / overlap characters.
+    """
+    tokenizer = getattr(embedder, "tokenizer", None)
+    if mode == "tokens" and tokenizer is not None:
+        counter = TokenCounter(tokenizer)
+        max_tokens = CHUNK_MAX_TOKENS or getattr(embedder, "max_seq_length", None) or 256
+        return lambda segments: chunk_tokens(segments, counter, max_tokens, CHUNK_OVERLAP_TOKENS)
+    return lambda segments: chunk_segments(segments, chunk_size, overlap)
+
+
+def _synthetic_pages(n_chars, page_chars=4000, seed=0):
+    import random
+    rng = random.Random(seed)
+    words = ["spindle", "axis", "servo", "coolant", "alarm", "overtravel", "feed", "rate", "tool",
+             "offset", "parameter", "the", "of", "and", "is", "to", "check", "replace", "filter",
+             "pressure", "X", "Y", "Z", "1010", "mm/min", "M30", "G-code", "lubrication"]
+    produced = 0
+    while produced < n_chars:
+        sentences = []
+        size = 0
+        while size < page_chars:
+            s = " ".join(rng.choice(words) for _ in range(rng.randint(4, 40))).capitalize() + rng.choice(".!?")
+            sentences.append(s)
+            size += len(s) + 1
+        page = " ".join(sentences)
+        produced += len(page)
+        yield page
+
+
+def benchmark(counter, max_tokens=256, n_chars=5_000_000, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """
+    Compare chunk_text (characters, whole document in memory) with
+    chunk_tokens (tokens, streamed page by page) on n_chars of synthetic
+    manual text: throughput, peak Python memory and how many chunks exceed
+    the model's window (and would be truncated when embedded).
+    """
+    import tracemalloc
+
+    pages = list(_synthetic_pages(n_chars))
+    text = "\n\n".join(pages)
+    budget = max_tokens - counter.special
+
+    def over_limit(chunks):
+        counts = []
+        for i in range(0, len(chunks), 1024):
+            counts.extend(counter.exact(c) for c in chunks[i:i + 1024])
+        return sum(1 for n in counts if n > budget), max(counts) if counts else 0
+
+    def run(fn):
+        start = time.perf_counter()
+        chunks = fn()
+        seconds = time.perf_counter() - start
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return chunks, seconds, peak
+
+    char_chunks, char_seconds, char_peak = run(
+        lambda: chunk_text(text, chunk_size=chunk_size, overlap=overlap))
+    token_chunks, token_seconds, token_peak = run(
+        lambda: [c for c, _ in chunk_tokens(((p, {}) for p in pages), counter, max_tokens)])
+    char_over, char_max = over_limit(char_chunks)
+    token_over, token_max = over_limit(token_chunks)
+    mb = len(text) / 1e6
+    return {
+        "chars": len(text),
+        "max_tokens": max_tokens,
+        "chunk_text": {
+            "chunks": len(char_chunks),
+            "seconds": char_seconds,
+            "mb_per_sec": mb / char_seconds if char_seconds else 0.0,
+            "peak_mb": char_peak / 1e6,
+            "chunks_over_limit": char_over,
+            "max_chunk_tokens": char_max,
+        },
+        "chunk_tokens": {
+            "chunks": len(token_chunks),
+            "seconds": token_seconds,
+            "mb_per_sec": mb / token_seconds if token_seconds else 0.0,
+            "peak_mb": token_peak / 1e6,
+            "chunks_over_limit": token_over,
+            "max_chunk_tokens": token_max,
+        },
+    }
+
+
+if __name__ == "__main__":
+    # python -m ingestion.chunker [n_chars]
+    import json
+    import sys
+    from config.settings import EMBEDDING_MODEL
+    from embeddings import load_model
+    model = load_model(EMBEDDING_MODEL)
+    n_chars = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000_000
+    print(json.dumps(benchmark(TokenCounter(model.tokenizer), model.max_seq_length, n_chars), indent=2))
@@ -1,17 +1,28 @@
 # ingestion/csv_parser.py
 import pandas as pd
 
-def parse_csv(path, max_chars_per_row=2000):
+from config.settings import TABULAR_READ_ROWS
+from .tabular import default_columns, join_segments, row_groups
+
+
+def iter_csv_segments(path, columns=None, rows_per_chunk=None, max_chars_per_row=2000,
+                      read_rows=TABULAR_READ_ROWS):
     """
-    For CSVs, create a text summary per row or join important columns.
-    Returning a single string by joining rows can be okay for smaller CSVs.
+    Stream a CSV as row-group segments (see ingestion/tabular.py), reading
+    `read_rows` rows at a time so memory stays flat on multi-million-row files.
+    columns: names to keep (default TABULAR_COLUMNS, else all).
     """
-    df = pd.read_csv(path, dtype=str, keep_default_na=False)
-    rows = []
-    for i, row in df.iterrows():
-        # Simple row-to-text conversion. Improve by selecting specific columns.
-        text = " | ".join([f"{col}: {row[col]}" for col in df.columns])
-        if len(text) > max_chars_per_row:
-            text = text[:max_chars_per_row] + "..."
-        rows.append(f"Row {i}: {text}")
-    return "\n".join(rows)
+    columns = columns if columns is not None else default_columns()
+    wanted = set(columns) if columns else None
+    reader = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=read_rows,
+                         usecols=(lambda c: c in wanted) if wanted else None)
+    kwargs = {"columns": columns, "max_chars_per_row": max_chars_per_row}
+    if rows_per_chunk is not None:
+        kwargs["rows_per_chunk"] = rows_per_chunk
+    with reader:
+        yield from row_groups(reader, **kwargs)
+
+
+def parse_csv(path, max_chars_per_row=2000, columns=None):
+    """Whole CSV as one string of row groups; prefer iter_csv_segments for large files."""
+    return join_segments(iter_csv_segments(path, columns=columns, max_chars_per_row=max_chars_per_row))
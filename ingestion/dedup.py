@@ -0,0 +1,349 @@
+# ingestion/dedup.py
+"""
+Near-duplicate chunk suppression at ingestion time.
+
+DedupIndex sits between the chunker and the embedder. A chunk whose
+normalized text hash was seen before (exact duplicate), or whose MinHash
+signature has an estimated Jaccard similarity >= threshold with a stored
+chunk (near duplicate, found through LSH bands), is not embedded or stored.
+Instead it is recorded as an alias of the canonical point; in "alias" mode
+the canonical point's payload lists its aliases under "aliases" so answers
+can still cite every location.
+
+Layout of <DEDUP_DIR>/<collection>/:
+  signatures.u32  append-only uint32 MinHash rows, one per canonical chunk
+  entries.jsonl   append-only log of {"op": "add" | "alias" | "remove", ...}
+                  records, replayed on open
+
+When a canonical point is deleted (its file changed or disappeared), the
+files holding its aliases are returned by remove() so the caller can drop
+them from the ingest manifest; they are re-ingested on the next run and one
+of the duplicates becomes canonical.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from config.settings import (
+    DEDUP_BANDS,
+    DEDUP_DIR,
+    DEDUP_MAX_ALIASES,
+    DEDUP_MODE,
+    DEDUP_NUM_PERM,
+    DEDUP_SHINGLE,
+    DEDUP_THRESHOLD,
+)
+from .manifest import text_hash
+
+_WORD_RE = re.compile(r"\w+")
+_PRIME = (1 << 61) - 1
+_P = np.uint64(_PRIME)
+_LOW31 = np.uint64((1 << 31) - 1)
+_LOW30 = np.uint64((1 << 30) - 1)
+
+
+def _mod61(x):
+    """x mod 2^61 - 1 for uint64 x (folding the high bits: 2^61 = 1 mod p)."""
+    x = (x & _P) + (x >> np.uint64(61))
+    x = (x & _P) + (x >> np.uint64(61))
+    return np.where(x >= _P, x - _P, x)
+
+
+def _mulmod61(a, h):
+    """(a * h) mod 2^61 - 1 for a, h < 2^61, in 31-bit limbs so no uint64 product overflows."""
+    a1, a0 = a >> np.uint64(31), a & _LOW31
+    h1, h0 = h >> np.uint64(31), h & _LOW31
+    # a*h = a1*h1*2^62 + (a1*h0 + a0*h1)*2^31 + a0*h0, with 2^62 = 2 and 2^61 = 1 mod p
+    mid = a1 * h0 + a0 * h1                                   # < 2^62
+    mid = (mid >> np.uint64(30)) + ((mid & _LOW30) << np.uint64(31))
+    return _mod61(np.uint64(2) * (a1 * h1) + mid + a0 * h0)   # < 2^61 + 2^61 + 2^62 + 2^32
+
+
+class MinHasher:
+    """
+    MinHash over word k-shingles, vectorized across permutations: 64-bit
+    shingle hashes h and the universal family (a * h + b) mod (2^61 - 1)
+    with a, b drawn uniformly from [1, p).
+    """
+
+    def __init__(self, num_perm=DEDUP_NUM_PERM, shingle=DEDUP_SHINGLE, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = int(num_perm)
+        self.shingle = int(shingle)
+        self.a = rng.randint(1, _PRIME, size=self.num_perm, dtype=np.int64).astype(np.uint64)
+        self.b = rng.randint(1, _PRIME, size=self.num_perm, dtype=np.int64).astype(np.uint64)
+
+    def words(self, text):
+        return _WORD_RE.findall(text.lower())
+
+    @staticmethod
+    def shingle_hash(shingle):
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % _PRIME
+
+    def signature(self, words):
+        k = self.shingle
+        shingles = {" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))}
+        hashes = np.fromiter((self.shingle_hash(s) for s in shingles), dtype=np.uint64, count=len(shingles))
+        values = _mod61(_mulmod61(self.a[:, None], hashes[None, :]) + self.b[:, None])
+        # stored as uint32 rows: equal minima still compare equal (collisions ~2^-32)
+        return (values.min(axis=1) & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+
+
+class DedupIndex:
+    def __init__(self, collection, path=DEDUP_DIR, threshold=DEDUP_THRESHOLD,
+                 num_perm=DEDUP_NUM_PERM, bands=DEDUP_BANDS, shingle=DEDUP_SHINGLE,
+                 max_aliases=DEDUP_MAX_ALIASES):
+        if num_perm % bands:
+            raise ValueError(f"DEDUP_NUM_PERM ({num_perm}) must be a multiple of DEDUP_BANDS ({bands})")
+        self.collection = collection
+        self.dir = os.path.join(path, collection)
+        self.threshold = float(threshold)
+        self.bands = int(bands)
+        self.rows = int(num_perm) // self.bands
+        self.max_aliases = int(max_aliases)
+        self.hasher = MinHasher(num_perm, shingle)
+        self._lock = threading.RLock()
+
+        self._signatures = []     # row -> signature (None once removed)
+        self._row_of = {}         # canonical id -> row
+        self._exact = {}          # text hash -> [canonical ids]
+        self._hash_of = {}        # canonical id -> text hash
+        self._buckets = {}        # (band, band bytes) -> [canonical ids]
+        self._alias_of = {}       # duplicate id -> canonical id
+        self._aliases = {}        # canonical id -> {duplicate id: ref}
+        self._dirty_payloads = set()
+        self._unwritten = set()   # canonical ids registered by check() whose points are not acknowledged yet
+        self.exact_hits = 0
+        self.near_hits = 0
+
+        os.makedirs(self.dir, exist_ok=True)
+        self._replay()
+        self._sig_file = open(self._path("signatures.u32"), "ab")
+        self._log = open(self._path("entries.jsonl"), "a", encoding="utf-8")
+
+    # ---- storage ----
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _replay(self):
+        if not os.path.exists(self._path("entries.jsonl")):
+            return
+        rows = np.array([], dtype=np.uint32)
+        if os.path.exists(self._path("signatures.u32")):
+            rows = np.fromfile(self._path("signatures.u32"), dtype=np.uint32)
+            usable = len(rows) // self.hasher.num_perm * self.hasher.num_perm
+            if usable != len(rows):
+                # torn final row: cut it so new rows stay aligned
+                with open(self._path("signatures.u32"), "r+b") as f:
+                    f.truncate(usable * 4)
+            rows = rows[:usable].reshape(-1, self.hasher.num_perm)
+        with open(self._path("entries.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break  # torn final write
+                op = rec["op"]
+                if op == "add":
+                    row = rec["row"]
+                    sig = rows[row] if row is not None and row < len(rows) else None
+                    self._add(rec["id"], rec["hash"], sig)
+                elif op == "alias":
+                    self._link(rec["id"], rec["of"], rec["ref"])
+                elif op == "remove":
+                    self._remove(rec["id"])
+        # rows are appended in the order they were added; keep numbering in step
+        while len(self._signatures) < len(rows):
+            self._signatures.append(None)
+
+    def _write(self, rec):
+        self._log.write(json.dumps(rec) + "\n")
+
+    def save(self):
+        with self._lock:
+            self._sig_file.flush()
+            self._log.flush()
+
+    def close(self):
+        with self._lock:
+            self.save()
+            self._sig_file.close()
+            self._log.close()
+
+    # ---- in-memory state ----
+    def _band_keys(self, sig):
+        r = self.rows
+        return [(b, sig[b * r:(b + 1) * r].tobytes()) for b in range(self.bands)]
+
+    def _add(self, pid, h, sig):
+        self._exact.setdefault(h, []).append(pid)
+        self._hash_of[pid] = h
+        if sig is not None:
+            row = len(self._signatures)
+            self._signatures.append(sig)
+            self._row_of[pid] = row
+            for key in self._band_keys(sig):
+                self._buckets.setdefault(key, []).append(pid)
+            return row
+        return None
+
+    def _link(self, dup, canonical, ref):
+        self._alias_of[dup] = canonical
+        self._aliases.setdefault(canonical, {})[dup] = ref
+
+    def _remove(self, pid):
+        """Forget pid; returns the refs of its aliases if it was canonical."""
+        canonical = self._alias_of.pop(pid, None)
+        if canonical is not None:
+            refs = self._aliases.get(canonical)
+            if refs is not None:
+                refs.pop(pid, None)
+                if not refs:
+                    del self._aliases[canonical]
+            self._dirty_payloads.add(canonical)
+            return []
+        h = self._hash_of.pop(pid, None)
+        if h is None:
+            return []
+        same = self._exact.get(h)
+        if same is not None and pid in same:
+            same.remove(pid)
+            if not same:
+                del self._exact[h]
+        row = self._row_of.pop(pid, None)
+        if row is not None:
+            sig = self._signatures[row]
+            self._signatures[row] = None
+            for key in self._band_keys(sig):
+                bucket = self._buckets.get(key)
+                if bucket is not None and pid in bucket:
+                    bucket.remove(pid)
+                    if not bucket:
+                        del self._buckets[key]
+        orphans = self._aliases.pop(pid, {})
+        for dup in orphans:
+            self._alias_of.pop(dup, None)
+        self._dirty_payloads.discard(pid)
+        self._unwritten.discard(pid)
+        return list(orphans.values())
+
+    # ---- public API ----
+    def check(self, pid, text, ref, eligible=None, near=True):
+        """
+        Look up a new chunk. Returns the canonical point id it duplicates (and
+        records it as an alias), or None after registering it as canonical.
+        ref: where the chunk lives (source, abs_path, chunk_index, page...)
+        eligible: optional predicate on candidate canonical ids
+        near: also try MinHash near-duplicate matching (off for e.g. table rows,
+              where similar-looking rows carry different values)
+        """
+        words = self.hasher.words(text)
+        h = text_hash(" ".join(words))
+        with self._lock:
+            if pid in self._hash_of or pid in self._alias_of:
+                return self._alias_of.get(pid)   # seen before (re-processed file)
+            for canonical in self._exact.get(h, ()):
+                if eligible is None or eligible(canonical):
+                    self.exact_hits += 1
+                    return self._alias(pid, canonical, ref)
+
+            sig = None
+            if near and len(words) >= 2 * self.hasher.shingle:
+                sig = self.hasher.signature(words)
+                best, best_score = None, self.threshold
+                seen = set()
+                for key in self._band_keys(sig):
+                    for cand in self._buckets.get(key, ()):
+                        if cand in seen:
+                            continue
+                        seen.add(cand)
+                        if eligible is not None and not eligible(cand):
+                            continue
+                        score = float(np.mean(self._signatures[self._row_of[cand]] == sig))
+                        if score >= best_score:
+                            best, best_score = cand, score
+                if best is not None:
+                    self.near_hits += 1
+                    return self._alias(pid, best, ref)
+
+            row = self._add(pid, h, sig)
+            self._unwritten.add(pid)
+            if sig is not None:
+                self._sig_file.write(sig.tobytes())
+            self._write({"op": "add", "id": pid, "hash": h, "path": ref.get("abs_path"), "row": row})
+            return None
+
+    def _alias(self, pid, canonical, ref):
+        self._link(pid, canonical, ref)
+        self._dirty_payloads.add(canonical)
+        self._write({"op": "alias", "id": pid, "of": canonical, "ref": ref})
+        return canonical
+
+    def aliases(self, pid):
+        """Alias refs of a canonical point (at most max_aliases), for its payload."""
+        with self._lock:
+            return list(self._aliases.get(pid, {}).values())[:self.max_aliases]
+
+    def remove(self, pids):
+        """
+        Forget deleted points. Returns the abs_paths of other files whose
+        chunks were aliases of a removed canonical point and must be re-ingested.
+        """
+        orphan_paths = set()
+        with self._lock:
+            for pid in pids:
+                if pid in self._hash_of or pid in self._alias_of:
+                    for ref in self._remove(pid):
+                        orphan_paths.add(ref.get("abs_path"))
+                    self._write({"op": "remove", "id": pid})
+        orphan_paths.discard(None)
+        return orphan_paths
+
+    def written(self, pids):
+        """Mark points as acknowledged by the vector store, so apply_payloads() may update them."""
+        with self._lock:
+            self._unwritten.difference_update(pids)
+
+    def apply_payloads(self, store):
+        """
+        Push changed alias lists to their canonical points' payloads. Canonical
+        points not yet acknowledged through written() stay dirty until they are
+        (setting the payload of a missing point fails or is lost).
+        """
+        with self._lock:
+            ready = self._dirty_payloads - self._unwritten
+            updates = {pid: {"aliases": self.aliases(pid)} for pid in ready}
+            self._dirty_payloads -= ready
+        if updates and DEDUP_MODE == "alias":
+            store.set_payloads(updates)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "canonical": len(self._hash_of),
+                "aliases": len(self._alias_of),
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+            }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_dedup_index(collection):
+    """Process-wide DedupIndex per collection, or None when DEDUP_MODE is off."""
+    if DEDUP_MODE not in ("skip", "alias"):
+        return None
+    with _indexes_lock:
+        index = _indexes.get(collection)
+        if index is None:
+            index = _indexes[collection] = DedupIndex(collection)
+        return index
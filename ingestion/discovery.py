@@ -0,0 +1,107 @@
+# ingestion/discovery.py
+"""
+Parallel file discovery for folder ingestion.
+
+discover_files() walks a directory tree with a pool of threads, one
+os.scandir() call per directory, and yields matching files as soon as they
+are found rather than after the whole walk. On slow network mounts the
+directory listings overlap, and ingestion can start on the first files
+while the rest of the tree is still being listed.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+
+from config.settings import INGEST_DISCOVERY_WORKERS
+
+_DONE = object()
+
+
+def _matches(rel_path, patterns):
+    """Glob match against the path relative to the root (posix separators) or the base name."""
+    name = rel_path.rsplit("/", 1)[-1]
+    return any(fnmatch(rel_path, pat) or fnmatch(name, pat) for pat in patterns)
+
+
+def discover_files(root, recursive=True, include=None, exclude=None, max_depth=None,
+                   min_size=0, max_size=None, extensions=None, workers=INGEST_DISCOVERY_WORKERS,
+                   queue_size=1024):
+    """
+    Yield absolute paths of files under `root`.
+
+    include / exclude: glob patterns (e.g. "*.pdf", "manuals/**", ".git");
+        a file must match an include pattern (if any) and no exclude pattern;
+        directories matching an exclude pattern are not descended into
+    max_depth: 0 = only files directly in root; None = unlimited (when recursive)
+    min_size / max_size: file size bounds in bytes
+    extensions: optional set of lower-case suffixes to accept (e.g. {".pdf"})
+    """
+    root = os.path.abspath(root)
+    if not recursive:
+        max_depth = 0
+    include = list(include or [])
+    exclude = list(exclude or [])
+
+    out = queue.Queue(maxsize=queue_size)
+    pending = [1]                 # directories queued or being scanned
+    lock = threading.Lock()
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="discover")
+
+    def accept(entry, rel):
+        if extensions is not None and os.path.splitext(entry.name)[1].lower() not in extensions:
+            return False
+        if include and not _matches(rel, include):
+            return False
+        if exclude and _matches(rel, exclude):
+            return False
+        if min_size or max_size is not None:
+            size = entry.stat().st_size
+            if size < min_size or (max_size is not None and size > max_size):
+                return False
+        return True
+
+    def scan(path, rel_dir, depth):
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if stop.is_set():
+                        break
+                    rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if (max_depth is None or depth < max_depth) and not (exclude and _matches(rel, exclude)):
+                                with lock:
+                                    pending[0] += 1
+                                pool.submit(scan, entry.path, rel, depth + 1)
+                        elif entry.is_file() and accept(entry, rel):
+                            out.put(entry.path)
+                    except OSError as e:
+                        print(f"[discover] Skipping {entry.path}: {e}")
+        except OSError as e:
+            print(f"[discover] Cannot list {path}: {e}")
+        finally:
+            with lock:
+                pending[0] -= 1
+                finished = pending[0] == 0
+            if finished:
+                out.put(_DONE)
+
+    pool.submit(scan, root, "", 0)
+    try:
+        while True:
+            item = out.get()
+            if item is _DONE:
+                break
+            yield item
+    finally:
+        stop.set()
+        # unblock scanners waiting on a full queue if the consumer stopped early
+        while True:
+            try:
+                out.get_nowait()
+            except queue.Empty:
+                break
+        pool.shutdown(wait=False, cancel_futures=True)
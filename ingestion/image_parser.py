@@ -1,14 +1,11 @@
 # ingestion/image_parser.py
-from PIL import Image
-import pytesseract
+from .ocr import ocr_pages
 
 def parse_image(path, lang=None):
     """
-    path -> OCR text string.
+    path -> OCR text string (pages of a multi-page TIFF joined by blank lines).
+    Preprocessing, caching and the OCR process pool live in ingestion/ocr.py.
     Make sure tesseract is installed in the system. If tesseract is not in PATH,
     set pytesseract.pytesseract.tesseract_cmd = r"/usr/bin/tesseract" (or your path).
     """
-    img = Image.open(path)
-    # optionally convert to grayscale or run basic preprocessing here
-    text = pytesseract.image_to_string(img, lang=lang) if lang else pytesseract.image_to_string(img)
-    return text
+    return "\n\n".join(text for _, text in ocr_pages(path, lang=lang))
@@ -1,108 +1,327 @@
 # ingestion/ingest_manager.py
 import os
 from pathlib import Path
-from .txt_parser import parse_txt
-from .pdf_parser import parse_pdf
-from .csv_parser import parse_csv
-from .xlsx_parser import parse_xlsx
-from .image_parser import parse_image
-from .chunker import chunk_text
+from .parsers import EXT_TO_PARSER, iter_segments
+from .chunker import chunker_for
 from vectorstore.qdrant_client import QdrantWrapper
+from vectorstore.bulk_writer import BulkWriter
+from vectorstore.chunk_store import chunk_store_exists
 from embeddings import EmbeddingClient
-import uuid
-from tqdm import tqdm
+from model_registry import get_chunk_store, get_embedder, get_parallel_embedder, get_vector_store, release
+from .parallel_embedder import resolve_workers
+from .manifest import file_hash, get_manifest, point_id
+from .discovery import discover_files
+from .dedup import get_dedup_index
+from contextlib import contextmanager
 
 # Import from central config
-from config.settings import CHUNK_SIZE as DEFAULT_CHUNK_SIZE, CHUNK_OVERLAP as DEFAULT_OVERLAP
-
-EXT_TO_PARSER = {
-    ".txt": parse_txt,
-    ".pdf": parse_pdf,
-    ".csv": parse_csv,
-    ".xlsx": parse_xlsx,
-    ".xls": parse_xlsx,
-    ".png": parse_image,
-    ".jpg": parse_image,
-    ".jpeg": parse_image,
-    ".tif": parse_image,
-    ".tiff": parse_image,
-}
-
-def parse_file(path):
-    ext = Path(path).suffix.lower()
-    parser = EXT_TO_PARSER.get(ext)
-    if not parser:
-        raise ValueError(f"No parser for extension: {ext}")
-    # image parser may need different signature; we keep it simple
-    return parser(path)
-
-def ingest_path(path, qdrant: QdrantWrapper, embedder: EmbeddingClient, 
+from config.settings import CHUNK_SIZE as DEFAULT_CHUNK_SIZE, CHUNK_OVERLAP as DEFAULT_OVERLAP, INGEST_MAX_FILE_MB, DEDUP_MODE
+
+@contextmanager
+def ingest_components(qdrant=None, embedder=None, collection=None):
+    """
+    Yield (qdrant, embedder), leasing whichever is missing from the model
+    registry; `qdrant` is the configured vector store (Qdrant or local).
+    The default embedder is the multi-process ParallelEmbedder when
+    INGEST_EMBED_WORKERS > 1, else the in-process EmbeddingClient.
+    """
+    leased = []
+    try:
+        if qdrant is None:
+            qdrant = get_vector_store(collection=collection) if collection else get_vector_store()
+            leased.append(qdrant)
+        if embedder is None:
+            embedder = get_parallel_embedder() if resolve_workers() > 1 else get_embedder()
+            leased.append(embedder)
+        yield qdrant, embedder
+    finally:
+        for obj in leased:
+            release(obj)
+
+@contextmanager
+def text_store_for(collection, store_text_in_payload):
+    """
+    Yield the collection's chunk text store when chunk text goes there
+    (store_text_in_payload=False) or an earlier run left texts there that
+    stale points must drop; else None.
+    """
+    if store_text_in_payload and not chunk_store_exists(collection):
+        yield None
+        return
+    store = get_chunk_store(collection)
+    try:
+        yield store
+    finally:
+        store.flush()
+        release(store)
+
+def ingest_path(path, qdrant: QdrantWrapper = None, embedder: EmbeddingClient = None,
                 chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP,
-                collection=None, store_text_in_payload=True):
+                collection=None, store_text_in_payload=True, manifest=None, force=False,
+                recursive=False):
     """
-    Ingests a single file path (file or directory). Returns number of chunks inserted.
+    Ingests a single file path (file or directory; recursive=True walks subdirectories). Returns number of chunks inserted.
+    When qdrant/embedder are not given, the shared instances from the model
+    registry are used (and `collection` picks the Qdrant collection).
+
+    Ingestion is incremental: files whose size/mtime or content hash match
+    the manifest are skipped, only new or edited chunks are embedded, and
+    points of chunks that no longer exist are deleted. force=True re-embeds
+    everything.
     """
+    if qdrant is None or embedder is None:
+        with ingest_components(qdrant, embedder, collection) as (qdrant, embedder):
+            return ingest_path(path, qdrant, embedder, chunk_size, overlap,
+                               collection, store_text_in_payload, manifest, force, recursive)
+
     p = Path(path)
     if p.is_dir():
         return ingest_folder(str(p), qdrant, embedder, chunk_size, overlap,
-                             collection, store_text_in_payload)
+                             collection, store_text_in_payload, manifest, force, recursive=recursive)
 
-    # parse file to text
+    own_manifest = manifest is None
+    manifest = manifest if manifest is not None else get_manifest()
     try:
-        text = parse_file(str(p))
-    except Exception as e:
-        print(f"[ingest] Failed to parse {path}: {e}")
+        with text_store_for(qdrant.collection, store_text_in_payload) as text_store:
+            return _ingest_file(p, qdrant, embedder, chunk_size, overlap,
+                                store_text_in_payload, manifest, force, text_store)
+    finally:
+        if own_manifest:
+            manifest.compact()
+
+def plan_file(p, collection, manifest, force=False):
+    """
+    Decide whether file `p` needs (re-)ingestion. Returns None to skip it, else
+    (abs_path, stat, content_hash, manifest record or None).
+    """
+    abs_path = str(p.resolve())
+    stat = p.stat()
+    if not force and manifest.is_unchanged(collection, abs_path, stat):
+        print(f"[ingest] Unchanged, skipped {p.name}")
+        return None
+    content_hash = file_hash(abs_path)
+    record = manifest.get(collection, abs_path)
+    if not force and record is not None and record["hash"] == content_hash:
+        # touched but not modified: refresh size/mtime so the cheap check hits next time
+        manifest.set(collection, abs_path, stat.st_size, stat.st_mtime, content_hash, record["point_ids"])
+        print(f"[ingest] Unchanged, skipped {p.name}")
+        return None
+    return abs_path, stat, content_hash, record
+
+class ChunkDiff:
+    """
+    Assigns point ids to a file's chunks as they stream out of the chunker and
+    tells which ones need embedding (new or edited since the manifest record).
+    With a DedupIndex (ingestion/dedup.py), new chunks that duplicate an
+    existing point are recorded as its aliases instead of being embedded.
+    """
+    def __init__(self, abs_path, record, force=False, dedup=None, source=None):
+        self.abs_path = abs_path
+        self.source = source or os.path.basename(abs_path)
+        self.previous = set(record["point_ids"]) if record is not None else set()
+        self.known = set() if force else self.previous
+        self.dedup = dedup
+        self.ids = []
+        self._current = set()
+        self.todo = 0
+        self.duplicates = 0
+
+    def add(self, text, meta=None):
+        """
+        Record the next chunk; returns its index if it needs embedding, else None.
+        meta is the chunker's dict for the chunk, which its payload is built
+        from; a canonical point's "aliases" are added to it in place.
+        """
+        index = len(self.ids)
+        pid = point_id(self.abs_path, index, text)
+        self.ids.append(pid)
+        self._current.add(pid)
+        if pid in self.known:
+            return None
+        if self.dedup is not None:
+            if meta is None:
+                meta = {}
+            ref = {"source": self.source, "abs_path": self.abs_path, "chunk_index": index}
+            ref.update({k: meta[k] for k in ("page", "page_end", "rows", "sheet") if k in meta})
+            # table rows look alike while holding different values: exact matches only
+            if self.dedup.check(pid, text, ref, self.eligible, near="rows" not in meta) is not None:
+                self.duplicates += 1
+                return None
+            if DEDUP_MODE == "alias":
+                aliases = self.dedup.aliases(pid)
+                if aliases:
+                    meta["aliases"] = aliases   # re-embedded canonical point keeps its aliases
+        self.todo += 1
+        return index
+
+    def eligible(self, canonical):
+        # this file's own superseded chunks are about to be deleted: never alias to them
+        return canonical not in self.previous or canonical in self._current
+
+    def stale(self):
+        return self.previous - self._current
+
+def build_payload(p, abs_path, chunk_index, text, store_text_in_payload=True, meta=None):
+    payload = {
+        "source": p.name,
+        "abs_path": abs_path,
+        "chunk_index": chunk_index,
+    }
+    if meta:
+        payload.update(meta)   # e.g. page / page_end for PDFs
+    if store_text_in_payload:
+        payload["text"] = text
+    else:
+        # text lives in the chunk text store (vectorstore/chunk_store.py) under the point id
+        payload["text_pointer"] = {"file": abs_path, "chunk_index": chunk_index}
+    return payload
+
+def finalize_file(qdrant, manifest, abs_path, stat, content_hash, ids, stale, dedup=None, text_store=None):
+    """Call once the file's new points are written: drop stale points and record the file."""
+    if stale:
+        qdrant.delete(list(stale))
+        if text_store is not None:
+            text_store.delete(stale)
+        if dedup is not None:
+            requeue_orphans(manifest, qdrant.collection, dedup.remove(stale), abs_path)
+    manifest.set(qdrant.collection, abs_path, stat.st_size, stat.st_mtime, content_hash, ids)
+
+def requeue_orphans(manifest, collection, paths, current=None):
+    """Files whose duplicate chunks pointed at deleted points: forget them so they are re-ingested (by this run if it has not reached them yet, else the next)."""
+    for path in paths:
+        if path != current and manifest.remove(collection, path) is not None:
+            print(f"[ingest] {os.path.basename(path)} had duplicates of removed chunks; queued for re-ingestion")
+
+def _ingest_file(p, qdrant, embedder, chunk_size, overlap, store_text_in_payload, manifest, force, text_store=None):
+    plan = plan_file(p, qdrant.collection, manifest, force)
+    if plan is None:
         return 0
+    abs_path, stat, content_hash, record = plan
+    dedup = get_dedup_index(qdrant.collection)
+    diff = ChunkDiff(abs_path, record, force, dedup, p.name)
+
+    # parse -> chunk -> embed stream segment by segment (PDF pages), so only one
+    # batch of chunks is in memory. Embedding goes in batches (a ParallelEmbedder
+    # wants larger ones to feed its workers); upserts go out in the background so
+    # the next batch embeds meanwhile
+    batch_size = getattr(embedder, "preferred_batch_size", 64)
+    chunker = chunker_for(embedder, chunk_size, overlap)
+    writer = BulkWriter(qdrant)
+    batch = []
+
+    def flush():
+        qdrant.create_collection(vector_size=embedder.dimension)
+        texts = [c for _, c, _ in batch]
+        vectors = embedder.embed_array(texts)
+        payloads = [build_payload(p, abs_path, i, c, store_text_in_payload, meta) for i, c, meta in batch]
+        ids = [diff.ids[i] for i, _, _ in batch]
+        if text_store is not None and not store_text_in_payload:
+            text_store.put_many(ids, texts)
+        writer.add_many(ids, vectors, payloads, texts)   # texts feed the store's BM25 sparse index
+        batch.clear()
 
-    if not text or not text.strip():
-        print(f"[ingest] No text extracted from {path}")
+    try:
+        for text, meta in chunker(iter_segments(str(p), content_hash)):
+            index = diff.add(text, meta)
+            if index is not None:
+                batch.append((index, text, meta))
+                if len(batch) >= batch_size:
+                    flush()
+        if batch:
+            flush()
+        writer.close()
+    except Exception as e:
+        writer.abort()
+        print(f"[ingest] Failed to ingest {p}: {e}")
         return 0
 
-    chunks = chunk_text(text, chunk_size=chunk_size, overlap=overlap, prefer_sentence_boundary=True)
-
-    # embed and upsert in batches
-    batch_size = 64
-    total = 0
-    qdrant.create_collection(vector_size=embedder.model.get_sentence_embedding_dimension() if hasattr(embedder.model, "get_sentence_embedding_dimension") else 384)
-    for i in range(0, len(chunks), batch_size):
-        batch_chunks = chunks[i:i+batch_size]
-        vectors = embedder.embed_texts(batch_chunks)
-        ids = [str(uuid.uuid4()) for _ in batch_chunks]
-        payloads = []
-        for j, chunk_text_ in enumerate(batch_chunks):
-            payload = {
-                "source": p.name,
-                "abs_path": str(p.resolve()),
-                "chunk_index": i + j,
-            }
-            if store_text_in_payload:
-                payload["text"] = chunk_text_
-            else:
-                # alternatively store pointer to file + chunk index (you can store external S3 key)
-                payload["text_pointer"] = {"file": str(p.resolve()), "chunk_index": i + j}
-            payloads.append(payload)
-        qdrant.upsert(ids, vectors, payloads)
-        total += len(ids)
-
-    print(f"[ingest] Inserted {total} chunks from {p.name}")
-    return total
-
-def ingest_folder(folder_path, qdrant: QdrantWrapper, embedder: EmbeddingClient,
+    if not diff.ids:
+        print(f"[ingest] No text extracted from {p}")
+
+    # drop stale points only once their replacements are written
+    stale = diff.stale()
+    if text_store is not None:
+        text_store.flush()
+    finalize_file(qdrant, manifest, abs_path, stat, content_hash, diff.ids, stale, dedup, text_store)
+    if dedup is not None:
+        dedup.written(diff.ids)
+        dedup.apply_payloads(qdrant)
+        dedup.save()
+
+    stats = writer.stats()
+    print(f"[ingest] Inserted {stats['points']} chunks from {p.name} "
+          f"({len(diff.ids) - diff.todo - diff.duplicates} unchanged, {diff.duplicates} duplicates, "
+          f"{len(stale)} stale removed, "
+          f"{stats['points_per_sec']:.0f} points/sec)")
+    return stats["points"]
+
+def prune_missing(folder_path, qdrant, manifest, recursive=False, dedup=None, text_store=None):
+    """Delete points of manifest files under folder_path that no longer exist. Returns files pruned."""
+    folder = os.path.abspath(folder_path)
+    pruned = 0
+    for abs_path in manifest.paths(qdrant.collection, under=folder):
+        if not recursive and os.path.dirname(abs_path) != folder:
+            continue
+        if os.path.exists(abs_path):
+            continue
+        record = manifest.remove(qdrant.collection, abs_path)
+        if record and record["point_ids"]:
+            qdrant.delete(record["point_ids"])
+            if text_store is not None:
+                text_store.delete(record["point_ids"])
+            if dedup is not None:
+                requeue_orphans(manifest, qdrant.collection, dedup.remove(record["point_ids"]))
+        print(f"[ingest] Removed {len(record['point_ids']) if record else 0} points of deleted file {abs_path}")
+        pruned += 1
+    return pruned
+
+def ingest_folder(folder_path, qdrant: QdrantWrapper = None, embedder: EmbeddingClient = None,
                   chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP,
-                  collection=None, store_text_in_payload=True):
+                  collection=None, store_text_in_payload=True, manifest=None, force=False,
+                  recursive=False, include=None, exclude=None, max_depth=None, max_file_size=None):
     """
-    Ingest all supported files in a folder (non-recursive).
+    Ingest all supported files in a folder through the staged
+    IngestionPipeline (ingestion/pipeline.py). Missing qdrant/embedder are
+    leased from the model registry once for the whole folder. Files recorded in the manifest that were removed from the
+    folder have their points deleted.
+
+    recursive: walk subdirectories (ingestion/discovery.py); files are fed to
+        the pipeline as they are discovered
+    include / exclude: glob patterns matched against the path relative to the
+        folder or the file name, e.g. include=["*.pdf"], exclude=[".git", "drafts/*"]
+    max_depth: subdirectory levels to descend when recursive (None = unlimited)
+    max_file_size: skip files larger than this many bytes (default INGEST_MAX_FILE_MB)
     """
+    if qdrant is None or embedder is None:
+        with ingest_components(qdrant, embedder, collection) as (qdrant, embedder):
+            return ingest_folder(folder_path, qdrant, embedder, chunk_size, overlap,
+                                 collection, store_text_in_payload, manifest, force,
+                                 recursive, include, exclude, max_depth, max_file_size)
+
     p = Path(folder_path)
     if not p.exists():
         print("Folder not found:", folder_path)
         return 0
-    total_chunks = 0
-    for child in p.iterdir():
-        if child.is_file() and child.suffix.lower() in EXT_TO_PARSER:
-            try:
-                total_chunks += ingest_path(str(child), qdrant, embedder, chunk_size, overlap,
-                                            collection, store_text_in_payload)
-            except Exception as e:
-                print(f"Error ingesting {child}: {e}")
+    if max_file_size is None and INGEST_MAX_FILE_MB > 0:
+        max_file_size = int(INGEST_MAX_FILE_MB * 1024 * 1024)
+    own_manifest = manifest is None
+    manifest = manifest if manifest is not None else get_manifest()
+    # files stream through the staged parse/chunk/embed/upsert pipeline
+    from .pipeline import IngestionPipeline
+    files = discover_files(str(p), recursive=recursive, include=include, exclude=exclude,
+                           max_depth=max_depth, max_size=max_file_size, extensions=EXT_TO_PARSER)
+    try:
+        with text_store_for(qdrant.collection, store_text_in_payload) as text_store:
+            pipeline = IngestionPipeline(qdrant, embedder, chunk_size, overlap,
+                                         store_text_in_payload=store_text_in_payload,
+                                         manifest=manifest, force=force, text_store=text_store)
+            # prune first: files holding duplicates of a deleted file's chunks are
+            # dropped from the manifest and so get re-ingested by this same run
+            prune_missing(str(p), qdrant, manifest, recursive=recursive,
+                          dedup=pipeline.dedup, text_store=text_store)
+            total_chunks = pipeline.run(files)
+    finally:
+        files.close()
+        if own_manifest:
+            manifest.compact()
     return total_chunks
@@ -0,0 +1,166 @@
+# ingestion/manifest.py
+"""
+Persistent ingestion manifest and deterministic point IDs.
+
+The manifest records, per collection and absolute file path, the file's
+size, mtime, content hash and the ordered point IDs of its chunks. Point IDs
+are uuid5(abs path, chunk index, chunk text hash), so re-ingesting an
+unchanged chunk maps onto the same point and only new or edited chunks need
+embedding; IDs that disappear from a file are the stale points to delete.
+
+On disk the manifest is a JSON snapshot plus an append-only journal
+(<path>.journal, one JSON line per changed file). save() appends only the
+records changed since the last save, so checkpoints during a large run cost
+what changed, not the whole manifest; compact() folds the journal into a new
+snapshot (at the end of a run, or once the journal outgrows the snapshot).
+"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+
+from config.settings import INGEST_MANIFEST_PATH
+
+_POINT_NAMESPACE = uuid.UUID("6f1c1a5e-3d2b-5c4e-9a7f-2b8e4d6c1f30")
+_COMPACT_MIN_OPS = 1000   # journal lines before save() considers compacting
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def file_hash(path, block_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def point_id(abs_path, chunk_index, text):
+    return str(uuid.uuid5(_POINT_NAMESPACE, f"{abs_path}\0{chunk_index}\0{text_hash(text)}"))
+
+
+class IngestManifest:
+    def __init__(self, path=INGEST_MANIFEST_PATH):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self._lock = threading.Lock()      # guards _data and _pending
+        self._io_lock = threading.Lock()   # one writer of the files at a time
+        self._data = {}      # collection -> abs_path -> record
+        self._pending = []   # journal entries not yet written
+        self._journal_ops = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self._data = json.load(f)
+        self._replay_journal()
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        good = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    break
+                self._apply(op)
+                self._journal_ops += 1
+                good += len(line)
+        if good != os.path.getsize(self.journal_path):
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(good)   # torn final write: later appends start on a clean line
+
+    def _apply(self, op):
+        records = self._data.setdefault(op["collection"], {})
+        if op.get("record") is None:
+            records.pop(op["path"], None)
+        else:
+            records[op["path"]] = op["record"]
+
+    def get(self, collection, abs_path):
+        with self._lock:
+            return self._data.get(collection, {}).get(abs_path)
+
+    def set(self, collection, abs_path, size, mtime, content_hash, point_ids):
+        with self._lock:
+            record = {
+                "size": size,
+                "mtime": mtime,
+                "hash": content_hash,
+                "chunk_count": len(point_ids),
+                "point_ids": list(point_ids),
+            }
+            self._data.setdefault(collection, {})[abs_path] = record
+            self._pending.append({"collection": collection, "path": abs_path, "record": record})
+
+    def remove(self, collection, abs_path):
+        with self._lock:
+            record = self._data.get(collection, {}).pop(abs_path, None)
+            if record is not None:
+                self._pending.append({"collection": collection, "path": abs_path, "record": None})
+            return record
+
+    def paths(self, collection, under=None):
+        """Recorded file paths for a collection, optionally only those below directory `under`."""
+        with self._lock:
+            paths = list(self._data.get(collection, {}))
+        if under is None:
+            return paths
+        prefix = os.path.join(os.path.abspath(under), "")
+        return [p for p in paths if p.startswith(prefix)]
+
+    def is_unchanged(self, collection, abs_path, stat):
+        """Cheap check: same size and mtime as recorded."""
+        record = self.get(collection, abs_path)
+        return record is not None and record["size"] == stat.st_size and record["mtime"] == stat.st_mtime
+
+    def save(self):
+        """Append the changes since the last save to the journal; compacts once it outgrows the snapshot."""
+        with self._io_lock:
+            with self._lock:
+                ops, self._pending = self._pending, []
+                records = sum(len(r) for r in self._data.values())
+            if ops:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.journal_path, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(op) + "\n" for op in ops))
+                self._journal_ops += len(ops)
+            if self._journal_ops > max(_COMPACT_MIN_OPS, records):
+                self._compact()
+
+    def compact(self):
+        """Write the whole manifest as a new snapshot and empty the journal."""
+        with self._io_lock:
+            with self._lock:
+                changed = bool(self._pending)
+            if changed or self._journal_ops:
+                self._compact()
+
+    def _compact(self):
+        with self._lock:
+            self._pending = []   # the snapshot includes them
+            text = json.dumps(self._data)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, self.path)
+        # a crash before this line replays journal entries already in the snapshot: harmless
+        open(self.journal_path, "w").close()
+        self._journal_ops = 0
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_manifest():
+    """Process-wide manifest at INGEST_MANIFEST_PATH."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = IngestManifest()
+        return _default
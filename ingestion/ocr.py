@@ -0,0 +1,237 @@
+# ingestion/ocr.py
+"""
+OCR subsystem: preprocessing, a Tesseract process pool and a result cache.
+
+  preprocess()  optional grayscale, resampling to OCR_TARGET_DPI (when the
+                image records its DPI), a OCR_MAX_SIDE pixel cap and Otsu
+                binarization; Tesseract is told the resulting DPI
+  OCRCache      OCR text on disk, keyed by blake2b(image file bytes, page,
+                OCR settings), so re-ingesting an unchanged image never
+                re-runs Tesseract
+  ocr_pages()   multi-page TIFFs are read frame by frame; cache misses are
+                OCR'd in a spawn process pool of OCR_WORKERS
+
+The ingestion pipeline runs parse_image_range() inside its own parse
+workers (page ranges of large TIFFs spread across them), so the pool here
+is only used by in-process callers such as ingest_path / parse_image.
+"""
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+from PIL import Image
+import pytesseract
+
+from config.settings import (
+    OCR_BINARIZE,
+    OCR_CACHE_DIR,
+    OCR_CACHE_ENABLED,
+    OCR_GRAYSCALE,
+    OCR_LANG,
+    OCR_MAX_SIDE,
+    OCR_PAGES_PER_TASK,
+    OCR_TARGET_DPI,
+    OCR_WORKERS,
+)
+
+
+def ocr_options(lang=None):
+    """Everything that changes OCR output; part of the cache key."""
+    return {
+        "lang": lang or OCR_LANG or None,
+        "grayscale": OCR_GRAYSCALE,
+        "binarize": OCR_BINARIZE,
+        "target_dpi": OCR_TARGET_DPI,
+        "max_side": OCR_MAX_SIDE,
+    }
+
+
+# ---- preprocessing ----
+def _otsu_threshold(gray):
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = total - weight_bg
+    mean_bg = np.cumsum(hist * levels)
+    mean_all = mean_bg[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (mean_all * weight_bg / total - mean_bg) ** 2 / (weight_bg * weight_fg)
+    between = np.nan_to_num(between, nan=0.0, posinf=0.0)
+    if not between.any():
+        return 128   # flat image: nothing to separate
+    return int(np.argmax(between))
+
+
+def preprocess(img, grayscale=True, binarize=False, target_dpi=300, max_side=0):
+    """Return (image, dpi) ready for Tesseract; dpi is None when unknown."""
+    if img.mode not in ("L", "RGB"):
+        img = img.convert("RGB")
+    if grayscale or binarize:
+        img = img.convert("L")
+
+    dpi = img.info.get("dpi", (None,))[0]
+    scale = 1.0
+    if target_dpi and dpi:
+        scale = float(target_dpi) / float(dpi)
+    if max_side and max(img.size) * scale > max_side:
+        scale = float(max_side) / max(img.size)
+    if abs(scale - 1.0) > 0.05:
+        size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        img = img.resize(size, Image.LANCZOS if scale < 1 else Image.BICUBIC)
+        if dpi:
+            dpi = float(dpi) * scale
+
+    if binarize:
+        gray = np.asarray(img, dtype=np.uint8)
+        img = Image.fromarray(np.where(gray > _otsu_threshold(gray), 255, 0).astype(np.uint8))
+    return img, (int(round(dpi)) if dpi else None)
+
+
+def ocr_image(img, options):
+    img, dpi = preprocess(img, options["grayscale"], options["binarize"],
+                          options["target_dpi"], options["max_side"])
+    config = f"--dpi {dpi}" if dpi else ""
+    if options["lang"]:
+        return pytesseract.image_to_string(img, lang=options["lang"], config=config)
+    return pytesseract.image_to_string(img, config=config)
+
+
+# ---- cache ----
+def image_hash(path, block_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class OCRCache:
+    """One small text file per (image hash, page, options) under cache_dir; safe across processes."""
+
+    def __init__(self, cache_dir=OCR_CACHE_DIR):
+        self.dir = cache_dir
+
+    @staticmethod
+    def key(content_hash, page, options):
+        sig = "|".join(f"{k}={options[k]}" for k in sorted(options))
+        return hashlib.blake2b(f"{content_hash}\0{page}\0{sig}".encode("utf-8"), digest_size=16).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.dir, key[:2], f"{key}.txt")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key, text):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+
+
+def _cache():
+    return OCRCache() if OCR_CACHE_ENABLED else None
+
+
+# ---- pages ----
+def image_page_count(path):
+    with Image.open(path) as img:
+        return getattr(img, "n_frames", 1)
+
+
+def image_page_ranges(path, pages_per_task=OCR_PAGES_PER_TASK):
+    count = image_page_count(path)
+    step = max(1, int(pages_per_task))
+    return [(start, min(start + step, count)) for start in range(0, count, step)]
+
+
+def _ocr_frame(path, page, options):
+    with Image.open(path) as img:
+        img.seek(page - 1)
+        return ocr_image(img.copy(), options)
+
+
+def parse_image_range(path, start=0, stop=None, lang=None, content_hash=None):
+    """
+    OCR pages [start, stop) of an image serially in this process; returns
+    [(page_number, text)]. content_hash: the file's image_hash() when the
+    caller already has it (ingestion's manifest hash is the same digest), so
+    each page range does not re-read the whole file.
+    """
+    options = ocr_options(lang)
+    cache = _cache()
+    if cache is not None and content_hash is None:
+        content_hash = image_hash(path)
+    out = []
+    with Image.open(path) as img:
+        count = getattr(img, "n_frames", 1)
+        for index in range(start, count if stop is None else min(stop, count)):
+            page = index + 1
+            key = OCRCache.key(content_hash, page, options) if cache is not None else None
+            text = cache.get(key) if cache is not None else None
+            if text is None:
+                img.seek(index)   # only decode frames that miss the cache
+                text = ocr_image(img.copy(), options)
+                if cache is not None:
+                    cache.set(key, text)
+            out.append((page, text))
+    return out
+
+
+def ocr_pages(path, lang=None, workers=OCR_WORKERS, content_hash=None):
+    """
+    Yield (page_number, text) for every page of an image in page order.
+    Cached pages are answered without Tesseract; the rest are OCR'd in a
+    process pool (at most 2 * workers pages in flight) when there is more
+    than one, else in this process.
+    """
+    options = ocr_options(lang)
+    cache = _cache()
+    if cache is not None and content_hash is None:
+        content_hash = image_hash(path)
+    count = image_page_count(path)
+    keys = {}
+    todo = []
+    for page in range(1, count + 1):
+        if cache is not None:
+            keys[page] = OCRCache.key(content_hash, page, options)
+            if cache.get(keys[page]) is not None:
+                continue
+        todo.append(page)
+
+    missing = set(todo)
+    pool = None
+    if workers > 1 and len(todo) > 1:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(todo)), mp_context=get_context("spawn"))
+    try:
+        queued = deque(todo)
+        pending = {}
+        for page in range(1, count + 1):
+            while pool is not None and queued and len(pending) < 2 * workers:
+                p = queued.popleft()
+                pending[p] = pool.submit(_ocr_frame, path, p, options)
+            text = None
+            if page in pending:
+                text = pending.pop(page).result()
+            elif cache is not None:
+                text = cache.get(keys[page])
+            if text is None:  # serial OCR, or a cache entry vanished since the lookup
+                text = _ocr_frame(path, page, options)
+            if cache is not None and page in missing:
+                cache.set(keys[page], text)
+            yield page, text
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
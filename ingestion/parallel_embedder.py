@@ -0,0 +1,133 @@
+# ingestion/parallel_embedder.py
+"""
+Multi-process embedding backend for bulk ingestion.
+
+ParallelEmbedder wraps an in-process EmbeddingClient (which keeps owning the
+embedding cache) and sends cache misses to a pool of worker processes, each
+holding its own model copy. Texts are sorted by token count and cut into
+batches so chunks of similar length are encoded together, which keeps
+padding waste low; results come back in input order. It exposes the same embed_array /
+embed_texts / dimension surface as EmbeddingClient, so ingest_path accepts
+either.
+"""
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config.settings import (
+    INGEST_EMBED_BATCH_SIZE,
+    INGEST_EMBED_WORKERS,
+    INGEST_EMBED_WORKER_MEMORY_MB,
+)
+from .chunker import own_tokenizer
+
+_worker_client = None
+
+
+def _worker_init(model_name, backend, threads):
+    global _worker_client
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from embeddings import EmbeddingClient
+    _worker_client = EmbeddingClient(model_name, use_cache=False, backend=backend)
+
+
+def _worker_encode(texts):
+    return _worker_client.embed_array(texts)
+
+
+def default_workers(memory_mb=INGEST_EMBED_WORKER_MEMORY_MB):
+    """Number of worker processes that fit both the cores and the RAM."""
+    cores = os.cpu_count() or 1
+    try:
+        total_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+        by_memory = max(1, int(total_mb * 0.5) // max(1, memory_mb))
+    except (ValueError, OSError, AttributeError):
+        by_memory = cores
+    return max(1, min(cores, by_memory))
+
+
+def resolve_workers(workers=INGEST_EMBED_WORKERS):
+    if isinstance(workers, str):
+        workers = default_workers() if workers.strip().lower() == "auto" else int(workers)
+    return max(0, int(workers))
+
+
+def length_buckets(texts, batch_size, tokenizer=None):
+    """
+    Split indices of `texts` into batches of similar token count (longest
+    first); padding is in tokens, so characters are only the fallback when
+    there is no tokenizer.
+    """
+    if tokenizer is not None:
+        lengths = [len(ids) for ids in tokenizer(list(texts), add_special_tokens=False)["input_ids"]]
+    else:
+        lengths = [len(t) for t in texts]
+    order = np.argsort([-n for n in lengths], kind="stable")
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+class ParallelEmbedder:
+    def __init__(self, embedder, workers=INGEST_EMBED_WORKERS, batch_size=INGEST_EMBED_BATCH_SIZE):
+        """
+        embedder: in-process EmbeddingClient; used for the cache, for the
+        dimension and as the single-process fallback (workers <= 1).
+        """
+        self.embedder = embedder
+        self.model_name = embedder.model_name
+        self.workers = resolve_workers(workers)
+        self.batch_size = max(1, int(batch_size))
+        # length_buckets() tokenizes on the embed thread: a copy, not the model's instance
+        self._bucket_tokenizer = own_tokenizer(embedder.tokenizer)
+        self._pool = None
+        if self.workers > 1:
+            threads = max(1, (os.cpu_count() or 1) // self.workers)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_worker_init,
+                initargs=(self.model_name, embedder.backend, threads),
+            )
+
+    @property
+    def dimension(self):
+        return self.embedder.dimension
+
+    @property
+    def tokenizer(self):
+        return self.embedder.tokenizer
+
+    @property
+    def max_seq_length(self):
+        return self.embedder.max_seq_length
+
+    @property
+    def preferred_batch_size(self):
+        """How many texts a caller should hand over per call to keep all workers busy."""
+        return self.batch_size * max(1, self.workers) * 2
+
+    def encode(self, texts):
+        if self._pool is None or len(texts) <= self.batch_size:
+            return self.embedder.encode(texts)
+        out = np.empty((len(texts), self.dimension), dtype=np.float32)
+        buckets = length_buckets(texts, self.batch_size, self._bucket_tokenizer)
+        futures = [self._pool.submit(_worker_encode, [texts[i] for i in idx]) for idx in buckets]
+        for idx, fut in zip(buckets, futures):
+            out[idx] = fut.result()
+        return out
+
+    def embed_array(self, texts):
+        return self.embedder.cached_embed(texts, self.encode)
+
+    def embed_texts(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
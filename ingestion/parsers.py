@@ -0,0 +1,89 @@
+# ingestion/parsers.py
+# Extension -> parser table. Kept free of model/vector-store imports so parse
+# worker processes stay light.
+#
+# Besides parse_file (whole file -> string), files can be parsed as a stream
+# of (text, meta) segments: PDFs and multi-page TIFFs yield one segment per
+# page with meta {"page": n}, CSV/Excel files row-group segments
+# (ingestion/tabular.py), everything else a single segment with empty meta.
+# Tabular files are "streamed": read block by block in the calling process
+# instead of being handed to a parse worker whole.
+from pathlib import Path
+from .txt_parser import parse_txt
+from .pdf_parser import parse_pdf, parse_pdf_pages, iter_pdf_pages, pdf_page_ranges
+from .csv_parser import parse_csv, iter_csv_segments
+from .xlsx_parser import parse_xlsx, iter_xlsx_segments
+from .image_parser import parse_image
+from .ocr import image_page_ranges, ocr_pages, parse_image_range
+
+EXT_TO_PARSER = {
+    ".txt": parse_txt,
+    ".pdf": parse_pdf,
+    ".csv": parse_csv,
+    ".xlsx": parse_xlsx,
+    ".xls": parse_xlsx,
+    ".png": parse_image,
+    ".jpg": parse_image,
+    ".jpeg": parse_image,
+    ".tif": parse_image,
+    ".tiff": parse_image,
+}
+
+def parse_file(path):
+    ext = Path(path).suffix.lower()
+    parser = EXT_TO_PARSER.get(ext)
+    if not parser:
+        raise ValueError(f"No parser for extension: {ext}")
+    # image parser may need different signature; we keep it simple
+    return parser(path)
+
+STREAMED_EXTS = {".csv", ".xlsx", ".xls"}
+PAGED_IMAGE_EXTS = {".tif", ".tiff"}
+IMAGE_EXTS = {".png", ".jpg", ".jpeg"} | PAGED_IMAGE_EXTS
+
+def _image_meta(ext, page):
+    return {"page": page} if ext in PAGED_IMAGE_EXTS else {}
+
+def is_streamed(path):
+    return Path(path).suffix.lower() in STREAMED_EXTS
+
+def parse_units(path):
+    """Independently parseable (start, stop) units of a file: page ranges for PDFs and TIFFs, one unit otherwise."""
+    ext = Path(path).suffix.lower()
+    if ext == ".pdf":
+        return pdf_page_ranges(path)
+    if ext in PAGED_IMAGE_EXTS:
+        return image_page_ranges(path)
+    return [(None, None)]
+
+def parse_segments(path, start=None, stop=None, content_hash=None):
+    """
+    Parse one unit from parse_units() into a list of (text, meta) segments.
+    content_hash: the file's blake2b digest, if known (keys the OCR cache).
+    """
+    ext = Path(path).suffix.lower()
+    if ext == ".pdf":
+        return [(txt, {"page": n}) for n, txt in iter_pdf_pages(path, start or 0, stop)]
+    if ext in IMAGE_EXTS:
+        return [(txt, _image_meta(ext, n))
+                for n, txt in parse_image_range(path, start or 0, stop, content_hash=content_hash)]
+    return [(parse_file(path), {})]
+
+def iter_segments(path, content_hash=None):
+    """Stream a whole file as (text, meta) segments; large PDFs are parsed in parallel page ranges."""
+    ext = Path(path).suffix.lower()
+    if ext == ".pdf":
+        for n, txt in parse_pdf_pages(path):
+            yield txt, {"page": n}
+        return
+    if ext in IMAGE_EXTS:
+        for n, txt in ocr_pages(path, content_hash=content_hash):
+            yield txt, _image_meta(ext, n)
+        return
+    if ext == ".csv":
+        yield from iter_csv_segments(path)
+        return
+    if ext in (".xlsx", ".xls"):
+        yield from iter_xlsx_segments(path)
+        return
+    yield parse_file(path), {}
@@ -1,17 +1,76 @@
 # ingestion/pdf_parser.py
+"""
+PDF text extraction, one page at a time.
+
+iter_pdf_pages() yields (page_number, text) and releases each page's parsed
+layout objects before moving to the next, so memory stays flat however long
+the document is. Large files can be cut into page ranges (pdf_page_ranges)
+that are parsed in separate processes: parse_pdf_pages() does this for
+in-process callers, and IngestionPipeline submits the ranges to its own
+parse pool.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
 import pdfplumber
 
-def parse_pdf(path):
-    """
-    Extract text from each page and return a single combined string.
-    You can also return page-wise texts if you want to store page metadata.
-    """
-    texts = []
+from config.settings import INGEST_PARSE_WORKERS, PDF_PAGES_PER_TASK
+
+
+def _release(page):
+    # pdfplumber caches chars/objects per page; drop them once the text is out
+    close = getattr(page, "close", None) or getattr(page, "flush_cache", None)
+    if close is not None:
+        close()
+
+
+def pdf_page_count(path):
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def iter_pdf_pages(path, start=0, stop=None):
+    """Yield (page_number, text) for pages [start, stop); bounds are 0-based, page numbers 1-based."""
     with pdfplumber.open(path) as pdf:
-        for i, page in enumerate(pdf.pages):
+        for offset, page in enumerate(pdf.pages[start:stop]):
             try:
                 txt = page.extract_text() or ""
             except Exception:
                 txt = ""
-            texts.append(txt)
-    return "\n\n".join(texts)
+            _release(page)
+            yield start + offset + 1, txt
+
+
+def pdf_page_ranges(path, pages_per_task=PDF_PAGES_PER_TASK):
+    """Split a PDF into (start, stop) page ranges of at most pages_per_task pages."""
+    count = pdf_page_count(path)
+    step = max(1, int(pages_per_task))
+    return [(start, min(start + step, count)) for start in range(0, count, step)]
+
+
+def parse_pdf_range(path, start, stop):
+    return list(iter_pdf_pages(path, start, stop))
+
+
+def parse_pdf_pages(path, workers=INGEST_PARSE_WORKERS, pages_per_task=PDF_PAGES_PER_TASK):
+    """
+    Yield (page_number, text) in page order. Documents longer than two ranges
+    are parsed by `workers` processes, with at most 2 * workers ranges in
+    flight so memory stays bounded.
+    """
+    ranges = deque(pdf_page_ranges(path, pages_per_task))
+    if workers <= 1 or len(ranges) <= 2:
+        yield from iter_pdf_pages(path)
+        return
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        pending = deque()
+        while ranges or pending:
+            while ranges and len(pending) < 2 * workers:
+                pending.append(pool.submit(parse_pdf_range, path, *ranges.popleft()))
+            yield from pending.popleft().result()
+
+
+def parse_pdf(path):
+    """Extract text from each page and return a single combined string."""
+    return "\n\n".join(txt for _, txt in iter_pdf_pages(path))
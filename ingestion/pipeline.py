@@ -0,0 +1,444 @@
+# ingestion/pipeline.py
+"""
+Staged streaming ingestion: parse -> chunk -> embed -> upsert.
+
+  parse   files are parsed in a process pool (at most 2 * workers units in
+          flight); large PDFs are split into page ranges so one document
+          spreads over several workers, and results are handed on in
+          submission order. CSV/Excel files are streamed block by block
+          from the feeding thread instead
+  chunk   one thread chunks the parsed segments of each file as they arrive,
+          diffs them against the manifest and drops duplicate chunks
+          (ingestion/dedup.py)
+  embed   one thread embeds chunk records, batching across files, and
+          writes their text to the chunk text store when payloads omit it
+  upsert  one thread feeds a BulkWriter; files are finalized (stale points
+          deleted, manifest updated) at checkpoints, once their points are
+          acknowledged
+
+Stages are connected by bounded queues, so a slow stage applies
+backpressure to the ones before it and memory stays constant. stats()
+reports per-stage throughput, busy time and queue depth to show which
+stage is the bottleneck.
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from config.settings import (
+    CHUNK_SIZE as DEFAULT_CHUNK_SIZE,
+    CHUNK_OVERLAP as DEFAULT_OVERLAP,
+    INGEST_CHECKPOINT_FILES,
+    INGEST_PARSE_WORKERS,
+    INGEST_QUEUE_SIZE,
+)
+from vectorstore.bulk_writer import BulkWriter
+from .chunker import chunker_for
+from .ingest_manager import ChunkDiff, build_payload, finalize_file, plan_file
+from .dedup import get_dedup_index
+from .manifest import get_manifest
+from .parsers import is_streamed, iter_segments, parse_segments, parse_units
+
+_END = object()
+
+
+class _ParseFailed(Exception):
+    pass
+
+
+class _FileJob:
+    __slots__ = ("path", "abs_path", "stat", "content_hash", "record", "diff")
+
+    def __init__(self, path, abs_path, stat, content_hash, record):
+        self.path = path
+        self.abs_path = abs_path
+        self.stat = stat
+        self.content_hash = content_hash
+        self.record = record
+        self.diff = None
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.max_queue = 0
+        self._lock = threading.Lock()
+
+    def record(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.busy += seconds
+
+
+class _BoundedQueue(queue.Queue):
+    """queue.Queue that remembers its deepest point for the stage report."""
+
+    def __init__(self, maxsize, stats):
+        super().__init__(maxsize)
+        self.stats = stats
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        depth = self.qsize()
+        if depth > self.stats.max_queue:
+            self.stats.max_queue = depth
+
+
+class IngestionPipeline:
+    def __init__(self, qdrant, embedder, chunk_size=DEFAULT_CHUNK_SIZE, overlap=DEFAULT_OVERLAP,
+                 store_text_in_payload=True, manifest=None, force=False,
+                 parse_workers=INGEST_PARSE_WORKERS, queue_size=INGEST_QUEUE_SIZE,
+                 checkpoint_files=INGEST_CHECKPOINT_FILES, dedup=None, text_store=None):
+        self.qdrant = qdrant
+        self.embedder = embedder
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.store_text_in_payload = store_text_in_payload
+        self.manifest = manifest if manifest is not None else get_manifest()
+        self.force = force
+        self.dedup = dedup if dedup is not None else get_dedup_index(qdrant.collection)
+        self.text_store = text_store   # ChunkTextStore: receives chunk text when not stored in payloads
+        self.parse_workers = max(0, int(parse_workers))
+        self.queue_size = max(1, int(queue_size))
+        self.checkpoint_files = max(1, int(checkpoint_files))
+        self.batch_size = getattr(embedder, "preferred_batch_size", 64)
+        self.chunker = chunker_for(embedder, chunk_size, overlap)
+
+        self._stats = {name: StageStats(name) for name in ("parse", "chunk", "embed", "upsert")}
+        self._parsed_q = _BoundedQueue(self.queue_size, self._stats["chunk"])
+        self._chunk_q = _BoundedQueue(self.queue_size, self._stats["embed"])
+        self._vector_q = _BoundedQueue(self.queue_size, self._stats["upsert"])
+        self._errors = []
+        self._collection_ready = False
+        self.files_done = 0
+        self.points = 0
+        self._started = None
+
+    # ---- stage helpers ----
+    def _fail(self, stage, e):
+        print(f"[ingest] {stage} stage failed: {e}")
+        self._errors.append(e)
+
+    def _ensure_collection(self):
+        if not self._collection_ready:
+            self.qdrant.create_collection(vector_size=self.embedder.dimension)
+            self._collection_ready = True
+
+    # ---- stage 1: parse (process pool, driven from the calling thread) ----
+    def _feed(self, paths):
+        if self.parse_workers > 0:
+            pool = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=get_context("spawn"))
+        else:
+            pool = ThreadPoolExecutor(max_workers=1)
+        max_in_flight = max(1, self.parse_workers) * 2
+        pending = deque()
+        try:
+            for path in paths:
+                if self._errors:
+                    break
+                p = Path(path)
+                try:
+                    plan = plan_file(p, self.qdrant.collection, self.manifest, self.force)
+                    units = parse_units(str(p)) if plan is not None else None
+                except Exception as e:
+                    print(f"[ingest] Cannot read {p}: {e}")
+                    continue
+                if plan is None:
+                    continue
+                job = _FileJob(p, *plan)
+                if is_streamed(p):
+                    # tabular files are read block by block right here rather than
+                    # shipped whole to a worker; earlier units go first to keep order
+                    while pending:
+                        self._collect(pending)
+                    self._stream(job)
+                    continue
+                units = units or [(0, 0)]  # e.g. a PDF without pages: still record the file
+                for n, (start, stop) in enumerate(units):
+                    fut = pool.submit(parse_segments, str(p), start, stop, job.content_hash)
+                    pending.append((fut, job, n == len(units) - 1, time.perf_counter()))
+                    while len(pending) >= max_in_flight:
+                        self._collect(pending)
+            while pending:
+                self._collect(pending)
+        finally:
+            pool.shutdown(wait=True)
+            self._parsed_q.put(_END)
+
+    def _collect(self, pending):
+        # oldest first: the units of a file must reach the chunk stage in order
+        fut, job, last, submitted = pending.popleft()
+        try:
+            segments = fut.result()
+        except Exception as e:
+            print(f"[ingest] Failed to parse {job.path}: {e}")
+            segments = None
+        else:
+            self._stats["parse"].record(1, time.perf_counter() - submitted)
+        self._parsed_q.put((job, segments, last))
+
+    def _stream(self, job, batch_size=64):
+        stats = self._stats["parse"]
+        batch = []
+        started = time.perf_counter()
+        try:
+            for segment in iter_segments(str(job.path)):
+                batch.append(segment)
+                if len(batch) >= batch_size:
+                    stats.record(1, time.perf_counter() - started)
+                    self._parsed_q.put((job, batch, False))
+                    batch = []
+                    started = time.perf_counter()
+        except Exception as e:
+            print(f"[ingest] Failed to parse {job.path}: {e}")
+            self._parsed_q.put((job, None, True))
+            return
+        stats.record(1, time.perf_counter() - started)
+        self._parsed_q.put((job, batch, True))
+
+    # ---- stage 2: chunk ----
+    def _file_segments(self, first):
+        """
+        Yield the (text, meta) segments of one file, pulling its remaining
+        units off the queue. If a unit failed to parse, the file's later units
+        are taken off the queue too before _ParseFailed is raised, so none of
+        them is mistaken for the start of the next file.
+        """
+        job, segments, last = first
+        while True:
+            if segments is None:
+                if not last:
+                    self._skip_units()
+                raise _ParseFailed(job.path)
+            yield from segments
+            if last:
+                return
+            item = self._parsed_q.get()
+            if item is _END:
+                self._parsed_q.put(_END)   # for the chunk stage loop
+                raise _ParseFailed(job.path)
+            _, segments, last = item
+
+    def _skip_units(self):
+        """Discard queued units up to and including the current file's last one."""
+        while True:
+            item = self._parsed_q.get()
+            if item is _END:
+                self._parsed_q.put(_END)
+                return
+            if item[2]:
+                return
+
+    def _chunk_stage(self):
+        stats = self._stats["chunk"]
+        while True:
+            item = self._parsed_q.get()
+            if item is _END:
+                self._chunk_q.put(_END)
+                return
+            job = item[0]
+            segments = self._file_segments(item)
+            if self._errors:
+                self._drain(segments)
+                continue
+            started = time.perf_counter()
+            job.diff = ChunkDiff(job.abs_path, job.record, self.force, self.dedup, job.path.name)
+            records = []
+            try:
+                for text, meta in self.chunker(segments):
+                    index = job.diff.add(text, meta)
+                    if index is not None:
+                        records.append((job, index, text, meta))
+                    if len(records) >= self.batch_size:
+                        stats.record(len(records), time.perf_counter() - started)
+                        self._chunk_q.put(records)
+                        records = []
+                        started = time.perf_counter()
+            except _ParseFailed:
+                # partially written points are left for the next run; the file is not recorded
+                self._drain(segments)
+                continue
+            except Exception as e:
+                self._drain(segments)
+                self._fail("chunk", e)
+                continue
+            stats.record(len(records), time.perf_counter() - started)
+            if records:
+                self._chunk_q.put(records)
+            if not job.diff.ids:
+                print(f"[ingest] No text extracted from {job.path}")
+            self._chunk_q.put(job)  # file marker: all its chunk records are ahead of it
+
+    def _drain(self, segments):
+        """Skip the rest of a file's units."""
+        try:
+            for _ in segments:
+                pass
+        except _ParseFailed:
+            pass
+
+    # ---- stage 3: embed ----
+    def _embed_stage(self):
+        stats = self._stats["embed"]
+        buffer, done_jobs = [], []
+
+        def flush():
+            if buffer:
+                started = time.perf_counter()
+                texts = [text for _, _, text, _ in buffer]
+                try:
+                    self._ensure_collection()
+                    vectors = self.embedder.embed_array(texts)
+                except Exception as e:
+                    self._fail("embed", e)
+                    buffer.clear()
+                    done_jobs.clear()
+                    return
+                stats.record(len(buffer), time.perf_counter() - started)
+                ids = [job.diff.ids[i] for job, i, _, _ in buffer]
+                payloads = [build_payload(job.path, job.abs_path, i, text, self.store_text_in_payload, meta)
+                            for job, i, text, meta in buffer]
+                if self.text_store is not None and not self.store_text_in_payload:
+                    self.text_store.put_many(ids, texts)
+                # texts go along for the store's BM25 sparse index
+                self._vector_q.put((ids, vectors, payloads, texts))
+                buffer.clear()
+            for job in done_jobs:
+                self._vector_q.put(job)
+            done_jobs.clear()
+
+        while True:
+            try:
+                item = self._chunk_q.get(timeout=0.05)
+            except queue.Empty:
+                flush()  # nothing else queued: don't hold a partial batch back
+                continue
+            if item is _END:
+                flush()
+                self._vector_q.put(_END)
+                return
+            if self._errors:
+                continue
+            if isinstance(item, _FileJob):
+                done_jobs.append(item)
+            else:
+                buffer.extend(item)
+            if len(buffer) >= self.batch_size:
+                flush()
+
+    # ---- stage 4: upsert ----
+    def _upsert_stage(self):
+        stats = self._stats["upsert"]
+        writer = BulkWriter(self.qdrant)
+        to_finalize = []
+        added = []   # point ids sent since the last checkpoint
+
+        def checkpoint():
+            started = time.perf_counter()
+            writer.checkpoint()
+            if self.dedup is not None:
+                self.dedup.written(added)
+            added.clear()
+            if self.text_store is not None:
+                self.text_store.flush()
+            for job in to_finalize:
+                stale = job.diff.stale()
+                finalize_file(self.qdrant, self.manifest, job.abs_path, job.stat, job.content_hash,
+                              job.diff.ids, stale, self.dedup, self.text_store)
+                self.files_done += 1
+                print(f"[ingest] Inserted {job.diff.todo} chunks from {job.path.name} "
+                      f"({len(job.diff.ids) - job.diff.todo - job.diff.duplicates} unchanged, "
+                      f"{job.diff.duplicates} duplicates, {len(stale)} stale removed)")
+            to_finalize.clear()
+            if self.dedup is not None:
+                # only canonical points acknowledged above get their alias lists; points
+                # of files still in the embed/upsert stages wait for a later checkpoint
+                self.dedup.apply_payloads(self.qdrant)
+                self.dedup.save()
+            self.manifest.save()
+            stats.busy += time.perf_counter() - started
+
+        try:
+            while True:
+                item = self._vector_q.get()
+                if item is _END:
+                    break
+                if self._errors:
+                    continue
+                started = time.perf_counter()
+                try:
+                    if isinstance(item, _FileJob):
+                        to_finalize.append(item)
+                        if len(to_finalize) >= self.checkpoint_files:
+                            checkpoint()
+                    else:
+                        ids, vectors, payloads, texts = item
+                        writer.add_many(ids, vectors, payloads, texts)
+                        added.extend(ids)
+                        stats.record(len(ids), time.perf_counter() - started)
+                except Exception as e:
+                    self._fail("upsert", e)
+            if not self._errors:
+                checkpoint()
+        except Exception as e:
+            self._fail("upsert", e)
+        finally:
+            if self._errors:
+                writer.abort()
+            else:
+                writer.close()
+            self.points = writer.points
+
+    # ---- driver ----
+    def run(self, paths):
+        """Ingest an iterable of file paths; returns the number of chunks inserted."""
+        self._started = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._chunk_stage, name="ingest-chunk", daemon=True),
+            threading.Thread(target=self._embed_stage, name="ingest-embed", daemon=True),
+            threading.Thread(target=self._upsert_stage, name="ingest-upsert", daemon=True),
+        ]
+        for t in threads:
+            t.start()
+        try:
+            self._feed(paths)
+        finally:
+            for t in threads:
+                t.join()
+        print(f"[ingest] {self.report()}")
+        if self._errors:
+            raise RuntimeError(f"ingestion pipeline failed: {self._errors[0]}") from self._errors[0]
+        return self.points
+
+    def stats(self):
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        queues = {"chunk": self._parsed_q, "embed": self._chunk_q, "upsert": self._vector_q}
+        out = {"elapsed": elapsed, "files": self.files_done, "points": self.points, "stages": {}}
+        for name, st in self._stats.items():
+            q = queues.get(name)
+            out["stages"][name] = {
+                "items": st.items,
+                "busy_seconds": st.busy,
+                "items_per_sec": st.items / st.busy if st.busy else 0.0,
+                "utilization": st.busy / elapsed if elapsed else 0.0,
+                "queue_depth": q.qsize() if q is not None else None,
+                "max_queue_depth": st.max_queue if q is not None else None,
+            }
+        return out
+
+    def report(self):
+        s = self.stats()
+        parts = []
+        for name, st in s["stages"].items():
+            part = f"{name}: {st['items']} in {st['busy_seconds']:.1f}s ({st['items_per_sec']:.0f}/s)"
+            if st["max_queue_depth"] is not None:
+                part += f" max queue {st['max_queue_depth']}/{self.queue_size}"
+            parts.append(part)
+        return (f"pipeline: {s['files']} files, {s['points']} points in {s['elapsed']:.1f}s | "
+                + " | ".join(parts))
@@ -0,0 +1,87 @@
+# ingestion/tabular.py
+"""
+Shared row formatting for the CSV / Excel parsers.
+
+Rows are rendered column-wise with vectorized pandas string ops (no
+iterrows / per-cell f-strings) and grouped into row-group segments of
+`rows_per_chunk` rows, each starting with the column header line so every
+chunk is readable on its own:
+
+    Columns: spindle_rpm | feed_rate | alarm
+    Row 0: 12000 | 350 | none
+    Row 1: 11950 | 340 | none
+
+Segments are (text, meta) pairs with meta {"rows": [first, last], "atomic": True};
+"atomic" tells the chunker to keep the group as one chunk (the token chunker
+splits one that exceeds its budget between rows, repeating the header).
+"""
+import pandas as pd
+
+from config.settings import TABULAR_COLUMNS, TABULAR_ROWS_PER_CHUNK
+
+
+def default_columns():
+    """Column selection from TABULAR_COLUMNS (comma separated), or None for all columns."""
+    cols = [c.strip() for c in TABULAR_COLUMNS.split(",") if c.strip()]
+    return cols or None
+
+
+def select_columns(df, columns):
+    if columns is None:
+        return df
+    return df[[c for c in df.columns if c in set(columns)]]
+
+
+def format_rows(df, max_chars_per_row=2000):
+    """Vectorized 'v1 | v2 | ...' string per row of a DataFrame."""
+    if df.shape[1] == 0:
+        return pd.Series([""] * len(df), index=df.index, dtype=object)
+    df = df.fillna("").astype(str)
+    text = df.iloc[:, 0]
+    for i in range(1, df.shape[1]):
+        text = text + " | " + df.iloc[:, i]
+    too_long = text.str.len() > max_chars_per_row
+    if too_long.any():
+        text = text.where(~too_long, text.str.slice(0, max_chars_per_row) + "...")
+    return text
+
+
+def row_groups(frames, rows_per_chunk=TABULAR_ROWS_PER_CHUNK, columns=None,
+               max_chars_per_row=2000, meta=None):
+    """
+    Turn an iterable of DataFrames (consecutive blocks of one table) into
+    row-group segments. Groups may span block boundaries; row numbers count
+    from 0 across blocks.
+    """
+    rows_per_chunk = max(1, int(rows_per_chunk))
+    header = None
+    pending = []       # formatted lines not yet emitted
+    first_row = 0
+    next_row = 0
+
+    def group(lines, first):
+        seg_meta = dict(meta or {})
+        seg_meta["rows"] = [first, first + len(lines) - 1]
+        seg_meta["atomic"] = True
+        return header + "\n" + "\n".join(lines), seg_meta
+
+    for df in frames:
+        df = select_columns(df, columns)
+        if header is None:
+            header = "Columns: " + " | ".join(str(c) for c in df.columns)
+        if len(df) == 0:
+            continue
+        numbers = pd.RangeIndex(next_row, next_row + len(df)).astype(str)
+        lines = ("Row " + pd.Series(numbers, index=df.index) + ": " + format_rows(df, max_chars_per_row)).tolist()
+        next_row += len(df)
+        pending.extend(lines)
+        while len(pending) >= rows_per_chunk:
+            yield group(pending[:rows_per_chunk], first_row)
+            pending = pending[rows_per_chunk:]
+            first_row += rows_per_chunk
+    if pending:
+        yield group(pending, first_row)
+
+
+def join_segments(segments):
+    return "\n\n".join(text for text, _ in segments)
@@ -1,12 +1,71 @@
 # ingestion/xlsx_parser.py
+from pathlib import Path
+
 import pandas as pd
 
-def parse_xlsx(path, sheet_name=None, max_chars_per_row=2000):
-    df = pd.read_excel(path, sheet_name=sheet_name, dtype=str, keep_default_na=False)
-    rows = []
-    for i, row in df.iterrows():
-        text = " | ".join([f"{col}: {row[col]}" for col in df.columns])
-        if len(text) > max_chars_per_row:
-            text = text[:max_chars_per_row] + "..."
-        rows.append(f"Row {i}: {text}")
-    return "\n".join(rows)
+from config.settings import TABULAR_READ_ROWS
+from .tabular import default_columns, join_segments, row_groups
+
+
+def _sheet_names(path, sheet_name):
+    if sheet_name is None:
+        return None   # all sheets
+    return [sheet_name] if isinstance(sheet_name, (str, int)) else list(sheet_name)
+
+
+def _openpyxl_blocks(ws, read_rows):
+    """Yield DataFrames of up to read_rows rows from a read-only worksheet; first row is the header."""
+    rows = ws.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    header = [str(h) if h is not None else f"column_{i}" for i, h in enumerate(header)]
+    width = len(header)
+    block = []
+    for row in rows:
+        block.append(tuple(row[:width]) + (None,) * (width - len(row)))
+        if len(block) >= read_rows:
+            yield pd.DataFrame(block, columns=header)
+            block = []
+    yield pd.DataFrame(block, columns=header)
+
+
+def iter_xlsx_segments(path, sheet_name=None, columns=None, rows_per_chunk=None,
+                       max_chars_per_row=2000, read_rows=TABULAR_READ_ROWS):
+    """
+    Stream a workbook as row-group segments (see ingestion/tabular.py), one
+    sheet after another; segment meta carries "sheet". sheet_name: a name,
+    index or list of them; None = every sheet. .xlsx files are read with
+    openpyxl in read-only mode, `read_rows` rows at a time; legacy .xls goes
+    through pandas one sheet at a time.
+    """
+    columns = columns if columns is not None else default_columns()
+    kwargs = {"columns": columns, "max_chars_per_row": max_chars_per_row}
+    if rows_per_chunk is not None:
+        kwargs["rows_per_chunk"] = rows_per_chunk
+    wanted = _sheet_names(path, sheet_name)
+
+    if Path(path).suffix.lower() == ".xls":
+        names = wanted if wanted is not None else pd.ExcelFile(path).sheet_names
+        for name in names:
+            df = pd.read_excel(path, sheet_name=name, dtype=str, keep_default_na=False)
+            yield from row_groups([df], meta={"sheet": str(name)}, **kwargs)
+        return
+
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        if wanted is None:
+            sheets = wb.worksheets
+        else:
+            sheets = [wb.worksheets[n] if isinstance(n, int) else wb[n] for n in wanted]
+        for ws in sheets:
+            yield from row_groups(_openpyxl_blocks(ws, read_rows), meta={"sheet": ws.title}, **kwargs)
+    finally:
+        wb.close()
+
+
+def parse_xlsx(path, sheet_name=None, max_chars_per_row=2000, columns=None):
+    """Whole workbook (all sheets by default) as one string of row groups."""
+    return join_segments(iter_xlsx_segments(path, sheet_name=sheet_name, columns=columns,
+                                            max_chars_per_row=max_chars_per_row))
@@ -1,86 +1,214 @@
 # llm_client.py
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
+"""
+The single LLM access layer.
+
+One LLMClient per (base url, model) lives in the model registry for the
+whole process. Its HTTP clients keep a keep-alive pool of LLM_POOL_SIZE
+connections with separate connect and read timeouts, so the RAG and
+supervisor paths share connections instead of paying connection setup per
+request. max_tokens and temperature are per-call request parameters, not
+separate clients.
+
+Sync calls share one httpx.Client. An httpx.AsyncClient belongs to the
+event loop it runs on, so async calls get one per loop, created lazily
+inside that loop and closed on it: when the loop shuts down
+(asyncio.run() finalizes it) or at close() while the loop still runs.
+
+The module-level helpers (call_llm, stream_llm, ...) lease the shared
+client for one call.
+"""
+import asyncio
 import logging
+import threading
+import weakref
+
+import httpx
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from config.settings import (
+    LLM_API_KEY,
+    LLM_COMPLETION_PATH,
+    LLM_CONNECT_TIMEOUT,
+    LLM_MAX_RETRIES,
+    LLM_MODEL,
+    LLM_POOL_SIZE,
+    LLM_READ_TIMEOUT,
+)
+from model_registry import get_llm_client, release
+
+_ROLES = {"human": HumanMessage, "user": HumanMessage, "assistant": AIMessage, "ai": AIMessage,
+          "system": SystemMessage}
+
+
+def to_messages(messages):
+    """LangChain messages from a prompt string, (role, content) tuples, or messages as-is."""
+    if isinstance(messages, str):
+        return [HumanMessage(content=messages)]
+    out = []
+    for m in messages:
+        if isinstance(m, tuple):
+            role, content = m
+            if role not in _ROLES:
+                raise ValueError(f"Unknown message role: {role}")
+            out.append(_ROLES[role](content=content))
+        else:
+            out.append(m)
+    return out
+
+
+async def _loop_guard(http):
+    """
+    Closes `http` on its own loop. Once started it is one of the loop's async
+    generators, which the loop's shutdown_asyncgens() (run by asyncio.run)
+    closes before the loop itself.
+    """
+    try:
+        yield
+    finally:
+        await http.aclose()
+
+
+class LLMClient:
+    def __init__(self, base_url=LLM_COMPLETION_PATH, model=LLM_MODEL, api_key=LLM_API_KEY,
+                 pool_size=LLM_POOL_SIZE, connect_timeout=LLM_CONNECT_TIMEOUT,
+                 read_timeout=LLM_READ_TIMEOUT, max_retries=LLM_MAX_RETRIES):
+        self._timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self._chat_kwargs = dict(base_url=base_url, api_key=api_key, model=model,
+                                 timeout=self._timeout, max_retries=max_retries)
+        self._http = httpx.Client(timeout=self._timeout, limits=self._limits)
+        self._lock = threading.Lock()
+        self._loops = weakref.WeakKeyDictionary()   # event loop -> (ChatOpenAI, guard)
+        self.model = model
+        self.chat_model = self._chat_model(http_client=self._http)
+
+    def _chat_model(self, **http):
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(**self._chat_kwargs, **http)
+
+    async def _async_chat_model(self):
+        """The ChatOpenAI for the running event loop, with an AsyncClient of its own."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._loops.get(loop)
+        if entry is None:
+            http = httpx.AsyncClient(timeout=self._timeout, limits=self._limits)
+            guard = _loop_guard(http)
+            await guard.__anext__()
+            entry = (self._chat_model(http_async_client=http), guard)
+            with self._lock:
+                for done in [l for l in self._loops if l.is_closed()]:
+                    del self._loops[done]   # closed with its loop
+                self._loops[loop] = entry
+        return entry[0]
+
+    def close(self):
+        self._http.close()
+        with self._lock:
+            loops, self._loops = list(self._loops.items()), weakref.WeakKeyDictionary()
+        for loop, (_, guard) in loops:
+            if loop.is_closed():
+                continue   # its shutdown already closed the client
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(guard.aclose(), loop)
+            else:
+                loop.run_until_complete(guard.aclose())
+
+    # ---- calls: messages may be a prompt string, (role, content) tuples or LangChain messages ----
+    def complete(self, messages, max_tokens=512, temperature=0.0):
+        return self.chat_model.invoke(to_messages(messages), max_tokens=max_tokens,
+                                      temperature=temperature).content
+
+    async def acomplete(self, messages, max_tokens=512, temperature=0.0):
+        chat_model = await self._async_chat_model()
+        response = await chat_model.ainvoke(to_messages(messages), max_tokens=max_tokens,
+                                            temperature=temperature)
+        return response.content
+
+    def stream(self, messages, max_tokens=512, temperature=0.0):
+        for chunk in self.chat_model.stream(to_messages(messages), max_tokens=max_tokens,
+                                            temperature=temperature):
+            if chunk.content:
+                yield chunk.content
+
+    async def astream(self, messages, max_tokens=512, temperature=0.0):
+        chat_model = await self._async_chat_model()
+        async for chunk in chat_model.astream(to_messages(messages), max_tokens=max_tokens,
+                                              temperature=temperature):
+            if chunk.content:
+                yield chunk.content
+
 
 def call_llm(prompt, max_tokens=512, temperature=0.0):
     """
-    Call LLM using proper LangChain ChatOpenAI interface.
-    
+    Call the LLM with a single prompt.
+
     Args:
         prompt (str): The input prompt text
         max_tokens (int): Maximum tokens to generate
         temperature (float): Temperature for randomness
-    
+
     Returns:
         str: The generated response text
     """
-    
-    # Initialize the LLM with correct parameters
-    llm = ChatOpenAI(
-        base_url="http://localhost:12434/engines/v1",  # Fixed: removed '/engines' - standard OpenAI API format
-        api_key="docker",  # dummy key for ollama
-        model_name="ai/qwen3:8B-Q4_K_M",
-        max_tokens=max_tokens,
-        temperature=temperature
-    )
-    
-    logging.info(f"LLM initialized with model: {llm.model_name}")
-    
+    return call_llm_with_messages(prompt, max_tokens, temperature)
+
+async def acall_llm(prompt, max_tokens=512, temperature=0.0):
+    """Async variant of call_llm()."""
+    llm = get_llm_client()
     try:
-        logging.info(f"Calling LLM with prompt: {prompt}")
-        
-        # Create proper message format - ChatOpenAI expects messages, not raw payload
-        messages = [HumanMessage(content=prompt)]
-        
-        # Invoke the LLM with messages
-        response = llm.invoke(messages)
-        
-        # Extract text content from AIMessage
-        return response.content
-        
+        return await llm.acomplete(prompt, max_tokens=max_tokens, temperature=temperature)
     except Exception as e:
         logging.error(f"LLM call error: {e}")
         return f"[LLM call error] {e}"
+    finally:
+        release(llm)
+
+def stream_llm(prompt, max_tokens=512, temperature=0.0):
+    """
+    Yield the completion of `prompt` in pieces as the model generates them
+    (ChatOpenAI streaming), so callers can show the first tokens right away.
+    """
+    llm = get_llm_client()
+    try:
+        yield from llm.stream(prompt, max_tokens=max_tokens, temperature=temperature)
+    except Exception as e:
+        logging.error(f"LLM stream error: {e}")
+        yield f"[LLM call error] {e}"
+    finally:
+        release(llm)
+
+async def astream_llm(prompt, max_tokens=512, temperature=0.0):
+    """Async variant of stream_llm()."""
+    llm = get_llm_client()
+    try:
+        async for piece in llm.astream(prompt, max_tokens=max_tokens, temperature=temperature):
+            yield piece
+    except Exception as e:
+        logging.error(f"LLM stream error: {e}")
+        yield f"[LLM call error] {e}"
+    finally:
+        release(llm)
 
 # Alternative function that accepts message lists for more complex conversations
 def call_llm_with_messages(messages, max_tokens=512, temperature=0.0):
     """
     Call LLM with a list of messages (for conversations).
-    
+
     Args:
         messages (list): List of message tuples like [("human", "Hello"), ("assistant", "Hi!")]
+            or LangChain messages
         max_tokens (int): Maximum tokens to generate
         temperature (float): Temperature for randomness
-    
+
     Returns:
         str: The generated response text
     """
-    
-    llm = ChatOpenAI(
-        base_url="http://localhost:12434/v1",
-        api_key="docker",
-        model="ai/qwen3:8B-Q4_K_M",
-        max_tokens=max_tokens,
-        temperature=temperature
-    )
-    
+    llm = get_llm_client()
     try:
-        # Convert tuple format to proper message format if needed
-        if messages and isinstance(messages[0], tuple):
-            # Handle tuple format: [("human", "text"), ("assistant", "text")]
-            formatted_messages = []
-            for role, content in messages:
-                if role == "human":
-                    formatted_messages.append(HumanMessage(content=content))
-                # Add other message types as needed
-        else:
-            # Assume messages are already in proper format
-            formatted_messages = messages
-        
-        response = llm.invoke(formatted_messages)
-        return response.content
-        
+        return llm.complete(messages, max_tokens=max_tokens, temperature=temperature)
     except Exception as e:
         logging.error(f"LLM call error: {e}")
-        return f"[LLM call error] {e}"
\ No newline at end of file
+        return f"[LLM call error] {e}"
+    finally:
+        release(llm)
@@ -1,7 +1,10 @@
 from graph import build_graph
+from model_registry import warm_up
 
 if __name__ == "__main__":
     graph = build_graph()
+    # load the embedding model and Qdrant client before the first query
+    warm_up()
 
     # Example 1: RAG query
     result = graph.invoke({"query": "What does the CNC spindle load data say?"})
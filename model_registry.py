@@ -0,0 +1,269 @@
+# model_registry.py
+"""
+Process-wide registry of warm, shareable resources (embedding models,
+Qdrant clients, LLM clients).
+
+Entries are keyed by their config, created lazily on first use and kept
+resident while idle so later requests skip the load. Callers lease an entry
+with acquire()/release() (or the rag_components() context manager);
+shutdown() closes idle entries right away and in-use entries when their
+last lease is released.
+"""
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+
+from config.settings import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+    LLM_API_KEY,
+    LLM_COMPLETION_PATH,
+    LLM_MODEL,
+    QDRANT_API_KEY,
+    QDRANT_COLLECTION,
+    QDRANT_URL,
+    VECTOR_STORE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("key", "value", "refs", "close", "closing", "ready", "error")
+
+    def __init__(self, key, close=None):
+        self.key = key
+        self.value = None
+        self.refs = 0
+        self.close = close
+        self.closing = False
+        self.ready = threading.Event()
+        self.error = None
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}   # key -> _Entry
+        self._by_obj = {}    # id(value) -> _Entry
+
+    def acquire(self, key, factory, close=None):
+        """
+        Return the shared object for `key`, building it with `factory()` on
+        first use. Each call takes one reference; pair it with release().
+        Concurrent first calls for the same key build the object only once.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = _Entry(key, close)
+                self._entries[key] = entry
+            entry.refs += 1
+
+        if owner:
+            try:
+                entry.value = factory()
+            except Exception as e:
+                entry.error = e
+                with self._lock:
+                    self._entries.pop(key, None)
+                entry.ready.set()
+                raise
+            with self._lock:
+                self._by_obj[id(entry.value)] = entry
+            entry.ready.set()
+            logger.info(f"[registry] loaded {key}")
+        else:
+            entry.ready.wait()
+            if entry.error is not None:
+                raise entry.error
+        return entry.value
+
+    def release(self, obj):
+        """Drop one reference to a shared object returned by acquire()."""
+        with self._lock:
+            entry = self._by_obj.get(id(obj))
+            if entry is None or entry.value is not obj:
+                return
+            entry.refs = max(0, entry.refs - 1)
+            if not (entry.closing and entry.refs == 0):
+                return
+            self._by_obj.pop(id(obj), None)
+        self._close(entry)
+
+    def warm_up(self, *loaders):
+        """
+        Eagerly build entries so the first request does not pay for loading.
+        Each loader is a zero-arg callable that acquires an entry (e.g.
+        get_embedder); the reference it takes is released again right away,
+        leaving the entry resident but idle.
+        """
+        for load in loaders:
+            self.release(load())
+
+    def stats(self):
+        with self._lock:
+            return {repr(k): e.refs for k, e in self._entries.items()}
+
+    def shutdown(self):
+        """
+        Close every entry. Idle entries are closed now; entries still leased
+        are detached from the registry and closed on their last release().
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            idle = []
+            for entry in entries:
+                entry.closing = True
+                if entry.refs == 0:
+                    self._by_obj.pop(id(entry.value), None)
+                    idle.append(entry)
+        for entry in idle:
+            self._close(entry)
+
+    @staticmethod
+    def _close(entry):
+        if entry.close is None or entry.value is None:
+            return
+        try:
+            entry.close(entry.value)
+        except Exception as e:
+            logger.warning(f"[registry] error closing {entry.key}: {e}")
+
+
+registry = ModelRegistry()
+atexit.register(registry.shutdown)
+
+
+def get_embedder(model_name=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND):
+    from embeddings import EmbeddingClient
+    return registry.acquire(("embedder", model_name, backend),
+                            lambda: EmbeddingClient(model_name, backend=backend))
+
+
+def get_embedding_scheduler(model_name=EMBEDDING_MODEL):
+    """Shared micro-batching scheduler; holds a lease on the embedder until closed."""
+    from embedding_scheduler import EmbeddingScheduler
+
+    def close(scheduler):
+        scheduler.close()
+        release(scheduler.embedder)
+
+    return registry.acquire(("embedding_scheduler", model_name),
+                            lambda: EmbeddingScheduler(get_embedder(model_name)),
+                            close=close)
+
+
+def get_parallel_embedder(model_name=EMBEDDING_MODEL, workers=None):
+    """Shared multi-process ingestion embedder (workers default to INGEST_EMBED_WORKERS)."""
+    from ingestion.parallel_embedder import ParallelEmbedder, resolve_workers
+    from config.settings import INGEST_EMBED_WORKERS
+    workers = resolve_workers(INGEST_EMBED_WORKERS if workers is None else workers)
+
+    def close(parallel):
+        parallel.close()
+        release(parallel.embedder)
+
+    return registry.acquire(("parallel_embedder", model_name, workers),
+                            lambda: ParallelEmbedder(get_embedder(model_name), workers=workers),
+                            close=close)
+
+
+def get_qdrant(url=QDRANT_URL, api_key=QDRANT_API_KEY, collection=QDRANT_COLLECTION):
+    from vectorstore.qdrant_client import QdrantWrapper
+    return registry.acquire(
+        ("qdrant", url, collection),
+        lambda: QdrantWrapper(url=url, api_key=api_key, collection=collection),
+        close=lambda q: q.close(),
+    )
+
+
+def get_local_store(collection=QDRANT_COLLECTION):
+    from config.settings import LOCAL_STORE_DIR
+    from vectorstore.local_store import LocalVectorStore
+    return registry.acquire(
+        ("local_store", LOCAL_STORE_DIR, collection),
+        lambda: LocalVectorStore(LOCAL_STORE_DIR, collection),
+        close=lambda s: s.close(),
+    )
+
+
+def get_chunk_store(collection=QDRANT_COLLECTION):
+    """Chunk text store for `collection` (texts of points ingested with store_text_in_payload=False)."""
+    from config.settings import CHUNK_STORE_DIR
+    from vectorstore.chunk_store import ChunkTextStore
+    return registry.acquire(
+        ("chunk_store", CHUNK_STORE_DIR, collection),
+        lambda: ChunkTextStore(CHUNK_STORE_DIR, collection),
+        close=lambda s: s.close(),
+    )
+
+
+def get_reranker(model_name=None):
+    """Shared cross-encoder Reranker, or None when RERANK_ENABLED is off."""
+    from config.settings import RERANK_ENABLED, RERANK_MODEL
+    if not RERANK_ENABLED:
+        return None
+    from reranker import Reranker
+    model_name = model_name or RERANK_MODEL
+    return registry.acquire(("reranker", model_name), lambda: Reranker(model_name),
+                            close=lambda r: r.close())
+
+
+def get_vector_store(collection=QDRANT_COLLECTION, backend=VECTOR_STORE):
+    """The configured vector store (VECTOR_STORE=qdrant|local) for `collection`."""
+    if backend == "local":
+        return get_local_store(collection)
+    if backend == "qdrant":
+        return get_qdrant(collection=collection)
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+
+def get_llm_client(base_url=LLM_COMPLETION_PATH, model=LLM_MODEL, api_key=LLM_API_KEY):
+    """The process-wide pooled LLMClient (llm_client.py) for this endpoint and model."""
+    from llm_client import LLMClient
+    return registry.acquire(
+        ("llm", base_url, model),
+        lambda: LLMClient(base_url=base_url, model=model, api_key=api_key),
+        close=lambda c: c.close(),
+    )
+
+
+def release(obj):
+    registry.release(obj)
+
+
+def warm_up(embedding_model=EMBEDDING_MODEL):
+    """Load the default embedder and vector store ahead of the first query."""
+    def load_embedder():
+        embedder = get_embedder(embedding_model)
+        embedder.embed_texts(["warm-up"])
+        return embedder
+    def load_reranker():
+        reranker = get_reranker()
+        if reranker is not None:
+            reranker.rerank("warm-up", [{"payload": {"text": "warm-up"}}], top_k=1, deadline_ms=60_000)
+        return reranker
+    registry.warm_up(load_embedder, get_vector_store, load_reranker)
+
+
+@contextmanager
+def leased(*getters):
+    """Lease several shared objects for the duration of a block; yields them as a tuple."""
+    objs = []
+    try:
+        for get in getters:
+            objs.append(get())
+        yield tuple(objs)
+    finally:
+        for obj in reversed(objs):
+            release(obj)
+
+
+def rag_components(model_name=EMBEDDING_MODEL, collection=QDRANT_COLLECTION):
+    """Lease the shared (vector store, embedder) pair for the duration of a request."""
+    return leased(lambda: get_vector_store(collection=collection),
+                  lambda: get_embedder(model_name))
@@ -1,30 +1,83 @@
 # rag.py
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from vectorstore.qdrant_client import QdrantWrapper
 from embeddings import EmbeddingClient
-from llm_client import call_llm
-from config.settings import TOP_K
+from llm_client import astream_llm, call_llm, stream_llm
+from context_packer import MISSING_TEXT, ContextPacker
+from config.settings import TOP_K, RAG_SEARCH_BATCH_SIZE, LLM_MAX_CONCURRENCY, RAG_HYBRID, RERANK_OVERFETCH
 
 class RAGPipeline:
-    def __init__(self, qdrant: QdrantWrapper, embedder: EmbeddingClient):
+    def __init__(self, qdrant: QdrantWrapper, embedder: EmbeddingClient, scheduler=None, text_store=None,
+                 hybrid=RAG_HYBRID, reranker=None, packer=None):
+        """
+        scheduler: optional EmbeddingScheduler; when given, query embeddings
+        are micro-batched with other concurrent queries.
+        text_store: optional ChunkTextStore (vectorstore/chunk_store.py) holding
+        the text of points ingested with store_text_in_payload=False.
+        hybrid: fuse dense results with BM25 matches on the query text (RRF),
+        for part numbers and codes that embeddings miss.
+        reranker: optional Reranker (reranker.py); when given, top_k *
+        RERANK_OVERFETCH candidates are retrieved and the reranker keeps the
+        best that fit its token budget.
+        packer: ContextPacker (context_packer.py) that merges adjacent chunks,
+        strips their overlap and packs the prompt context to a token budget;
+        defaults to one built from settings.
+        """
         self.qdrant = qdrant
         self.embedder = embedder
+        self.scheduler = scheduler
+        self.text_store = text_store
+        self.hybrid = hybrid
+        self.reranker = reranker
+        self.packer = packer if packer is not None else ContextPacker()
 
-    def answer(self, query: str, top_k=TOP_K):
-        q_emb = self.embedder.embed_texts([query])[0]
-        hits = self.qdrant.search(q_emb, top_k=top_k)
-        # build context
+    def embed_query(self, query: str):
+        if self.scheduler is not None:
+            return self.scheduler.embed(query)
+        return self.embedder.embed_array([query])[0]
+
+    def resolve_texts(self, hit_lists):
+        """Fill in the text of hits whose payload only has a text_pointer, with one text store lookup for all of them."""
+        if self.text_store is None:
+            return
+        missing = [h for hits in hit_lists for h in hits
+                   if h.get("payload") and "text" not in h["payload"] and "text_pointer" in h["payload"]]
+        if not missing:
+            return
+        for h, text in zip(missing, self.text_store.get_many([h["id"] for h in missing])):
+            if text is not None:
+                h["payload"] = {**h["payload"], "text": text}   # don't mutate the store's own payload
+
+    def build_prompt(self, query: str, hits):
+        # adjacent chunks are merged without their overlap, within the context token budget
         context_parts = []
-        for h in hits:
+        for h in self.packer.pack(hits):
             payload = h["payload"] or {}
             src = payload.get("source", "unknown")
             chunk_idx = payload.get("chunk_index", -1)
-            # get text stored? if you stored text in payload, use it; here we didn't store text to avoid big payloads
-            # For demo, include metadata only. Best: store chunk text in payload under 'text' during ingest.
-            text = payload.get("text", "[text not stored in payload]")
-            context_parts.append(f"Source: {src} (chunk:{chunk_idx})\n{text}")
+            # text is in the payload, or filled in from the chunk text store by resolve_texts()
+            text = payload.get("text", MISSING_TEXT)
+            location = f"chunk:{chunk_idx}"
+            if payload.get("chunk_end") is not None:
+                location = f"chunks:{chunk_idx}-{payload['chunk_end']}"
+            if "page" in payload:
+                page, page_end = payload["page"], payload.get("page_end", payload["page"])
+                location += f", page:{page}" if page == page_end else f", pages:{page}-{page_end}"
+            if "rows" in payload:
+                location += f", rows:{payload['rows'][0]}-{payload['rows'][1]}"
+            if "sheet" in payload:
+                location += f", sheet:{payload['sheet']}"
+            if payload.get("aliases"):
+                # duplicate chunks were folded into this one at ingestion
+                also = sorted({a.get("source", "?") for a in payload["aliases"]} - {src})
+                if also:
+                    location += f"; also in: {', '.join(also[:3])}"
+            context_parts.append(f"Source: {src} ({location})\n{text}")
 
         context = "\n\n---\n\n".join(context_parts)
-        prompt = f"""You are an assistant. Use the following retrieved document chunks to answer the user query.
+        return f"""You are an assistant. Use the following retrieved document chunks to answer the user query.
 
 Context:
 {context}
@@ -34,5 +87,107 @@ User question:
 
 Answer concisely and cite source chunks by 'Source: filename (chunk:n)' when relevant.
 """
+
+    def _fetch_k(self, top_k):
+        return top_k * max(1, RERANK_OVERFETCH) if self.reranker is not None else top_k
+
+    def _hits(self, query, q_emb, top_k):
+        hits = self.qdrant.search(q_emb, top_k=self._fetch_k(top_k), text=query if self.hybrid else None)
+        self.resolve_texts([hits])
+        if self.reranker is not None:
+            hits = self.reranker.rerank(query, hits, top_k)
+        return hits
+
+    def retrieve(self, query: str, top_k=TOP_K):
+        """Hits for one query: search (hybrid when enabled), chunk texts resolved, reranked when enabled."""
+        return self._hits(query, self.embed_query(query), top_k)
+
+    def answer(self, query: str, top_k=TOP_K):
+        hits = self.retrieve(query, top_k)
+        prompt = self.build_prompt(query, hits)
         resp = call_llm(prompt, max_tokens=512, temperature=0.0)
         return {"answer": resp, "retrieved": hits}
+
+    def answer_stream(self, query: str, top_k=TOP_K):
+        """
+        Streaming answer(): yields ("retrieved", hits) as soon as retrieval is
+        done, then ("token", text) pieces of the answer as the LLM generates
+        them, so the first words show after time-to-first-token rather than
+        after the whole completion.
+        """
+        hits = self.retrieve(query, top_k)
+        yield "retrieved", hits
+        for piece in stream_llm(self.build_prompt(query, hits), max_tokens=512, temperature=0.0):
+            yield "token", piece
+
+    async def aanswer_stream(self, query: str, top_k=TOP_K):
+        """Async variant of answer_stream(); blocking search and reranking run in a worker thread."""
+        if self.scheduler is not None:
+            q_emb = await self.scheduler.aembed(query)
+        else:
+            q_emb = await asyncio.to_thread(lambda: self.embedder.embed_array([query])[0])
+        hits = await asyncio.to_thread(self._hits, query, q_emb, top_k)
+        yield "retrieved", hits
+        async for piece in astream_llm(self.build_prompt(query, hits), max_tokens=512, temperature=0.0):
+            yield "token", piece
+
+    def answer_many(self, queries, top_k=TOP_K, search_chunk_size=RAG_SEARCH_BATCH_SIZE,
+                    max_concurrency=LLM_MAX_CONCURRENCY):
+        """
+        Answer many queries at once: one embedding batch, search_batch()
+        requests of `search_chunk_size` queries, and LLM calls fanned out over
+        at most `max_concurrency` threads. Results keep the input order; each
+        carries per-query timings in seconds (embed/search/rerank are the batch
+        cost divided evenly across its queries).
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+
+        start = time.perf_counter()
+        q_embs = self.embedder.embed_array(queries)
+        embed_each = (time.perf_counter() - start) / len(queries)
+
+        all_hits = []
+        search_each, rerank_each = [], []
+        for i in range(0, len(queries), search_chunk_size):
+            chunk = q_embs[i:i + search_chunk_size]
+            chunk_queries = queries[i:i + search_chunk_size]
+            t0 = time.perf_counter()
+            hits = self.qdrant.search_batch(chunk, top_k=self._fetch_k(top_k),
+                                            texts=chunk_queries if self.hybrid else None)
+            search_each.extend([(time.perf_counter() - t0) / len(chunk)] * len(chunk))
+            self.resolve_texts(hits)
+
+            t0 = time.perf_counter()
+            if self.reranker is not None:
+                # one scoring pass per search chunk; the reranker caps the scaled deadline
+                hits = self.reranker.rerank_many(chunk_queries, hits, top_k,
+                                                 deadline_ms=self.reranker.deadline_ms * len(chunk))
+            rerank_each.extend([(time.perf_counter() - t0) / len(chunk)] * len(chunk))
+            all_hits.extend(hits)
+
+        def generate(args):
+            query, hits = args
+            t0 = time.perf_counter()
+            resp = call_llm(self.build_prompt(query, hits), max_tokens=512, temperature=0.0)
+            return resp, time.perf_counter() - t0
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+            generated = list(pool.map(generate, zip(queries, all_hits)))
+
+        results = []
+        for hits, (resp, llm_seconds), search_seconds, rerank_seconds in zip(all_hits, generated, search_each,
+                                                                              rerank_each):
+            results.append({
+                "answer": resp,
+                "retrieved": hits,
+                "timings": {
+                    "embed": embed_each,
+                    "search": search_seconds,
+                    "rerank": rerank_seconds,
+                    "llm": llm_seconds,
+                    "total": embed_each + search_seconds + rerank_seconds + llm_seconds,
+                },
+            })
+        return results
@@ -0,0 +1,141 @@
+# reranker.py
+"""
+Cross-encoder reranking under a latency deadline.
+
+RAGPipeline over-fetches candidates (top_k * RERANK_OVERFETCH) and
+Reranker.rerank() scores every (query, chunk) pair with a small CPU
+cross-encoder, RERANK_BATCH_SIZE pairs per forward pass, then keeps the best chunks that fit
+RERANK_TOKEN_BUDGET (at most top_k). Fewer, better chunks mean a shorter
+prompt and a faster LLM prefill.
+
+Scoring runs on a single worker thread with a hard deadline: if it has not
+finished within RERANK_DEADLINE_MS (at most RERANK_MAX_DEADLINE_MS for
+batches), or fails, the candidates keep their vector order, so reranking
+never adds more than the deadline to a query. A pass that overruns keeps
+the worker until it finishes; meanwhile other calls fall back at once
+rather than queueing behind it.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from config.settings import (
+    RERANK_BATCH_SIZE,
+    RERANK_DEADLINE_MS,
+    RERANK_MAX_DEADLINE_MS,
+    RERANK_MAX_LENGTH,
+    RERANK_MODEL,
+    RERANK_TOKEN_BUDGET,
+)
+from context_packer import token_counter
+
+logger = logging.getLogger(__name__)
+
+
+class Reranker:
+    def __init__(self, model_name=RERANK_MODEL, max_length=RERANK_MAX_LENGTH,
+                 deadline_ms=RERANK_DEADLINE_MS, token_budget=RERANK_TOKEN_BUDGET,
+                 batch_size=RERANK_BATCH_SIZE, max_deadline_ms=RERANK_MAX_DEADLINE_MS):
+        from sentence_transformers import CrossEncoder
+        self.model_name = model_name
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+        self.deadline_ms = float(deadline_ms)
+        self.max_deadline_ms = float(max_deadline_ms)
+        self.token_budget = int(token_budget)
+        self.batch_size = max(1, int(batch_size))
+        self.count_tokens = token_counter()
+        # one scoring pass at a time; callers past their deadline stop waiting,
+        # and nothing is submitted while a pass is still running
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._lock = threading.Lock()
+        self._busy = False
+        self.calls = 0
+        self.fallbacks = 0
+        self.seconds = 0.0
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _score(self, pairs):
+        try:
+            return self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        finally:
+            with self._lock:
+                self._busy = False
+
+    def rerank(self, query, hits, top_k, token_budget=None, deadline_ms=None):
+        return self.rerank_many([query], [hits], top_k, token_budget, deadline_ms)[0]
+
+    def rerank_many(self, queries, hit_lists, top_k, token_budget=None, deadline_ms=None):
+        """
+        Rerank each query's hits (one scoring pass for all pairs) and keep the
+        best that fit the token budget, at most top_k per query. Hits gain a
+        "rerank_score"; on timeout, error or a busy worker they keep vector
+        order instead. deadline_ms is capped at max_deadline_ms.
+        """
+        budget = self.token_budget if token_budget is None else int(token_budget)
+        deadline_ms = self.deadline_ms if deadline_ms is None else float(deadline_ms)
+        deadline = min(deadline_ms, self.max_deadline_ms) / 1000.0
+        pairs, owners = [], []
+        for qi, (query, hits) in enumerate(zip(queries, hit_lists)):
+            for hi, h in enumerate(hits):
+                text = (h.get("payload") or {}).get("text")
+                if text:
+                    pairs.append((query, text))
+                    owners.append((qi, hi))
+
+        started = time.perf_counter()
+        scores = None
+        if pairs:
+            with self._lock:
+                busy, self._busy = self._busy, True
+            if busy:
+                logger.warning(f"[rerank] worker still busy with an earlier pass; keeping vector order "
+                               f"for {len(pairs)} pairs")
+            else:
+                future = self._pool.submit(self._score, pairs)
+                try:
+                    scores = future.result(timeout=deadline)
+                except FutureTimeout:
+                    logger.warning(f"[rerank] {len(pairs)} pairs missed the {deadline * 1000:.0f} ms deadline; "
+                                   f"keeping vector order")
+                except Exception as e:
+                    logger.warning(f"[rerank] scoring failed, keeping vector order: {e}")
+        with self._lock:
+            self.calls += 1
+            self.fallbacks += scores is None and bool(pairs)
+            self.seconds += time.perf_counter() - started
+
+        ordered = [list(hits) for hits in hit_lists]
+        if scores is not None:
+            by_query = [{} for _ in hit_lists]
+            for (qi, hi), score in zip(owners, scores):
+                by_query[qi][hi] = float(score)
+            for qi, hits in enumerate(hit_lists):
+                rescored = [{**hits[hi], "rerank_score": s} for hi, s in by_query[qi].items()]
+                rescored.sort(key=lambda h: h["rerank_score"], reverse=True)
+                # hits without text cannot be scored: keep them last, in vector order
+                ordered[qi] = rescored + [h for hi, h in enumerate(hits) if hi not in by_query[qi]]
+        return [self._fit(hits, top_k, budget) for hits in ordered]
+
+    def _fit(self, hits, top_k, budget):
+        """The first hits (in order) that fit the token budget; always at least one."""
+        kept, used = [], 0
+        for h in hits:
+            if len(kept) >= top_k:
+                break
+            cost = self.count_tokens((h.get("payload") or {}).get("text") or "")
+            if budget > 0 and kept and used + cost > budget:
+                continue   # a shorter, lower-ranked chunk may still fit
+            kept.append(h)
+            used += cost
+        return kept
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "fallbacks": self.fallbacks,
+                "avg_ms": self.seconds / self.calls * 1000 if self.calls else 0.0,
+            }
@@ -0,0 +1,69 @@
+# tests/test_dedup.py
+import numpy as np
+
+from ingestion.dedup import DedupIndex, MinHasher
+
+
+def _words(prefix, n):
+    return [f"{prefix}{i}" for i in range(n)]
+
+
+def _shingles(words, k):
+    return {" ".join(words[i:i + k]) for i in range(len(words) - k + 1)}
+
+
+def _jaccard(a, b, k):
+    sa, sb = _shingles(a, k), _shingles(b, k)
+    return len(sa & sb) / len(sa | sb)
+
+
+def test_signature_estimates_jaccard():
+    hasher = MinHasher(num_perm=256)
+    a = _words("w", 200)
+    b = a[:92] + _words("x", 108)
+    true = _jaccard(a, b, hasher.shingle)
+    estimate = float(np.mean(hasher.signature(a) == hasher.signature(b)))
+    assert abs(estimate - true) < 0.1
+
+
+def test_adjacent_chunks_are_not_aliased(tmp_path):
+    index = DedupIndex("test", path=str(tmp_path))
+    a = _words("w", 120)
+    b = a[60:] + _words("x", 60)     # shares half its words with a, like overlapping chunks
+    assert 0.2 < _jaccard(a, b, index.hasher.shingle) < 0.4
+    assert index.check("a", " ".join(a), {"chunk_index": 0}) is None
+    assert index.check("b", " ".join(b), {"chunk_index": 1}) is None
+    index.close()
+
+
+def test_near_copy_is_aliased(tmp_path):
+    index = DedupIndex("test", path=str(tmp_path))
+    a = _words("w", 400)
+    b = list(a)
+    b[200] = "changed"
+    assert index.check("a", " ".join(a), {"chunk_index": 0}) is None
+    assert index.check("b", " ".join(b), {"chunk_index": 0}) == "a"
+    index.close()
+
+
+class _Store:
+    def __init__(self):
+        self.updates = {}
+
+    def set_payloads(self, updates):
+        self.updates.update(updates)
+
+
+def test_aliases_wait_for_written_canonical(tmp_path, monkeypatch):
+    monkeypatch.setattr("ingestion.dedup.DEDUP_MODE", "alias")
+    index = DedupIndex("test", path=str(tmp_path))
+    text = " ".join(_words("w", 50))
+    assert index.check("a", text, {"chunk_index": 0}) is None
+    assert index.check("b", text, {"chunk_index": 1}) == "a"
+    store = _Store()
+    index.apply_payloads(store)
+    assert store.updates == {}        # "a" is not written yet: keep it dirty
+    index.written(["a"])
+    index.apply_payloads(store)
+    assert store.updates == {"a": {"aliases": [{"chunk_index": 1}]}}
+    index.close()
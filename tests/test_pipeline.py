@@ -0,0 +1,47 @@
+# tests/test_pipeline.py
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")   # ingestion.pipeline imports the embedding client
+
+from ingestion import pipeline
+from ingestion.dedup import DedupIndex
+from ingestion.manifest import IngestManifest
+from vectorstore.local_store import LocalVectorStore
+
+
+class _Embedder:
+    model_name = "test"
+    dimension = 4
+    tokenizer = None
+
+    def embed_array(self, texts):
+        return np.ones((len(texts), self.dimension), dtype=np.float32)
+
+
+def test_failed_unit_skips_rest_of_file(tmp_path, monkeypatch):
+    bad, good = tmp_path / "bad.pdf", tmp_path / "good.pdf"
+    bad.write_bytes(b"bad")
+    good.write_bytes(b"good")
+
+    def parse_units(path):
+        return [(0, 1), (1, 2), (2, 3)] if path == str(bad) else [(0, 1)]
+
+    def parse_segments(path, start, stop, content_hash=None):
+        if path == str(bad) and start == 0:
+            raise ValueError("unreadable page")
+        return [(f"Page {start} of {path}.", {"page": start + 1})]
+
+    monkeypatch.setattr(pipeline, "parse_units", parse_units)
+    monkeypatch.setattr(pipeline, "parse_segments", parse_segments)
+    store = LocalVectorStore(path=str(tmp_path / "vectors"), collection="test")
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+    pipe = pipeline.IngestionPipeline(store, _Embedder(), manifest=manifest, parse_workers=0,
+                                      dedup=DedupIndex("test", path=str(tmp_path / "dedup")))
+    pipe.run([bad, good])
+
+    # the failed file is not recorded, so the next run retries all of it
+    assert manifest.get("test", str(bad.resolve())) is None
+    record = manifest.get("test", str(good.resolve()))
+    assert record["chunk_count"] == 1
+    assert [p["source"] for p in store._payloads if p] == ["good.pdf"]
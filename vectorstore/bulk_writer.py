@@ -0,0 +1,141 @@
+# vectorstore/bulk_writer.py
+"""
+Pipelined bulk upserts.
+
+BulkWriter buffers (id, vector, payload[, text]) records, cuts them into batches of
+`batch_size` and sends each batch with wait=False from a bounded pool of
+`parallel` writer threads, so the caller can keep embedding while earlier
+batches are on the wire. checkpoint()/close() wait for every in-flight
+request and then send the last batch with wait=True: Qdrant applies updates
+in order, so once that returns everything written before it is applied.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from config.settings import UPSERT_BATCH_SIZE, UPSERT_PARALLEL
+
+logger = logging.getLogger(__name__)
+
+
+class BulkWriter:
+    def __init__(self, store, batch_size=UPSERT_BATCH_SIZE, parallel=UPSERT_PARALLEL):
+        """store: anything with upsert(ids, vectors, payloads, wait=..., texts=...)."""
+        self.store = store
+        self.batch_size = max(1, int(batch_size))
+        self.parallel = max(1, int(parallel))
+        self._pool = ThreadPoolExecutor(max_workers=self.parallel, thread_name_prefix="bulk-upsert")
+        # at most two batches queued per writer thread; add() blocks beyond that
+        self._slots = threading.BoundedSemaphore(self.parallel * 2)
+        self._futures = []
+
+        self._ids, self._vectors, self._payloads, self._texts = [], [], [], []
+        self._buffered = 0
+        self._held = None   # last full batch, kept back for the acknowledged send
+
+        self.points = 0
+        self.batches = 0
+        self._started = time.perf_counter()
+
+    # ---- buffering ----
+    def add(self, id, vector, payload):
+        self.add_many([id], np.asarray(vector, dtype=np.float32)[None, :], [payload])
+
+    def add_many(self, ids, vectors, payloads, texts=None):
+        """vectors: 2-D array with one row per id; texts: optional chunk texts for the sparse index."""
+        if not ids:
+            return
+        self._ids.extend(ids)
+        self._vectors.append(np.asarray(vectors, dtype=np.float32))
+        self._payloads.extend(payloads)
+        self._texts.extend(texts if texts is not None else [None] * len(ids))
+        self._buffered += len(ids)
+        while self._buffered >= self.batch_size:
+            self._cut(self.batch_size)
+
+    def _cut(self, n):
+        vectors = np.concatenate(self._vectors) if len(self._vectors) > 1 else self._vectors[0]
+        texts = self._texts[:n]
+        batch = (self._ids[:n], vectors[:n], self._payloads[:n],
+                 texts if any(t is not None for t in texts) else None)
+        self._ids, self._payloads, self._texts = self._ids[n:], self._payloads[n:], self._texts[n:]
+        self._vectors = [vectors[n:]] if len(vectors) > n else []
+        self._buffered -= n
+        self._queue(batch)
+
+    def _queue(self, batch):
+        # hold back the newest batch: whichever turns out to be last is sent with wait=True
+        held, self._held = self._held, batch
+        if held is not None:
+            self._submit(held)
+
+    def _submit(self, batch):
+        self._slots.acquire()
+        try:
+            fut = self._pool.submit(self._send, batch, False)
+        except Exception:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(fut)
+
+    def _send(self, batch, wait):
+        ids, vectors, payloads, texts = batch
+        if texts is not None:
+            self.store.upsert(ids, vectors, payloads, wait=wait, texts=texts)
+        else:
+            self.store.upsert(ids, vectors, payloads, wait=wait)
+        return len(ids)
+
+    # ---- synchronization ----
+    def checkpoint(self):
+        """Send everything buffered and block until Qdrant has applied all of it."""
+        if self._buffered:
+            self._cut(self._buffered)
+        futures, self._futures = self._futures, []
+        errors = []
+        for fut in futures:
+            try:
+                self.points += fut.result()
+                self.batches += 1
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            self._held = None
+            raise RuntimeError(f"{len(errors)} bulk upsert batch(es) failed; first error: {errors[0]}") from errors[0]
+        if self._held is not None:
+            held, self._held = self._held, None
+            self.points += self._send(held, True)
+            self.batches += 1
+
+    def close(self):
+        try:
+            self.checkpoint()
+        finally:
+            self._pool.shutdown(wait=True)
+
+    def abort(self):
+        """Stop without sending buffered records or waiting for acknowledgement."""
+        self._held = None
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def stats(self):
+        seconds = time.perf_counter() - self._started
+        return {
+            "points": self.points,
+            "batches": self.batches,
+            "seconds": seconds,
+            "points_per_sec": self.points / seconds if seconds > 0 else 0.0,
+        }
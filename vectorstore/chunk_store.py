@@ -0,0 +1,264 @@
+# vectorstore/chunk_store.py
+"""
+Local chunk text store, so vector store payloads can stay small
+(ingest with store_text_in_payload=False; payloads then carry a
+text_pointer and the text lives here, keyed by point id).
+
+Layout of <CHUNK_STORE_DIR>/<collection>/:
+  seg-00000.bin ...  append-only segment files of chunk text (utf-8, zstd
+                     compressed when CHUNK_STORE_COMPRESSION=zstd and the
+                     zstandard package is installed); a new segment starts
+                     once the current one passes CHUNK_STORE_SEGMENT_MB
+  index.bin          append-only log of fixed-size records
+                     (point key, segment, offset, length, flags); the last
+                     record for a key wins, deletions are tombstones
+  write.lock         held (flock) while a process appends, so several
+                     processes can write: each catches up on the index and
+                     takes its offsets from the segment's actual end, and
+                     flushes both files before letting go
+
+The index is replayed into a dict on open; reads memory-map the segments,
+so get_many() for a page of hits is a few dict lookups and slices. A lookup
+that misses first re-reads the index tail, so text written by another
+process (a separate ingest run) after open becomes visible.
+"""
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import uuid
+from contextlib import contextmanager
+
+from config.settings import (
+    CHUNK_STORE_COMPRESSION,
+    CHUNK_STORE_DIR,
+    CHUNK_STORE_SEGMENT_MB,
+    QDRANT_COLLECTION,
+)
+
+try:
+    import zstandard
+except ImportError:  # optional: CHUNK_STORE_COMPRESSION=zstd needs it
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: one writing process at a time there
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_RECORD = struct.Struct("<16sIQIB")   # key, segment, offset, length, flags
+_COMPRESSED = 1
+_DELETED = 2
+_MIN_COMPRESS = 128                   # shorter texts are stored as-is
+
+
+def point_key(id):
+    """16-byte key for a point id (uuid strings map to their bytes)."""
+    try:
+        return uuid.UUID(str(id)).bytes
+    except ValueError:
+        return hashlib.blake2b(str(id).encode("utf-8"), digest_size=16).digest()
+
+
+def chunk_store_exists(collection=QDRANT_COLLECTION, path=CHUNK_STORE_DIR):
+    return os.path.exists(os.path.join(path, collection, "index.bin"))
+
+
+class ChunkTextStore:
+    def __init__(self, path=CHUNK_STORE_DIR, collection=QDRANT_COLLECTION,
+                 compression=CHUNK_STORE_COMPRESSION, segment_mb=CHUNK_STORE_SEGMENT_MB):
+        self.collection = collection
+        self.dir = os.path.join(path, collection)
+        self.segment_bytes = int(segment_mb * 1024 * 1024)
+        self.compress = compression == "zstd"
+        if self.compress and zstandard is None:
+            logger.warning("CHUNK_STORE_COMPRESSION=zstd but zstandard is not installed; storing text uncompressed")
+            self.compress = False
+        self._compressor = zstandard.ZstdCompressor(level=3) if self.compress else None
+
+        self._lock = threading.RLock()
+        self._index = {}          # key -> (segment, offset, length, flags)
+        self._maps = {}           # segment -> mmap
+        self._segment = 0         # segment being appended to (the newest one in the index)
+        self._seg_file = None
+        self._seg_file_segment = None
+        self._seg_size = 0        # bytes written to the active segment
+        self._seg_flushed = 0     # bytes of it visible to readers
+        self._index_file = None
+        self._index_pos = 0       # bytes of index.bin replayed
+        if os.path.exists(self._path("index.bin")):
+            self._replay()
+            if os.path.exists(self._seg_path(self._segment)):
+                self._seg_size = self._seg_flushed = os.path.getsize(self._seg_path(self._segment))
+
+    # ---- storage ----
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _seg_path(self, segment):
+        return self._path(f"seg-{segment:05d}.bin")
+
+    def _replay(self, repair=False):
+        """
+        Apply index records past what was already replayed. repair (only
+        under the write lock, when no other writer can be mid-record) cuts
+        off a torn final record left by a crash; otherwise a partial tail is
+        read next time.
+        """
+        path = self._path("index.bin")
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            f.seek(self._index_pos)
+            data = f.read()
+        usable = len(data) - len(data) % _RECORD.size
+        if repair and usable != len(data):
+            with open(path, "r+b") as f:
+                f.truncate(self._index_pos + usable)   # torn final record
+        for key, segment, offset, length, flags in _RECORD.iter_unpack(data[:usable]):
+            if flags & _DELETED:
+                self._index.pop(key, None)
+            else:
+                self._index[key] = (segment, offset, length, flags)
+            self._segment = max(self._segment, segment)
+        self._index_pos += usable
+
+    @contextmanager
+    def _write_lock(self):
+        """Exclusive across processes (threads are already serialized by self._lock)."""
+        os.makedirs(self.dir, exist_ok=True)
+        with open(self._path("write.lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _writers(self):
+        """Open the files for appending at their current ends (call under the write lock, after _replay)."""
+        if self._index_file is None:
+            self._index_file = open(self._path("index.bin"), "ab")
+        if self._seg_file is not None and self._seg_file_segment != self._segment:
+            self._seg_file.close()   # another process rolled to a newer segment
+            self._seg_file = None
+        if self._seg_file is None:
+            self._seg_file = open(self._seg_path(self._segment), "ab")
+            self._seg_file_segment = self._segment
+        self._seg_file.seek(0, os.SEEK_END)
+        self._seg_size = self._seg_flushed = self._seg_file.tell()
+
+    def _roll(self):
+        self._seg_file.close()
+        self._segment += 1
+        self._seg_file = open(self._seg_path(self._segment), "ab")
+        self._seg_file_segment = self._segment
+        self._seg_size = self._seg_flushed = 0
+
+    def _append_index(self, records):
+        """Write index records and make them and their text visible to other processes."""
+        data = b"".join(records)
+        self._index_file.write(data)
+        if self._seg_file is not None:
+            self._seg_file.flush()
+            self._seg_flushed = self._seg_size
+        self._index_file.flush()
+        self._index_pos += len(data)   # our own records need no replay
+
+    def _map(self, segment, end):
+        m = self._maps.get(segment)
+        if m is None or len(m) < end:
+            if segment == self._segment and self._seg_file is not None and self._seg_flushed < end:
+                self._seg_file.flush()
+                self._seg_flushed = self._seg_size
+            if m is not None:
+                m.close()
+            with open(self._seg_path(segment), "rb") as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = m
+        return m
+
+    # ---- API ----
+    def put_many(self, ids, texts):
+        with self._lock, self._write_lock():
+            self._replay(repair=True)   # other writers' records and newest segment
+            self._writers()
+            records = []
+            for id, text in zip(ids, texts):
+                data = text.encode("utf-8")
+                flags = 0
+                if self._compressor is not None and len(data) >= _MIN_COMPRESS:
+                    data = self._compressor.compress(data)
+                    flags |= _COMPRESSED
+                if self._seg_size and self._seg_size + len(data) > self.segment_bytes:
+                    self._roll()
+                key = point_key(id)
+                self._seg_file.write(data)
+                entry = (self._segment, self._seg_size, len(data), flags)
+                self._seg_size += len(data)
+                self._index[key] = entry
+                records.append(_RECORD.pack(key, *entry))
+            self._append_index(records)
+
+    def get_many(self, ids):
+        """Texts for ids in input order (None where unknown), in one pass over the index."""
+        out = []
+        decompressor = None
+        with self._lock:
+            keys = [point_key(id) for id in ids]
+            if any(key not in self._index for key in keys):
+                self._replay()   # maybe written by another process since open
+            for key in keys:
+                entry = self._index.get(key)
+                if entry is None:
+                    out.append(None)
+                    continue
+                segment, offset, length, flags = entry
+                data = self._map(segment, offset + length)[offset:offset + length]
+                if flags & _COMPRESSED:
+                    if zstandard is None:
+                        raise RuntimeError("chunk store holds zstd-compressed text; install zstandard to read it")
+                    decompressor = decompressor or zstandard.ZstdDecompressor()
+                    data = decompressor.decompress(data)
+                out.append(data.decode("utf-8"))
+        return out
+
+    def get(self, id):
+        return self.get_many([id])[0]
+
+    def delete(self, ids):
+        """Forget ids; their bytes stay in the segment files."""
+        with self._lock, self._write_lock():
+            self._replay(repair=True)
+            records = []
+            for id in ids:
+                key = point_key(id)
+                if self._index.pop(key, None) is not None:
+                    records.append(_RECORD.pack(key, 0, 0, 0, _DELETED))
+            if records:
+                self._writers()
+                self._append_index(records)
+
+    def flush(self):
+        with self._lock:
+            if self._seg_file is not None:
+                self._seg_file.flush()
+                self._seg_flushed = self._seg_size
+            if self._index_file is not None:
+                self._index_file.flush()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            for m in self._maps.values():
+                m.close()
+            self._maps.clear()
+            for f in (self._seg_file, self._index_file):
+                if f is not None:
+                    f.close()
+            self._seg_file = self._index_file = None
+
+    def stats(self):
+        with self._lock:
+            return {"chunks": len(self._index), "segments": self._segment + 1, "compressed": self.compress}
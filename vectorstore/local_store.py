@@ -0,0 +1,318 @@
+# vectorstore/local_store.py
+"""
+In-process vector store with the same create_collection / upsert / search
+interface as vectorstore.qdrant_client.QdrantWrapper, for small collections,
+edge deployments and tests (select it with VECTOR_STORE=local).
+
+Layout of <LOCAL_STORE_DIR>/<collection>/:
+  vectors.f32     memory-mapped float32 matrix, one row per point (grows by doubling)
+  payloads.jsonl  append-only log of {"row", "id", "payload"} and
+                  {"row", "id", "deleted": true} records; the last record for a
+                  row wins, so reopening just replays the log
+  meta.json       dim, distance, capacity
+
+Search is exact: one matrix-vector product over the live rows plus
+argpartition for the top-k (search_batch does one matrix-matrix product for
+all queries). Filters are simple payload equality, given as a dict ({"source": "a.pdf"}) or a Qdrant Filter whose `must` clauses are
+FieldCondition(key=..., match=MatchValue(value=...)).
+
+With SPARSE_INDEX, upserts that pass chunk texts also fill an in-memory BM25
+inverted index (vectorstore/sparse.py); the document vectors are logged with
+the payload records so reopening rebuilds it. search(..., text=...) fuses the
+dense and BM25 rankings with reciprocal rank fusion.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+
+from config.settings import HYBRID_PREFETCH_FACTOR, LOCAL_STORE_DIR, QDRANT_COLLECTION, SPARSE_INDEX
+from .sparse import LocalSparseIndex, encode_document, encode_query, rrf_fuse
+
+_INITIAL_CAPACITY = 1024
+
+
+def _filter_to_dict(filter):
+    if filter is None or isinstance(filter, dict):
+        return filter or {}
+    conditions = {}
+    for cond in getattr(filter, "must", None) or []:
+        match = getattr(cond, "match", None)
+        if getattr(cond, "key", None) is None or not hasattr(match, "value"):
+            raise ValueError(f"LocalVectorStore only supports equality filters, got: {cond}")
+        conditions[cond.key] = match.value
+    if getattr(filter, "should", None) or getattr(filter, "must_not", None):
+        raise ValueError("LocalVectorStore only supports 'must' equality filters")
+    return conditions
+
+
+def _match(payload, conditions):
+    return all(payload.get(k) == v for k, v in conditions.items())
+
+
+class LocalVectorStore:
+    def __init__(self, path=LOCAL_STORE_DIR, collection=QDRANT_COLLECTION):
+        self.collection = collection
+        self.dir = os.path.join(path, collection)
+        self._lock = threading.RLock()
+        self._vectors = None
+        self.dim = None
+        self.distance = "Cosine"
+        self.capacity = 0
+        self.count = 0            # rows ever used
+        self._ids = []            # row -> id
+        self._payloads = []       # row -> payload dict
+        self._row_of = {}         # id -> row
+        self._sparse = LocalSparseIndex() if SPARSE_INDEX else None
+        self._log = None
+        if os.path.exists(os.path.join(self.dir, "meta.json")):
+            self._open()
+
+    # ---- storage ----
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _open(self):
+        with open(self._path("meta.json")) as f:
+            meta = json.load(f)
+        self.dim = int(meta["dim"])
+        self.distance = meta.get("distance", "Cosine")
+        self.capacity = int(meta["capacity"])
+        self._map("r+")
+        if os.path.exists(self._path("payloads.jsonl")):
+            with open(self._path("payloads.jsonl"), encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break  # torn final write; everything before it is intact
+                    if rec.get("deleted"):
+                        self._clear_row(rec["row"], rec["id"])
+                    else:
+                        self._set_row(rec["row"], rec["id"], rec["payload"])
+                        if "sparse" in rec:   # upsert records; payload updates leave the index alone
+                            self._set_sparse(rec["row"], rec["sparse"])
+        self._log = open(self._path("payloads.jsonl"), "a", encoding="utf-8")
+
+    def _map(self, mode):
+        self._vectors = np.memmap(self._path("vectors.f32"), dtype=np.float32, mode=mode,
+                                  shape=(self.capacity, self.dim))
+
+    def _write_meta(self):
+        with open(self._path("meta.json"), "w") as f:
+            json.dump({"dim": self.dim, "distance": self.distance, "capacity": self.capacity}, f)
+
+    def _set_row(self, row, id, payload):
+        while len(self._ids) <= row:
+            self._ids.append(None)
+            self._payloads.append(None)
+        self._ids[row] = id
+        self._payloads[row] = payload
+        self._row_of[id] = row
+        self.count = max(self.count, row + 1)
+
+    def _set_sparse(self, row, sparse):
+        if self._sparse is None:
+            return
+        if sparse:
+            self._sparse.add(row, *sparse)
+        else:
+            self._sparse.remove(row)
+
+    def _clear_row(self, row, id):
+        if row < len(self._ids) and self._ids[row] == id:
+            self._ids[row] = None
+            self._payloads[row] = None
+            if self._sparse is not None:
+                self._sparse.remove(row)
+        if self._row_of.get(id) == row:
+            del self._row_of[id]
+        self.count = max(self.count, row + 1)
+
+    def _ensure_capacity(self, needed):
+        if needed <= self.capacity:
+            return
+        new_capacity = max(self.capacity, _INITIAL_CAPACITY)
+        while new_capacity < needed:
+            new_capacity *= 2
+        self._vectors.flush()
+        self._vectors = None
+        with open(self._path("vectors.f32"), "r+b") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.capacity = new_capacity
+        self._map("r+")
+        self._write_meta()
+
+    # ---- QdrantWrapper interface ----
+    def create_collection(self, vector_size, distance="Cosine"):
+        distance = getattr(distance, "value", distance)
+        if distance not in ("Cosine", "Dot"):
+            raise ValueError(f"LocalVectorStore supports Cosine and Dot distance, got {distance}")
+        with self._lock:
+            if self.dim is not None:
+                return
+            os.makedirs(self.dir, exist_ok=True)
+            self.dim = int(vector_size)
+            self.distance = distance
+            self.capacity = _INITIAL_CAPACITY
+            self._map("w+")
+            self._write_meta()
+            self._log = open(self._path("payloads.jsonl"), "a", encoding="utf-8")
+
+    def upsert(self, ids, vectors, payloads, wait=True, texts=None):
+        """texts: optional chunk texts for the BM25 index. An id repeated in the batch keeps its last point."""
+        ids = list(ids)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(set(ids)) != len(ids):
+            keep = sorted({id: i for i, id in enumerate(ids)}.values())
+            ids, vectors = [ids[i] for i in keep], vectors[keep]
+            payloads = [payloads[i] for i in keep]
+            texts = None if texts is None else [texts[i] for i in keep]
+        sparse = [None] * len(ids)
+        if texts is not None and self._sparse is not None:
+            sparse = [list(encode_document(t)) for t in texts]
+        if self.distance == "Cosine":
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            vectors = vectors / norms
+        with self._lock:
+            if self.dim is None:
+                raise RuntimeError(f"Collection {self.collection} does not exist; call create_collection first")
+            rows = []
+            next_row = self.count
+            for id in ids:
+                row = self._row_of.get(id)
+                if row is None:
+                    row, next_row = next_row, next_row + 1
+                rows.append(row)
+            self._ensure_capacity(next_row)
+            self._vectors[rows] = vectors
+            lines = []
+            for row, id, payload, doc in zip(rows, ids, payloads, sparse):
+                self._set_row(row, id, payload)
+                rec = {"row": row, "id": id, "payload": payload}
+                if self._sparse is not None:
+                    self._set_sparse(row, doc)
+                    rec["sparse"] = doc
+                lines.append(json.dumps(rec))
+            self._log.write("\n".join(lines) + "\n")
+            if wait:
+                self.flush()
+
+    def delete(self, ids, wait=True):
+        """Drop points; their rows stay allocated but are skipped by search."""
+        with self._lock:
+            lines = []
+            for id in ids:
+                row = self._row_of.get(id)
+                if row is None:
+                    continue
+                self._clear_row(row, id)
+                lines.append(json.dumps({"row": row, "id": id, "deleted": True}))
+            if lines:
+                self._log.write("\n".join(lines) + "\n")
+                if wait:
+                    self.flush()
+
+    def set_payloads(self, updates, wait=True):
+        """Merge payload keys into existing points: updates is {point_id: {key: value}}."""
+        with self._lock:
+            lines = []
+            for id, update in updates.items():
+                row = self._row_of.get(id)
+                if row is None:
+                    continue
+                payload = dict(self._payloads[row])
+                payload.update(update)
+                self._payloads[row] = payload
+                lines.append(json.dumps({"row": row, "id": id, "payload": payload}))
+            if lines:
+                self._log.write("\n".join(lines) + "\n")
+                if wait:
+                    self.flush()
+
+    def search(self, vector, top_k=5, filter=None, with_payload=True, text=None):
+        """text: the query text, for hybrid dense + BM25 retrieval."""
+        return self.search_batch([vector], top_k=top_k, filter=filter, with_payload=with_payload,
+                                 texts=None if text is None else [text])[0]
+
+    def search_batch(self, vectors, top_k=5, filter=None, with_payload=True, texts=None):
+        """
+        Score all query vectors with one matrix-matrix product; hit lists in
+        input order. With texts, each query's dense top (top_k *
+        HYBRID_PREFETCH_FACTOR) is fused with its BM25 top by RRF.
+        """
+        conditions = _filter_to_dict(filter)
+        queries = np.asarray(vectors, dtype=np.float32)
+        queries = queries.reshape(len(queries), -1)
+        if texts is None or self._sparse is None:
+            return self._dense_batch(queries, top_k, conditions, with_payload)
+        limit = top_k * max(1, HYBRID_PREFETCH_FACTOR)
+        with self._lock:
+            dense = self._dense_batch(queries, limit, conditions, with_payload)
+            results = []
+            for hits, text in zip(dense, texts):
+                indices, _ = encode_query(text)
+                if text is None or not indices or not len(self._sparse):
+                    results.append(hits[:top_k])
+                    continue
+                accept = (lambda row: _match(self._payloads[row], conditions)) if conditions else None
+                lexical = [{"id": self._ids[row], "score": score,
+                            "payload": self._payloads[row] if with_payload else None}
+                           for row, score in self._sparse.search(indices, limit, accept)]
+                results.append(rrf_fuse([hits, lexical], top_k))
+            return results
+
+    def _dense_batch(self, queries, top_k, conditions, with_payload):
+        with self._lock:
+            if self.dim is None or self.count == 0 or len(queries) == 0:
+                return [[] for _ in range(len(queries))]
+            count = self.count
+            if self.distance == "Cosine":
+                norms = np.linalg.norm(queries, axis=1, keepdims=True)
+                norms[norms == 0] = 1.0
+                queries = queries / norms
+            if not conditions and len(self._row_of) == count:
+                # every row is live: score the whole matrix without building a row list
+                rows = None
+                scores = self._vectors[:count] @ queries.T
+            else:
+                live = [r for r in range(count)
+                        if self._ids[r] is not None and (not conditions or _match(self._payloads[r], conditions))]
+                if not live:
+                    return [[] for _ in range(len(queries))]
+                rows = np.array(live, dtype=np.int64)
+                scores = self._vectors[rows] @ queries.T
+            k = min(top_k, scores.shape[0])
+            top = np.argpartition(-scores, k - 1, axis=0)[:k]
+            results = []
+            for col in range(scores.shape[1]):
+                cand = top[:, col]
+                cand = cand[np.argsort(-scores[cand, col])]
+                hits = []
+                for i in cand.tolist():
+                    row = int(rows[i]) if rows is not None else i
+                    hits.append({
+                        "id": self._ids[row],
+                        "score": float(scores[i, col]),
+                        "payload": self._payloads[row] if with_payload else None,
+                    })
+                results.append(hits)
+            return results
+
+    def flush(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+            if self._log is not None:
+                self._log.flush()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
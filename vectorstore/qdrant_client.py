@@ -1,40 +1,290 @@
 # vectorstore/qdrant_client.py
+"""
+The single Qdrant access layer (qdrant_client_wrapper.QdrantWrapper is an
+alias of this class).
+
+All wrappers in a process share one long-lived QdrantClient per connection
+config (url, api key, transport), leased from the model registry, so TCP/TLS
+setup and the HTTP keep-alive pool are paid for once rather than per request.
+
+Collections are created from a tuning profile (collection_profile(), built
+from the QDRANT_* settings): HNSW m / ef_construct, on-disk vectors and
+payload, int8 scalar or binary quantization, and keyword payload indexes.
+Searches use the profile's hnsw_ef and rescore quantized candidates with
+the original vectors. Whether a collection exists is checked once per
+process, not per file.
+
+With the profile's sparse flag (SPARSE_INDEX), new collections also get a
+named BM25 sparse vector (vectorstore/sparse.py) with Qdrant's IDF modifier;
+upserts that pass the chunk texts fill it, and search(..., text=...) runs the
+dense and sparse queries as prefetches of one request fused with RRF.
+"""
+import threading
+
+import httpx
 from qdrant_client import QdrantClient
 from qdrant_client.http import models as rest
-from config.settings import QDRANT_URL, QDRANT_COLLECTION, QDRANT_API_KEY
+import numpy as np
+from config.settings import (
+    QDRANT_URL, QDRANT_COLLECTION, QDRANT_API_KEY,
+    QDRANT_PREFER_GRPC, QDRANT_GRPC_PORT, QDRANT_TIMEOUT, QDRANT_POOL_SIZE,
+    QDRANT_HNSW_M, QDRANT_HNSW_EF_CONSTRUCT, QDRANT_SEARCH_EF, QDRANT_ON_DISK,
+    QDRANT_ON_DISK_PAYLOAD, QDRANT_QUANTIZATION, QDRANT_RESCORE, QDRANT_OVERSAMPLING,
+    QDRANT_PAYLOAD_INDEXES, SPARSE_INDEX, HYBRID_PREFETCH_FACTOR,
+)
+from model_registry import registry
+from .sparse import SPARSE_VECTOR, encode_document, encode_query
+
+# (url, collection) pairs known to exist, so create_collection() is a no-op after the first call
+_ready = set()
+_ready_lock = threading.Lock()
+_has_sparse = {}   # (url, collection) -> whether the collection has the BM25 sparse vector
+
+def collection_profile(**overrides):
+    """Collection tuning from settings; keyword arguments override single entries."""
+    profile = {
+        "hnsw_m": QDRANT_HNSW_M,
+        "hnsw_ef_construct": QDRANT_HNSW_EF_CONSTRUCT,
+        "search_ef": QDRANT_SEARCH_EF,
+        "on_disk": QDRANT_ON_DISK,
+        "on_disk_payload": QDRANT_ON_DISK_PAYLOAD,
+        "quantization": QDRANT_QUANTIZATION,
+        "rescore": QDRANT_RESCORE,
+        "oversampling": QDRANT_OVERSAMPLING,
+        "payload_indexes": list(QDRANT_PAYLOAD_INDEXES),
+        "sparse": SPARSE_INDEX,
+    }
+    unknown = set(overrides) - set(profile)
+    if unknown:
+        raise ValueError(f"Unknown collection profile keys: {sorted(unknown)}")
+    profile.update(overrides)
+    if profile["quantization"] not in ("none", "int8", "binary"):
+        raise ValueError(f"QDRANT_QUANTIZATION must be none, int8 or binary, got {profile['quantization']}")
+    return profile
+
+def _quantization_config(profile):
+    if profile["quantization"] == "int8":
+        return rest.ScalarQuantization(scalar=rest.ScalarQuantizationConfig(
+            type=rest.ScalarType.INT8, quantile=0.99, always_ram=True))
+    if profile["quantization"] == "binary":
+        return rest.BinaryQuantization(binary=rest.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+def build_client(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=QDRANT_PREFER_GRPC,
+                 grpc_port=QDRANT_GRPC_PORT, timeout=QDRANT_TIMEOUT, pool_size=QDRANT_POOL_SIZE):
+    # extra kwargs are passed through to the underlying httpx.Client for REST
+    return QdrantClient(
+        url=url,
+        api_key=api_key,
+        prefer_grpc=prefer_grpc,
+        grpc_port=grpc_port,
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+    )
+
+def shared_client(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=QDRANT_PREFER_GRPC,
+                  grpc_port=QDRANT_GRPC_PORT, timeout=QDRANT_TIMEOUT, pool_size=QDRANT_POOL_SIZE):
+    """Lease the process-wide client for this config; give it back with registry.release()."""
+    return registry.acquire(
+        ("qdrant_client", url, api_key, prefer_grpc, grpc_port, timeout, pool_size),
+        lambda: build_client(url, api_key, prefer_grpc, grpc_port, timeout, pool_size),
+        close=lambda c: c.close(),
+    )
 
 class QdrantWrapper:
-    def __init__(self, url=QDRANT_URL, api_key=QDRANT_API_KEY, collection=QDRANT_COLLECTION):
-        self.client = QdrantClient(url=url, api_key=api_key)
+    def __init__(self, url=QDRANT_URL, api_key=QDRANT_API_KEY, collection=QDRANT_COLLECTION,
+                 prefer_grpc=QDRANT_PREFER_GRPC, timeout=QDRANT_TIMEOUT, client=None, profile=None):
+        """
+        client: optional QdrantClient to use as-is; by default the shared
+        client for (url, api_key, prefer_grpc, timeout) is leased.
+        profile: collection tuning (see collection_profile()); defaults to settings.
+        """
+        self._owns_lease = client is None
+        self.client = client if client is not None else \
+            shared_client(url=url, api_key=api_key, prefer_grpc=prefer_grpc, timeout=timeout)
         self.collection = collection
+        self.profile = profile if profile is not None else collection_profile()
+        self._ready_key = (url if client is None else id(client), collection)
+        self.search_params = self._search_params()
+
+    def close(self):
+        """Return the shared client lease (the client itself stays warm in the registry)."""
+        if self._owns_lease and self.client is not None:
+            registry.release(self.client)
+            self.client = None
+
+    def _search_params(self):
+        p = self.profile
+        quantization = None
+        if p["quantization"] != "none":
+            quantization = rest.QuantizationSearchParams(rescore=p["rescore"],
+                                                         oversampling=p["oversampling"] if p["rescore"] else None)
+        if not p["search_ef"] and quantization is None:
+            return None
+        return rest.SearchParams(hnsw_ef=p["search_ef"] or None, quantization=quantization)
 
     def create_collection(self, vector_size, distance=rest.Distance.COSINE):
-        try:
-            self.client.get_collection(self.collection)
-        except Exception:
-            self.client.recreate_collection(
-                collection_name=self.collection,
-                vectors_config=rest.VectorParams(size=vector_size, distance=distance),
-            )
+        """Create the collection from the profile unless it exists; checked once per process."""
+        if self._ready_key in _ready:
+            return
+        with _ready_lock:
+            if self._ready_key in _ready:
+                return
+            if not self.client.collection_exists(self.collection):
+                p = self.profile
+                try:
+                    self.client.create_collection(
+                        collection_name=self.collection,
+                        vectors_config=rest.VectorParams(size=vector_size, distance=distance, on_disk=p["on_disk"]),
+                        hnsw_config=rest.HnswConfigDiff(m=p["hnsw_m"], ef_construct=p["hnsw_ef_construct"]),
+                        quantization_config=_quantization_config(p),
+                        on_disk_payload=p["on_disk_payload"],
+                        sparse_vectors_config={SPARSE_VECTOR: rest.SparseVectorParams(modifier=rest.Modifier.IDF)}
+                        if p["sparse"] else None,
+                    )
+                except Exception:
+                    # another process may have created it meanwhile
+                    if not self.client.collection_exists(self.collection):
+                        raise
+            self.ensure_payload_indexes()
+            _ready.add(self._ready_key)
+
+    def has_sparse(self):
+        """Whether the collection carries the BM25 sparse vector (looked up once per process)."""
+        has = _has_sparse.get(self._ready_key)
+        if has is None:
+            try:
+                info = self.client.get_collection(self.collection)
+            except Exception:
+                return False   # not created yet
+            has = _has_sparse[self._ready_key] = SPARSE_VECTOR in (info.config.params.sparse_vectors or {})
+        return has
 
-    def upsert(self, ids, vectors, payloads):
+    def ensure_payload_indexes(self):
+        """Keyword indexes on the profile's payload fields (source, abs_path), for filtered search and deletes."""
+        fields = self.profile["payload_indexes"]
+        if not fields:
+            return
+        existing = self.client.get_collection(self.collection).payload_schema or {}
+        for field in fields:
+            if field not in existing:
+                self.client.create_payload_index(collection_name=self.collection, field_name=field,
+                                                 field_schema=rest.PayloadSchemaType.KEYWORD)
+
+    def tune_collection(self):
+        """Apply the profile's HNSW, quantization and on-disk settings to an existing collection (Qdrant re-indexes in the background)."""
+        p = self.profile
+        quantization = _quantization_config(p) or rest.Disabled.DISABLED
+        self.client.update_collection(
+            collection_name=self.collection,
+            vectors_config={"": rest.VectorParamsDiff(on_disk=p["on_disk"])},
+            hnsw_config=rest.HnswConfigDiff(m=p["hnsw_m"], ef_construct=p["hnsw_ef_construct"]),
+            quantization_config=quantization,
+            collection_params=rest.CollectionParamsDiff(on_disk_payload=p["on_disk_payload"]),
+        )
+        self.ensure_payload_indexes()
+
+    def upsert(self, ids, vectors, payloads, wait=True, texts=None):
         """
         payloads: list of dicts (each may contain 'text', 'source', 'chunk_index', etc.)
+        vectors: 2-D float32 ndarray (preferred) or list[list[float]]
+        wait: block until Qdrant has applied the batch; False returns once it
+        is acknowledged (see vectorstore/bulk_writer.py)
+        texts: optional chunk texts, indexed as BM25 sparse vectors when the
+        collection has them
         """
+        if texts is not None and self.has_sparse():
+            named = []
+            for v, text in zip(vectors, texts):
+                indices, values = encode_document(text)
+                named.append({"": np.asarray(v, dtype=np.float32).tolist(),
+                              SPARSE_VECTOR: rest.SparseVector(indices=indices, values=values)})
+            self.client.upload_collection(
+                collection_name=self.collection,
+                vectors=named,
+                payload=payloads,
+                ids=ids,
+                batch_size=max(1, len(ids)),
+                wait=wait,
+            )
+            return
+        if isinstance(vectors, np.ndarray):
+            # columnar upload: qdrant-client batches the array itself, no PointStruct per row
+            self.client.upload_collection(
+                collection_name=self.collection,
+                vectors=vectors,
+                payload=payloads,
+                ids=ids,
+                batch_size=max(1, len(ids)),
+                wait=wait,
+            )
+            return
         points = []
         for i, v, p in zip(ids, vectors, payloads):
             points.append(rest.PointStruct(id=i, vector=v, payload=p))
-        self.client.upsert(collection_name=self.collection, points=points)
+        self.client.upsert(collection_name=self.collection, points=points, wait=wait)
 
-    def search(self, vector, top_k=5, filter=None, with_payload=True):
-        hits = self.client.search(
+    def delete(self, ids, wait=True):
+        if not ids:
+            return
+        self.client.delete(
             collection_name=self.collection,
-            query_vector=vector,
+            points_selector=rest.PointIdsList(points=list(ids)),
+            wait=wait,
+        )
+
+    def set_payloads(self, updates, wait=True):
+        """Merge payload keys into existing points: updates is {point_id: {key: value}}, one request."""
+        if not updates:
+            return
+        operations = [
+            rest.SetPayloadOperation(set_payload=rest.SetPayload(payload=payload, points=[pid]))
+            for pid, payload in updates.items()
+        ]
+        self.client.batch_update_points(collection_name=self.collection, update_operations=operations, wait=wait)
+
+    def _query(self, vector, text, top_k, filter):
+        """query_points arguments: plain dense search, or dense + BM25 prefetches fused with RRF when text is given."""
+        dense = np.asarray(vector, dtype=np.float32).tolist()
+        if text is None or not self.has_sparse():
+            return {"query": dense, "params": self.search_params}
+        indices, values = encode_query(text)
+        if not indices:
+            return {"query": dense, "params": self.search_params}
+        limit = top_k * max(1, HYBRID_PREFETCH_FACTOR)
+        return {
+            "prefetch": [
+                rest.Prefetch(query=dense, filter=filter, params=self.search_params, limit=limit),
+                rest.Prefetch(query=rest.SparseVector(indices=indices, values=values), using=SPARSE_VECTOR,
+                              filter=filter, limit=limit),
+            ],
+            "query": rest.FusionQuery(fusion=rest.Fusion.RRF),
+        }
+
+    def search(self, vector, top_k=5, filter=None, with_payload=True, text=None):
+        """text: the query text, for hybrid dense + BM25 retrieval (see _query)."""
+        q = self._query(vector, text, top_k, filter)
+        hits = self.client.query_points(
+            collection_name=self.collection,
+            query=q["query"],
+            prefetch=q.get("prefetch"),
             limit=top_k,
             query_filter=filter,
+            search_params=q.get("params"),
             with_payload=with_payload
-        )
+        ).points
         results = []
         for h in hits:
             results.append({"id": h.id, "score": h.score, "payload": h.payload})
         return results
+
+    def search_batch(self, vectors, top_k=5, filter=None, with_payload=True, texts=None):
+        """One request for many query vectors; returns a list of hit lists in input order."""
+        texts = texts if texts is not None else [None] * len(vectors)
+        requests = []
+        for v, text in zip(vectors, texts):
+            q = self._query(v, text, top_k, filter)
+            requests.append(rest.QueryRequest(query=q["query"], prefetch=q.get("prefetch"), limit=top_k,
+                                              filter=filter, params=q.get("params"), with_payload=with_payload))
+        batches = self.client.query_batch_points(collection_name=self.collection, requests=requests)
+        return [[{"id": h.id, "score": h.score, "payload": h.payload} for h in resp.points] for resp in batches]
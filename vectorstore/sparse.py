@@ -0,0 +1,111 @@
+# vectorstore/sparse.py
+"""
+BM25 sparse vectors for lexical retrieval, and reciprocal rank fusion (RRF)
+to combine them with dense results.
+
+Dense embeddings match part numbers, alarm codes and parameter names poorly;
+a lexical index catches them exactly. Terms are lower-cased alphanumeric
+runs; compound tokens such as "alm-1024", "g54.1" or "p_1234" are kept whole
+and also split into their parts. A term's index is its crc32, so documents
+and queries are encoded without a shared vocabulary.
+
+Document values are the BM25 term-frequency part, tf * (k1 + 1) /
+(tf + k1 * (1 - b + b * len / SPARSE_AVG_DOC_LEN)); the IDF part is applied
+at query time, by Qdrant's IDF modifier on the named sparse vector or by
+LocalSparseIndex from its own document frequencies.
+"""
+import heapq
+import math
+import re
+import zlib
+from collections import Counter
+
+from config.settings import HYBRID_RRF_K, SPARSE_AVG_DOC_LEN, SPARSE_BM25_B, SPARSE_BM25_K1
+
+SPARSE_VECTOR = "bm25"   # name of the sparse vector in Qdrant collections
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+(?:[-_./:#][0-9a-z]+)*")
+_PART_RE = re.compile(r"[-_./:#]")
+
+
+def terms(text):
+    out = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        out.append(tok)
+        if not tok.isalnum():
+            out.extend(p for p in _PART_RE.split(tok) if p)
+    return out
+
+
+def term_id(term):
+    return zlib.crc32(term.encode("utf-8"))
+
+
+def encode_document(text, k1=SPARSE_BM25_K1, b=SPARSE_BM25_B, avg_len=SPARSE_AVG_DOC_LEN):
+    """(indices, values) of a chunk's BM25 document vector, indices ascending."""
+    toks = terms(text or "")
+    if not toks:
+        return [], []
+    counts = Counter(term_id(t) for t in toks)
+    norm = k1 * (1 - b + b * len(toks) / avg_len)
+    indices = sorted(counts)
+    return indices, [counts[i] * (k1 + 1) / (counts[i] + norm) for i in indices]
+
+
+def encode_query(text):
+    """(indices, values) of a query: each distinct term once, weight 1."""
+    indices = sorted({term_id(t) for t in terms(text or "")})
+    return indices, [1.0] * len(indices)
+
+
+def rrf_fuse(result_lists, top_k, k=HYBRID_RRF_K):
+    """Fuse ranked hit lists by reciprocal rank: score = sum of 1 / (k + rank)."""
+    scores, hits = {}, {}
+    for results in result_lists:
+        for rank, h in enumerate(results, start=1):
+            scores[h["id"]] = scores.get(h["id"], 0.0) + 1.0 / (k + rank)
+            hits.setdefault(h["id"], h)
+    best = heapq.nlargest(top_k, scores, key=scores.get)
+    return [{**hits[i], "score": scores[i]} for i in best]
+
+
+class LocalSparseIndex:
+    """In-memory inverted index of BM25 document vectors, keyed by row (LocalVectorStore)."""
+
+    def __init__(self):
+        self._postings = {}   # term id -> {row: value}
+        self._terms = {}      # row -> term ids
+
+    def __len__(self):
+        return len(self._terms)
+
+    def add(self, row, indices, values):
+        self.remove(row)
+        if not indices:
+            return
+        self._terms[row] = list(indices)
+        for i, v in zip(indices, values):
+            self._postings.setdefault(i, {})[row] = v
+
+    def remove(self, row):
+        for i in self._terms.pop(row, ()):
+            posting = self._postings.get(i)
+            if posting is not None:
+                posting.pop(row, None)
+                if not posting:
+                    del self._postings[i]
+
+    def search(self, indices, top_k, accept=None):
+        """[(row, score)] best first; accept: optional predicate on rows (filters)."""
+        n = len(self._terms)
+        scores = {}
+        for i in indices:
+            posting = self._postings.get(i)
+            if not posting:
+                continue
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for row, v in posting.items():
+                scores[row] = scores.get(row, 0.0) + idf * v
+        if accept is not None:
+            scores = {row: s for row, s in scores.items() if accept(row)}
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])